@@ -1,9 +1,5 @@
-from app.core.database import SessionLocal
-from sqlalchemy.orm import Session
+from app.core.database import AsyncSessionLocal
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
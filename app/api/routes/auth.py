@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.crud.user import get_user_by_username, create_user
 from app.core.security import create_access_token
 from app.api.deps import get_db
@@ -9,15 +9,15 @@ from app.models.user import UserCreate
 router = APIRouter()
 
 @router.post("/register/", status_code=201)
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    if get_user_by_username(db, user.username):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    if await get_user_by_username(db, user.username):
         raise HTTPException(400, "Usuario ya existe")
-    create_user(db, user.username)
+    await create_user(db, user.username)
     return {"msg": "Usuario creado con éxito"}
 
 @router.post("/token/")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = get_user_by_username(db, form_data.username)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = await get_user_by_username(db, form_data.username)
     if not user:
         raise HTTPException(400, "Usuario no encontrado")
     token = create_access_token(data={"sub": user.username})
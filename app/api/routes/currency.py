@@ -1,6 +1,11 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from app.core.currency_client import currency_api_client
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from app.core.currency_client import currency_api_client, stream_rate_events
+from app.core.quotes import create_quote
+from app.core.security import get_current_identity
+from app.models.transfer import CURRENCY_PATTERN
+from app.models.user import User
 
 router = APIRouter()
 
@@ -12,6 +17,40 @@ async def list_rates(from_currency: str = "USD", to_currency: str = "PEN"):
     rates = await currency_api_client.list_all_rates(from_currency, to_currency)
     return rates
 
+@router.get("/stream/")
+async def stream_rates(from_currency: str = Query("USD", pattern=CURRENCY_PATTERN),
+                       to_currency: str = Query("PEN", pattern=CURRENCY_PATTERN)):
+    # Server-Sent Events: todos los clientes leen del mismo refresco periódico,
+    # así que la carga sobre los proveedores no crece con las conexiones
+    return StreamingResponse(
+        stream_rate_events(from_currency, to_currency),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/rates/table/")
+async def rates_table(base: str = "USD"):
+    return await currency_api_client.get_rates_table(base)
+
+class QuoteRequest(BaseModel):
+    from_currency: str = Field(..., pattern=CURRENCY_PATTERN)
+    to_currency: str = Field(..., pattern=CURRENCY_PATTERN)
+
+@router.post("/quote/")
+async def quote(req: QuoteRequest, current_user: User = Depends(get_current_identity)):
+    if req.from_currency == req.to_currency:
+        raise HTTPException(400, "Las monedas origen y destino deben ser diferentes")
+    rate = await currency_api_client.get_rate(req.from_currency, req.to_currency)
+    return create_quote(current_user.username, req.from_currency, req.to_currency, rate)
+
+@router.get("/cache/stats/")
+def cache_stats():
+    return currency_api_client.cache_stats()
+
+@router.get("/health/")
+def adapters_health():
+    return currency_api_client.health()
+
 @router.post("/select/")
 def select_adapter(selection: AdapterSelection):
     try:
@@ -0,0 +1,44 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import JSONResponse, Response
+from app.core.config import PROFILING_SECRET, PROFILING_SECRET_HEADER
+from app.core.profiling import profile_store, secret_matches, to_pstats, to_speedscope, top_functions
+
+def require_profiling_secret(secret: Optional[str] = Header(None, alias=PROFILING_SECRET_HEADER)):
+    # Los perfiles exponen rutas de código y tiempos internos: solo con el secreto
+    if not secret_matches(secret, PROFILING_SECRET):
+        raise HTTPException(403, "Acceso denegado")
+
+router = APIRouter(dependencies=[Depends(require_profiling_secret)])
+
+@router.get("/")
+def list_profiles():
+    return profile_store.list()
+
+def _get_profile(profile_id: int) -> dict:
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(404, "Perfil no encontrado (puede haber salido del buffer)")
+    return profile
+
+@router.get("/{profile_id}/")
+def profile_summary(profile_id: int, limit: int = Query(20, ge=1, le=200)):
+    profile = _get_profile(profile_id)
+    summary = {key: value for key, value in profile.items() if key != "stats"}
+    summary["top"] = top_functions(profile["stats"], limit)
+    return summary
+
+@router.get("/{profile_id}/download/")
+def download_profile(profile_id: int, format: str = Query("pstats", pattern="^(pstats|speedscope)$")):
+    profile = _get_profile(profile_id)
+    name = f"{profile['method']} {profile['path']} #{profile_id}"
+    if format == "speedscope":
+        return JSONResponse(
+            to_speedscope(profile["stats"], name),
+            headers={"Content-Disposition": f'attachment; filename="perfil_{profile_id}.speedscope.json"'},
+        )
+    return Response(
+        to_pstats(profile["stats"]),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="perfil_{profile_id}.pstats"'},
+    )
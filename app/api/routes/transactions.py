@@ -1,11 +1,51 @@
-from fastapi import APIRouter, Depends
+from datetime import datetime
+from typing import Optional
+from urllib.parse import quote
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from app.core.config import TRANSACTIONS_PAGE_SIZE, TRANSACTIONS_MAX_PAGE_SIZE
 from app.core.security import get_current_user
-from app.crud.transaction import get_transactions_by_user
-from sqlalchemy.orm import Session
-from app.api.deps import get_db
+from app.crud.transaction import get_transactions_by_user, iter_transactions, export_ndjson, export_csv
+from app.models.transaction import TransactionPage
 
 router = APIRouter()
 
-@router.get("/", response_model=list)
-async def get_transactions(current_user = Depends(get_current_user)):
-    return await get_transactions_by_user(current_user.username)
+@router.get("/", response_model=TransactionPage)
+async def get_transactions(
+    limit: int = Query(TRANSACTIONS_PAGE_SIZE, ge=1, le=TRANSACTIONS_MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user = Depends(get_current_user),
+):
+    try:
+        return await get_transactions_by_user(current_user.username, limit, before, after, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+EXPORT_FORMATS = {
+    "ndjson": (export_ndjson, "application/x-ndjson"),
+    "csv": (export_csv, "text/csv; charset=utf-8"),
+}
+
+@router.get("/export/")
+async def export_transactions(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user = Depends(get_current_user),
+):
+    serializer, media_type = EXPORT_FORMATS[format]
+    documents = iter_transactions(current_user.username, start, end)
+    return StreamingResponse(
+        serializer(documents),
+        media_type=media_type,
+        headers={"Content-Disposition": _attachment(f"historial_{current_user.username}.{format}",
+                                                    f"historial.{format}")},
+    )
+
+def _attachment(filename: str, fallback: str) -> str:
+    # Las cabeceras son latin-1 y el nombre de usuario puede tener cualquier
+    # carácter (o comillas): nombre ASCII fijo más filename* en UTF-8 (RFC 6266)
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
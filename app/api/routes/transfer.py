@@ -1,94 +1,131 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.core.security import get_current_user
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.security import get_current_user, invalidate_identity
 from app.api.deps import get_db
 from app.crud.user import get_user_by_username
-from app.crud.transaction import insert_transaction
+from app.crud.wallet import transfer_balance, convert_balance, debit_balance, credit_balance
+from app.crud.outbox import add_transaction_event
+from app.crud.idempotency import commit_with_response, run_idempotent
+from app.crud.transfer import batch_transfer
+from app.crud.quote import spend_quote
 from app.core.currency_client import currency_api_client
+from app.core.money import convert_amount
+from app.core.quotes import verify_quote
 from app.models.user import UserDB
-from app.models.transfer import TransferRequest, ConversionRequest, DepositWithdrawRequest
-import asyncio
+from app.models.transfer import TransferRequest, BatchTransferRequest, ConversionRequest, DepositWithdrawRequest
 
 router = APIRouter()
 
-@router.post("/transfer/")
-async def transfer(req: TransferRequest, current_user: UserDB = Depends(get_current_user), db: Session = Depends(get_db)):
-    receiver = get_user_by_username(db, req.receiver)
+async def _transfer(req: TransferRequest, current_user: UserDB, db: AsyncSession):
+    receiver = await get_user_by_username(db, req.receiver)
     if not receiver:
         raise HTTPException(404, "Usuario receptor no encontrado")
 
-    if req.currency == "PEN":
-        if current_user.balance_pen < req.amount:
-            raise HTTPException(400, "Saldo insuficiente en PEN")
-        current_user.balance_pen -= req.amount
-        receiver.balance_pen += req.amount
-    else:
-        if current_user.balance_usd < req.amount:
-            raise HTTPException(400, "Saldo insuficiente en USD")
-        current_user.balance_usd -= req.amount
-        receiver.balance_usd += req.amount
-
-    db.commit()
+    sender_name, receiver_name = current_user.username, receiver.username
+    if not await transfer_balance(db, current_user.id, receiver.id, req.currency, req.amount):
+        await db.rollback()
+        raise HTTPException(400, f"Saldo insuficiente en {req.currency}")
 
-    desc_sender = f"{current_user.username} transfirió {req.amount} {req.currency} a {receiver.username}"
-    desc_receiver = f"{receiver.username} recibió {req.amount} {req.currency} de {current_user.username}"
+    desc_sender = f"{sender_name} transfirió {req.amount} {req.currency} a {receiver_name}"
+    desc_receiver = f"{receiver_name} recibió {req.amount} {req.currency} de {sender_name}"
 
-    asyncio.create_task(insert_transaction(desc_sender, current_user.username))
-    asyncio.create_task(insert_transaction(desc_receiver, receiver.username))
+    # El historial se confirma junto con los saldos; el relay lo lleva a MongoDB
+    add_transaction_event(db, desc_sender, sender_name)
+    add_transaction_event(db, desc_receiver, receiver_name)
+    response = {"message": desc_sender}
+    await commit_with_response(db, response)
+    invalidate_identity(sender_name, receiver_name)
 
-    return {"message": desc_sender}
+    return response
 
-
-@router.post("/convert/")
-async def convert(req: ConversionRequest, current_user: UserDB = Depends(get_current_user), db: Session = Depends(get_db)):
+@router.post("/transfer/")
+async def transfer(req: TransferRequest, current_user: UserDB = Depends(get_current_user), db: AsyncSession = Depends(get_db),
+                   idempotency_key: Optional[str] = Header(None)):
+    return await run_idempotent(idempotency_key, current_user.id, "transfer", req,
+                                lambda: _transfer(req, current_user, db), db)
+
+async def _transfer_batch(req: BatchTransferRequest, current_user: UserDB, db: AsyncSession):
+    results, applied = await batch_transfer(db, current_user, req.items, req.atomic)
+    if not applied:
+        await db.rollback()
+        raise HTTPException(400, {"message": "Lote rechazado, no se aplicó ninguna transferencia", "results": results})
+
+    succeeded = sum(1 for result in results if result["status"] == "ok")
+    response = {
+        "message": f"{succeeded} de {len(results)} transferencias aplicadas",
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "results": results,
+    }
+    await commit_with_response(db, response)
+    invalidate_identity(current_user.username, *{item.receiver for item in req.items})
+
+    return response
+
+@router.post("/batch/")
+async def transfer_batch(req: BatchTransferRequest, current_user: UserDB = Depends(get_current_user), db: AsyncSession = Depends(get_db),
+                         idempotency_key: Optional[str] = Header(None)):
+    return await run_idempotent(idempotency_key, current_user.id, "transfer_batch", req,
+                                lambda: _transfer_batch(req, current_user, db), db)
+
+async def _convert(req: ConversionRequest, current_user: UserDB, db: AsyncSession):
     if req.from_currency == req.to_currency:
         raise HTTPException(400, "Las monedas origen y destino deben ser diferentes")
 
-    if req.from_currency == "PEN" and current_user.balance_pen < req.amount:
-        raise HTTPException(400, "Saldo insuficiente en PEN")
-    if req.from_currency == "USD" and current_user.balance_usd < req.amount:
-        raise HTTPException(400, "Saldo insuficiente en USD")
+    username = current_user.username
+    if req.quote_id is not None:
+        # Tasa fijada de antemano: la conversión no hace ninguna llamada de red
+        quote = verify_quote(req.quote_id, username, req.from_currency, req.to_currency)
+        if not await spend_quote(db, quote["jti"], datetime.utcfromtimestamp(quote["exp"])):
+            await db.rollback()
+            raise HTTPException(400, "Cotización ya utilizada")
+        tasa = quote["rate"]
+    else:
+        tasa = await currency_api_client.get_rate(req.from_currency, req.to_currency)
+    converted = convert_amount(req.amount, tasa)
 
-    tasa = await currency_api_client.get_rate(req.from_currency, req.to_currency)
+    if not await convert_balance(db, current_user.id, req.from_currency, req.to_currency, req.amount, converted):
+        await db.rollback()
+        raise HTTPException(400, f"Saldo insuficiente en {req.from_currency}")
 
-    if req.from_currency == "PEN" and req.to_currency == "USD":
-        converted = req.amount * tasa
-        current_user.balance_pen -= req.amount
-        current_user.balance_usd += converted
-        desc = f"{current_user.username} convirtió {req.amount:.2f} PEN a {converted:.2f} USD (tasa {tasa:.4f})"
-    else:
-        converted = req.amount * tasa
-        current_user.balance_usd -= req.amount
-        current_user.balance_pen += converted
-        desc = f"{current_user.username} convirtió {req.amount:.2f} USD a {converted:.2f} PEN (tasa {tasa:.4f})"
+    desc = (f"{username} convirtió {req.amount:.2f} {req.from_currency} a "
+            f"{converted:.2f} {req.to_currency} (tasa {tasa:.4f})")
 
-    db.commit()
+    add_transaction_event(db, desc, username)
+    response = {"message": desc}
+    await commit_with_response(db, response)
+    invalidate_identity(username)
 
-    await insert_transaction(desc, current_user.username)
+    return response
 
-    return {"message": desc}
+@router.post("/convert/")
+async def convert(req: ConversionRequest, current_user: UserDB = Depends(get_current_user), db: AsyncSession = Depends(get_db),
+                  idempotency_key: Optional[str] = Header(None)):
+    return await run_idempotent(idempotency_key, current_user.id, "convert", req,
+                                lambda: _convert(req, current_user, db), db)
 
-@router.post("/user/balance/change/")
-async def change_balance(req: DepositWithdrawRequest, current_user: UserDB = Depends(get_current_user), db: Session = Depends(get_db)):
+async def _change_balance(req: DepositWithdrawRequest, current_user: UserDB, db: AsyncSession):
+    username = current_user.username
     if req.operation == "deposit":
-        if req.currency == "USD":
-            current_user.balance_usd += req.amount
-        else:
-            current_user.balance_pen += req.amount
-        desc = f"{current_user.username} depositó {req.amount} {req.currency}"
+        await credit_balance(db, current_user.id, req.currency, req.amount)
+        desc = f"{username} depositó {req.amount} {req.currency}"
     else:
-        if req.currency == "USD":
-            if current_user.balance_usd < req.amount:
-                raise HTTPException(400, "Saldo insuficiente en USD para retiro")
-            current_user.balance_usd -= req.amount
-        else:
-            if current_user.balance_pen < req.amount:
-                raise HTTPException(400, "Saldo insuficiente en PEN para retiro")
-            current_user.balance_pen -= req.amount
-        desc = f"{current_user.username} retiró {req.amount} {req.currency}"
+        if not await debit_balance(db, current_user.id, req.currency, req.amount):
+            await db.rollback()
+            raise HTTPException(400, f"Saldo insuficiente en {req.currency} para retiro")
+        desc = f"{username} retiró {req.amount} {req.currency}"
 
-    db.commit()
+    add_transaction_event(db, desc, username)
+    response = {"message": desc}
+    await commit_with_response(db, response)
+    invalidate_identity(username)
 
-    asyncio.create_task(insert_transaction(desc, current_user.username))
+    return response
 
-    return {"message": desc}
+@router.post("/user/balance/change/")
+async def change_balance(req: DepositWithdrawRequest, current_user: UserDB = Depends(get_current_user), db: AsyncSession = Depends(get_db),
+                         idempotency_key: Optional[str] = Header(None)):
+    return await run_idempotent(idempotency_key, current_user.id, "change_balance", req,
+                                lambda: _change_balance(req, current_user, db), db)
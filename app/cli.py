@@ -0,0 +1,72 @@
+"""Tareas de base de datos que no deben correr al importar la app.
+
+    python -m app.cli create-tables   # crea las tablas que falten
+    python -m app.cli seed            # usuarios de prueba y cuentas calientes
+    python -m app.cli init-db         # las dos anteriores
+
+Se ejecuta una vez por despliegue (no en cada worker) y es idempotente.
+"""
+import argparse
+import asyncio
+import sys
+from decimal import Decimal
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from app.core.config import HOT_ACCOUNTS, HOT_ACCOUNT_SHARDS
+from app.core.database import Base, close_connections, get_async_engine
+from app.models.user import UserDB
+from app.models.wallet import WalletDB
+from app.models.outbox import OutboxEventDB  # noqa: F401  (registra la tabla para create_all)
+from app.models.idempotency import IdempotencyKeyDB  # noqa: F401
+from app.models.quote import SpentQuoteDB  # noqa: F401
+
+# Usuarios de prueba y el saldo de cada una de sus billeteras
+SEED_USERS = {
+    "X": {"PEN": Decimal("100.00"), "USD": Decimal("200.00")},
+    "Y": {"PEN": Decimal("50.00"), "USD": Decimal("100.00")},
+}
+
+async def create_tables(engine: AsyncEngine):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+async def seed(engine: AsyncEngine):
+    async with AsyncSession(engine, expire_on_commit=False) as db:
+        existing = set((await db.execute(
+            select(UserDB.username).where(UserDB.username.in_(SEED_USERS)))).scalars())
+        for username, balances in SEED_USERS.items():
+            if username in existing:
+                continue
+            user = UserDB(username=username)
+            db.add(user)
+            await db.flush()
+            db.add_all([WalletDB(user_id=user.id, currency=currency, balance=balance)
+                        for currency, balance in balances.items()])
+
+        # Cuentas calientes designadas en la configuración
+        if HOT_ACCOUNTS:
+            await db.execute(update(UserDB).where(UserDB.username.in_(HOT_ACCOUNTS))
+                             .values(balance_shards=HOT_ACCOUNT_SHARDS))
+        await db.commit()
+
+async def init_db(engine: AsyncEngine):
+    await create_tables(engine)
+    await seed(engine)
+
+COMMANDS = {"create-tables": create_tables, "seed": seed, "init-db": init_db}
+
+async def _run(command: str):
+    try:
+        await COMMANDS[command](get_async_engine())
+    finally:
+        await close_connections()
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Tareas de base de datos de coin-swap")
+    parser.add_argument("command", choices=list(COMMANDS))
+    args = parser.parse_args(argv)
+    asyncio.run(_run(args.command))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,64 +1,346 @@
+import asyncio
+import contextlib
+import json
+import time
+from collections import deque
 import httpx
 from fastapi import HTTPException
 from abc import ABC, abstractmethod
+from app.core.config import (
+    RATE_CACHE_TTL_SECONDS, RATE_CACHE_MAX_STALE_SECONDS,
+    HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS, HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    HTTP_TIMEOUT_SECONDS, HTTP_CONNECT_TIMEOUT_SECONDS, HTTP_HTTP2,
+    RATE_ADAPTER_TIMEOUT_SECONDS, RATE_HEDGE_ENABLED, RATE_HEDGE_PERCENTILE,
+    RATE_HEDGE_DEFAULT_DELAY_SECONDS, RATE_HEDGE_MIN_SAMPLES, RATE_LATENCY_WINDOW,
+    RATE_REFRESH_INTERVAL_SECONDS, RATE_HEALTH_WINDOW, RATE_BREAKER_FAILURE_THRESHOLD,
+    RATE_BREAKER_ERROR_RATE, RATE_BREAKER_RESET_SECONDS, RATE_STUB_URLS,
+    RATE_STREAM_KEEPALIVE_SECONDS, RATE_STREAM_MAX_SECONDS, RATE_STREAM_RETRY_MS,
+)
+from app.core.metrics import timed
+
+# Cliente HTTP compartido por todos los adaptadores (keep-alive + pool de conexiones).
+# Se crea en el arranque de la app y se cierra en el apagado (ver app.main.lifespan).
+_http_client: httpx.AsyncClient = None
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def build_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS),
+        http2=HTTP_HTTP2 and _http2_available(),
+    )
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = build_http_client()
+    return _http_client
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+# Moneda base de las tablas de tasas: cualquier par se deriva como tasa cruzada
+RATE_TABLE_BASE = "USD"
+
+def cross_rate(rates: dict, from_currency: str, to_currency: str) -> float:
+    try:
+        rate_from = rates[from_currency]
+        rate_to = rates[to_currency]
+    except KeyError as e:
+        raise HTTPException(400, f"Moneda {e.args[0]} no soportada")
+    return rate_to / rate_from
 
 class CurrencyAPIAdapter(ABC):
     @abstractmethod
-    async def get_rate(self, from_currency: str, to_currency: str) -> float:
+    async def get_rates(self) -> dict:
+        """Tabla completa de tasas con base RATE_TABLE_BASE, en una sola consulta."""
         pass
 
+    async def get_rate(self, from_currency: str, to_currency: str) -> float:
+        return cross_rate(await self.get_rates(), from_currency, to_currency)
+
     @abstractmethod
     def name(self) -> str:
         pass
 
 class ExchangeRateApiComAdapter(CurrencyAPIAdapter):
-    async def get_rate(self, from_currency: str, to_currency: str) -> float:
-        url = f"https://api.exchangerate-api.com/v4/latest/{from_currency}"
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            data = response.json()
-            rates = data.get("rates", {})
-            if to_currency not in rates:
-                raise HTTPException(400, f"Moneda {to_currency} no soportada")
-            return rates[to_currency]
+    async def get_rates(self) -> dict:
+        url = f"https://api.exchangerate-api.com/v4/latest/{RATE_TABLE_BASE}"
+        response = await get_http_client().get(url)
+        response.raise_for_status()
+        data = response.json()
+        return data.get("rates", {})
 
     def name(self) -> str:
         return "ExchangeRate-API.com (public)"
 
 class OpenERAPIAdapter(CurrencyAPIAdapter):
-    async def get_rate(self, from_currency: str, to_currency: str) -> float:
-        url = "https://open.er-api.com/v6/latest/USD"
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            data = response.json()
-            if data.get("result") != "success":
-                raise HTTPException(500, "No se pudo obtener tasa de cambio")
-            rates = data.get("rates", {})
-            try:
-                rate_from = rates[from_currency]
-                rate_to = rates[to_currency]
-            except KeyError:
-                raise HTTPException(400, "Moneda no soportada")
-            return rate_to / rate_from
+    base_url = "https://open.er-api.com"
+
+    async def get_rates(self) -> dict:
+        url = f"{self.base_url}/v6/latest/{RATE_TABLE_BASE}"
+        response = await get_http_client().get(url)
+        response.raise_for_status()
+        data = response.json()
+        if data.get("result") != "success":
+            raise HTTPException(500, "No se pudo obtener tasa de cambio")
+        return data.get("rates", {})
 
     def name(self) -> str:
         return "Open ER API (public)"
 
+class LocalStubRateAdapter(OpenERAPIAdapter):
+    """Stub HTTP local (mock_api.py) con el formato de Open ER API: recorre el
+    mismo camino que un proveedor real (cliente compartido, caché, breaker)
+    pero con la latencia y los errores que se le configuren."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+
+    def name(self) -> str:
+        return f"Stub local ({self.base_url})"
+
+class RateCache:
+    """Caché TTL de tasas con stale-while-revalidate.
+
+    Una entrada más antigua que ``ttl`` se sigue sirviendo (hasta ``max_stale``
+    segundos adicionales) mientras una única tarea la refresca en segundo plano.
+    Los fallos concurrentes de una misma clave comparten una sola consulta.
+    """
+
+    def __init__(self, ttl: float = RATE_CACHE_TTL_SECONDS, max_stale: float = RATE_CACHE_MAX_STALE_SECONDS):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._entries: dict = {}
+        self._inflight: dict = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    async def get(self, key, fetch):
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl:
+                self.hits += 1
+                return value
+            if age < self.ttl + self.max_stale:
+                self.stale_hits += 1
+                if key not in self._inflight:
+                    task = self._start_load(key, fetch)
+                    task.add_done_callback(self._on_refresh_done)
+                return value
+        self.misses += 1
+        # shield: si la petición que espera se cancela, la consulta compartida sigue
+        return await asyncio.shield(self._start_load(key, fetch))
+
+    async def refresh(self, key, fetch):
+        """Fuerza una recarga de la clave (compartiendo la que ya esté en curso)."""
+        try:
+            value = await asyncio.shield(self._start_load(key, fetch))
+        except Exception:
+            self.refresh_errors += 1
+            raise
+        self.refreshes += 1
+        return value
+
+    def _start_load(self, key, fetch) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, fetch))
+            # marca la excepción como leída aunque todos los que esperaban se hayan cancelado
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[key] = task
+        return task
+
+    async def _load(self, key, fetch):
+        try:
+            value = await fetch()
+            self._entries[key] = (value, time.monotonic())
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def _on_refresh_done(self, task: asyncio.Task):
+        if task.cancelled() or task.exception() is not None:
+            self.refresh_errors += 1
+        else:
+            self.refreshes += 1
+
+    def peek(self, key):
+        """Último valor cargado (sin contar como acierto ni disparar recargas)."""
+        entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "size": len(self._entries),
+            "ttl_seconds": self.ttl,
+            "max_stale_seconds": self.max_stale,
+        }
+
+class RateBroadcastHub:
+    """Reparte las tablas de tasas del refresco periódico a los streams abiertos.
+
+    Cada suscriptor tiene una cola de un solo elemento: un mensaje es la foto
+    completa de las tasas, así que a un cliente lento le basta la más reciente
+    y nunca acumula memoria. Solo se publica cuando alguna tasa cambió.
+    """
+
+    def __init__(self):
+        self._subscribers: set = set()
+        self.latest: dict = None
+        self.published = 0
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, snapshot: dict) -> bool:
+        if snapshot == self.latest:
+            return False
+        self.latest = snapshot
+        self.published += 1
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(snapshot)
+        return True
+
+    @contextlib.contextmanager
+    def subscribe(self):
+        """Cola con la última foto (si la hay) y cada cambio posterior."""
+        queue = asyncio.Queue(maxsize=1)
+        if self.latest is not None:
+            queue.put_nowait(self.latest)
+        self._subscribers.add(queue)
+        try:
+            yield queue
+        finally:
+            self._subscribers.discard(queue)
+
+class CircuitBreaker:
+    """closed -> open tras fallos repetidos -> half_open pasado ``reset_timeout``.
+
+    En half_open se deja pasar tráfico de prueba: un éxito lo cierra y un fallo
+    lo vuelve a abrir.
+    """
+
+    def __init__(self, failure_threshold: int = RATE_BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = RATE_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self._opened_at: float = None
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    @property
+    def available(self) -> bool:
+        return self.state != "open"
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self._opened_at = None
+
+    def record_failure(self, error_rate: float = 0.0):
+        self.consecutive_failures += 1
+        if (self.state == "half_open"
+                or self.consecutive_failures >= self.failure_threshold
+                or error_rate >= RATE_BREAKER_ERROR_RATE):
+            self._opened_at = time.monotonic()
+
+class AdapterHealth:
+    """Tasa de error y latencia recientes de un adaptador, con su circuit breaker."""
+
+    def __init__(self):
+        self.latencies = deque(maxlen=RATE_LATENCY_WINDOW)
+        self.outcomes = deque(maxlen=RATE_HEALTH_WINDOW)
+        self.breaker = CircuitBreaker()
+
+    @property
+    def error_rate(self) -> float:
+        if len(self.outcomes) < RATE_BREAKER_FAILURE_THRESHOLD:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    @property
+    def latency(self) -> float:
+        if not self.latencies:
+            return 0.0
+        return sorted(self.latencies)[len(self.latencies) // 2]
+
+    def record_success(self, latency: float):
+        self.latencies.append(latency)
+        self.outcomes.append(True)
+        self.breaker.record_success()
+
+    def record_failure(self):
+        self.outcomes.append(False)
+        self.breaker.record_failure(self.error_rate)
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.breaker.state,
+            "error_rate": round(self.error_rate, 4),
+            "latency_p50_seconds": round(self.latency, 4),
+            "samples": len(self.outcomes),
+        }
+
 class CurrencyAPIClientSingleton:
     _instance = None
     _adapters: dict = {}
     _current_adapter_key: str = None
+    _cache: RateCache = None
+    _health: dict = {}
+    _refresher: asyncio.Task = None
+    _hub: RateBroadcastHub = None
+    hedging_enabled: bool = RATE_HEDGE_ENABLED
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
-            cls._instance._adapters = {
-                "exchangerateapi": ExchangeRateApiComAdapter(),
-                "openerapublic": OpenERAPIAdapter(),
-            }
-            cls._instance._current_adapter_key = "exchangerateapi"
+            if RATE_STUB_URLS:
+                cls._instance._adapters = {key: LocalStubRateAdapter(url) for key, url in RATE_STUB_URLS.items()}
+            else:
+                cls._instance._adapters = {
+                    "exchangerateapi": ExchangeRateApiComAdapter(),
+                    "openerapublic": OpenERAPIAdapter(),
+                }
+            cls._instance._current_adapter_key = next(iter(cls._instance._adapters))
+            cls._instance._cache = RateCache()
+            cls._instance._hub = RateBroadcastHub()
+            cls._instance._health = {key: AdapterHealth() for key in cls._instance._adapters}
         return cls._instance
 
     def select_adapter(self, key: str):
@@ -69,18 +351,199 @@ class CurrencyAPIClientSingleton:
     def get_current_adapter_name(self) -> str:
         return self._adapters[self._current_adapter_key].name()
 
-    async def get_rate(self, from_currency: str, to_currency: str) -> float:
-        adapter = self._adapters[self._current_adapter_key]
-        return await adapter.get_rate(from_currency, to_currency)
+    def _health_for(self, key: str) -> AdapterHealth:
+        return self._health.setdefault(key, AdapterHealth())
+
+    def ranked_adapters(self) -> list:
+        """Adaptadores del más sano al menos sano; el seleccionado manualmente
+        tiene preferencia mientras su circuit breaker no esté abierto."""
+        def rank(key):
+            health = self._health_for(key)
+            return (not health.breaker.available, key != self._current_adapter_key,
+                    health.error_rate, health.latency)
+        return sorted(self._adapters, key=rank)
+
+    def get_active_adapter_key(self) -> str:
+        return self.ranked_adapters()[0]
+
+    @timed("rate_fetch")
+    async def get_rate(self, from_currency: str, to_currency: str, hedged: bool = None) -> float:
+        if hedged is None:
+            hedged = self.hedging_enabled
+        if hedged and len(self._adapters) > 1:
+            return await self._hedged_rate(from_currency, to_currency)
+        return await self._cached_rate(self.get_active_adapter_key(), from_currency, to_currency)
+
+    async def _cached_rate(self, key: str, from_currency: str, to_currency: str) -> float:
+        return cross_rate(await self._cached_table(key), from_currency, to_currency)
+
+    async def _cached_table(self, key: str) -> dict:
+        # Una entrada por adaptador: N pares cuestan una consulta por intervalo de refresco
+        return await self._cache.get((key, RATE_TABLE_BASE), lambda: self._timed_fetch(key))
+
+    async def _timed_fetch(self, key: str) -> dict:
+        health = self._health_for(key)
+        start = time.monotonic()
+        try:
+            rates = await self._adapters[key].get_rates()
+        except Exception:
+            health.record_failure()
+            raise
+        health.record_success(time.monotonic() - start)
+        return rates
+
+    async def get_rates_table(self, base: str = RATE_TABLE_BASE) -> dict:
+        """Todas las tasas del adaptador activo expresadas respecto a ``base``."""
+        rates = await self._cached_table(self.get_active_adapter_key())
+        if base not in rates:
+            raise HTTPException(400, f"Moneda {base} no soportada")
+        rate_base = rates[base]
+        return {currency: rate / rate_base for currency, rate in rates.items()}
+
+    def hedge_delay(self, key: str) -> float:
+        """Percentil de latencia reciente del adaptador; se usa como espera antes del hedge."""
+        samples = self._health_for(key).latencies
+        if not samples or len(samples) < RATE_HEDGE_MIN_SAMPLES:
+            return RATE_HEDGE_DEFAULT_DELAY_SECONDS
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * RATE_HEDGE_PERCENTILE / 100))
+        return ordered[index]
+
+    async def _hedged_rate(self, from_currency: str, to_currency: str) -> float:
+        # Primero el adaptador activo; si no responde dentro de su percentil de
+        # latencia (o falla), se lanza un segundo adaptador y gana la primera
+        # respuesta válida.
+        candidates = self.ranked_adapters()[:2]
+        primary = candidates[0]
+        pending = {asyncio.ensure_future(self._cached_rate(candidates.pop(0), from_currency, to_currency))}
+        errors = []
+        try:
+            while pending:
+                timeout = self.hedge_delay(primary) if candidates else None
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append(task.exception())
+                if candidates and (not done or not pending):
+                    pending.add(asyncio.ensure_future(
+                        self._cached_rate(candidates.pop(0), from_currency, to_currency)
+                    ))
+        finally:
+            for task in pending:
+                task.cancel()
+        raise errors[-1]
+
+    def cache_stats(self) -> dict:
+        return self._cache.stats()
+
+    def health(self) -> dict:
+        return {
+            "active": self.get_active_adapter_key(),
+            "selected": self._current_adapter_key,
+            "adapters": {key: self._health_for(key).snapshot() for key in self._adapters},
+        }
+
+    async def refresh_all(self):
+        """Refresca la tabla de cada adaptador cuyo circuit breaker lo permita
+        y publica el resultado a los streams (/currency/stream/) si cambió."""
+        await asyncio.gather(*(self._refresh_adapter(key) for key in list(self._adapters)))
+        self._hub.publish(self.rates_snapshot())
+
+    def rates_snapshot(self) -> dict:
+        """{nombre del proveedor: tabla base RATE_TABLE_BASE} de lo que hay en caché."""
+        snapshot = {}
+        for key, adapter in self._adapters.items():
+            rates = self._cache.peek((key, RATE_TABLE_BASE))
+            if rates is not None:
+                snapshot[adapter.name()] = rates
+        return snapshot
+
+    def subscribe(self):
+        return self._hub.subscribe()
+
+    def stream_subscribers(self) -> int:
+        return self._hub.subscribers
+
+    async def _refresh_adapter(self, key: str):
+        if not self._health_for(key).breaker.available:
+            return
+        # los fallos ya quedan registrados en AdapterHealth por _timed_fetch
+        with contextlib.suppress(Exception):
+            await self._cache.refresh((key, RATE_TABLE_BASE), lambda: self._timed_fetch(key))
+
+    async def _refresh_loop(self, interval: float, initial_delay: float = 0):
+        # initial_delay: el lifespan ya calentó la caché antes de aceptar tráfico
+        await asyncio.sleep(initial_delay)
+        while True:
+            await self.refresh_all()
+            await asyncio.sleep(interval)
+
+    def start_refresher(self, interval: float = RATE_REFRESH_INTERVAL_SECONDS, initial_delay: float = 0):
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._refresh_loop(interval, initial_delay))
+
+    async def stop_refresher(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._refresher
+            self._refresher = None
+
+    def clear_cache(self):
+        self._cache.clear()
 
     async def list_all_rates(self, from_currency: str, to_currency: str) -> dict:
+        # Todos los proveedores en paralelo con un plazo común: los que no
+        # respondan a tiempo se reportan como error sin bloquear al resto.
+        tasks = {
+            key: asyncio.ensure_future(self._cached_rate(key, from_currency, to_currency))
+            for key in self._adapters
+        }
+        _, pending = await asyncio.wait(tasks.values(), timeout=RATE_ADAPTER_TIMEOUT_SECONDS)
         rates = {}
-        for adapter in self._adapters.values():
-            try:
-                rate = await adapter.get_rate(from_currency, to_currency)
-                rates[adapter.name()] = rate
-            except Exception as e:
-                rates[adapter.name()] = f"Error: {str(e)}"
+        for key, task in tasks.items():
+            name = self._adapters[key].name()
+            if task in pending:
+                task.cancel()
+                rates[name] = "Error: tiempo de espera agotado"
+            elif task.exception() is not None:
+                rates[name] = f"Error: {str(task.exception())}"
+            else:
+                rates[name] = task.result()
         return rates
 
 currency_api_client = CurrencyAPIClientSingleton()
+
+def pair_rates(snapshot: dict, from_currency: str, to_currency: str) -> dict:
+    """Tasa del par por proveedor (mismo formato que /currency/rates/), omitiendo
+    los proveedores cuya tabla no incluye alguna de las monedas."""
+    rates = {}
+    for name, table in snapshot.items():
+        with contextlib.suppress(HTTPException):
+            rates[name] = cross_rate(table, from_currency, to_currency)
+    return rates
+
+async def stream_rate_events(from_currency: str, to_currency: str,
+                             keepalive: float = RATE_STREAM_KEEPALIVE_SECONDS,
+                             max_seconds: float = RATE_STREAM_MAX_SECONDS):
+    """Eventos SSE con las tasas del par: el estado actual al conectar y luego
+    solo cuando la tasa de algún proveedor cambia. No consulta a los
+    proveedores: lee lo que publica el refresco periódico."""
+    deadline = time.monotonic() + max_seconds
+    last = None
+    yield f"retry: {RATE_STREAM_RETRY_MS}\n\n"
+    with currency_api_client.subscribe() as queue:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                snapshot = await asyncio.wait_for(queue.get(), timeout=min(keepalive, remaining))
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            rates = pair_rates(snapshot, from_currency, to_currency)
+            if rates != last:
+                last = rates
+                yield f"event: rates\ndata: {json.dumps(rates)}\n\n"
@@ -1,16 +1,110 @@
-from sqlalchemy import create_engine
+import asyncio
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 import motor.motor_asyncio
-from app.core.config import DATABASE_URL, MONGODB_URI, MONGODB_DB_NAME
+from app.core.config import (
+    ASYNC_DATABASE_URL, MONGODB_URI, MONGODB_DB_NAME,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT_SECONDS, DB_POOL_RECYCLE_SECONDS, DB_POOL_PRE_PING,
+    FAKE_DB_LATENCY, FAKE_MONGO_LATENCY, settings,
+)
+from app.core.fakes import LatencyInjector, LatencyInjectingCollection, latency_session_class
+from app.core.metrics import OPERATION_LATENCY
 
-# PostgreSQL engine y sesión
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+# Ningún engine ni cliente se crea al importar: se construyen en el primer uso
+# (normalmente en el lifespan de app.main) y se cierran con close_connections().
+# Crear tablas y datos iniciales es un comando aparte: python -m app.cli init-db
 
 Base = declarative_base()
 
-# Cliente MongoDB asíncrono
-mongo_client = motor.motor_asyncio.AsyncIOMotorClient(MONGODB_URI)
-mongo_db = mongo_client[MONGODB_DB_NAME]
-transactions_collection = mongo_db["transactions"]
+class TimedAsyncSession(AsyncSession):
+    """AsyncSession que registra la duración de cada commit en /metrics."""
+
+    async def commit(self):
+        with OPERATION_LATENCY.time("db_commit"):
+            await super().commit()
+
+# INSERT con ON CONFLICT (upserts) de cada dialecto soportado
+_INSERT_BY_DIALECT = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+def dialect_insert(session: AsyncSession, table):
+    """``insert(table)`` del dialecto de la sesión, con ``on_conflict_do_*``."""
+    return _INSERT_BY_DIALECT[session.get_bind().dialect.name](table)
+
+_async_engine: AsyncEngine = None
+_sessionmaker: async_sessionmaker = None
+_mongo_client = None
+_transactions_collection = None
+
+def get_async_engine() -> AsyncEngine:
+    """Engine asíncrono (asyncpg) usado por las peticiones, con el pool de la configuración."""
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_async_engine(
+            ASYNC_DATABASE_URL,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+            pool_recycle=DB_POOL_RECYCLE_SECONDS,
+            pool_pre_ping=DB_POOL_PRE_PING,
+        )
+    return _async_engine
+
+def current_pool():
+    """Pool del engine si ya se creó; None si no. No construye el engine (lo usan los gauges)."""
+    return _async_engine.pool if _async_engine is not None else None
+
+def get_sessionmaker() -> async_sessionmaker:
+    global _sessionmaker
+    if _sessionmaker is None:
+        session_class = TimedAsyncSession
+        if FAKE_DB_LATENCY:
+            # Solo para reproducir incidentes: cada execute/commit espera según el perfil
+            session_class = latency_session_class(TimedAsyncSession, LatencyInjector.from_config(FAKE_DB_LATENCY))
+        # expire_on_commit=False: tras el commit no se recargan atributos de forma implícita
+        _sessionmaker = async_sessionmaker(bind=get_async_engine(), class_=session_class,
+                                           autoflush=False, expire_on_commit=False)
+    return _sessionmaker
+
+def AsyncSessionLocal() -> AsyncSession:
+    """Nueva sesión asíncrona; se usa igual que un ``async_sessionmaker``."""
+    return get_sessionmaker()()
+
+def get_mongo_client():
+    global _mongo_client
+    if _mongo_client is None:
+        # Pool y write concern del perfil activo (ver Settings en app/core/config.py)
+        _mongo_client = motor.motor_asyncio.AsyncIOMotorClient(MONGODB_URI, **settings.mongo_client_options())
+    return _mongo_client
+
+def get_transactions_collection():
+    global _transactions_collection
+    if _transactions_collection is None:
+        collection = get_mongo_client()[MONGODB_DB_NAME]["transactions"]
+        if FAKE_MONGO_LATENCY:
+            collection = LatencyInjectingCollection(collection, LatencyInjector.from_config(FAKE_MONGO_LATENCY))
+        _transactions_collection = collection
+    return _transactions_collection
+
+async def warm_up_database(connections: int, engine: AsyncEngine = None):
+    """Abre ``connections`` conexiones del pool a la vez (SELECT 1) y las devuelve
+    al pool, para que las primeras peticiones no paguen el handshake."""
+    engine = engine or get_async_engine()
+
+    async def touch():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(touch() for _ in range(connections)))
+
+async def ping_mongo():
+    await get_mongo_client().admin.command("ping")
+
+async def close_connections():
+    global _async_engine, _sessionmaker, _mongo_client, _transactions_collection
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    if _mongo_client is not None:
+        _mongo_client.close()
+    _async_engine = _sessionmaker = _mongo_client = _transactions_collection = None
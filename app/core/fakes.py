@@ -0,0 +1,162 @@
+import asyncio
+import math
+import random
+from typing import Optional, Tuple
+from pymongo.errors import AutoReconnect, NetworkTimeout
+from sqlalchemy.exc import OperationalError, TimeoutError as SQLTimeoutError
+
+# Fakes con latencia inyectada para reproducir sin red incidentes de
+# proveedor lento, BD lenta o MongoDB lento. No reemplazan a las capas reales:
+# las envuelven, así la caché, los pools y los reintentos del código de
+# producción siguen en el camino. Se activan con las variables
+# COIN_SWAP_RATE_STUB_URLS, COIN_SWAP_FAKE_DB_LATENCY y COIN_SWAP_FAKE_MONGO_LATENCY.
+
+OK, ERROR, TIMEOUT = "ok", "error", "timeout"
+
+class LatencyInjector:
+    """Sortea la latencia y el resultado (ok / error / timeout) de cada llamada.
+
+    Distribuciones de ``mean`` (segundos):
+      - ``fixed``: siempre ``mean``.
+      - ``uniform``: entre ``mean - jitter`` y ``mean + jitter``.
+      - ``exponential``: media ``mean`` (cola larga, típica de colas saturadas).
+      - ``lognormal``: mediana ``mean`` y desviación ``jitter`` del logaritmo.
+    Un timeout espera ``timeout_seconds`` antes de fallar, para que salten los
+    plazos del cliente igual que con un servicio colgado.
+    """
+
+    DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+    def __init__(self, distribution: str = "fixed", mean: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, timeout_rate: float = 0.0, timeout_seconds: float = 30.0,
+                 seed: Optional[int] = None):
+        if distribution not in self.DISTRIBUTIONS:
+            raise ValueError(f"Distribución '{distribution}' no soportada")
+        if error_rate + timeout_rate > 1:
+            raise ValueError("error_rate + timeout_rate no puede superar 1")
+        self.distribution = distribution
+        self.mean = mean
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_seconds = timeout_seconds
+        self._random = random.Random(seed)
+
+    @classmethod
+    def from_config(cls, config: Optional[dict]) -> Optional["LatencyInjector"]:
+        return cls(**config) if config else None
+
+    def sample(self) -> float:
+        if self.distribution == "uniform":
+            delay = self._random.uniform(self.mean - self.jitter, self.mean + self.jitter)
+        elif self.distribution == "exponential":
+            delay = self._random.expovariate(1 / self.mean) if self.mean > 0 else 0.0
+        elif self.distribution == "lognormal":
+            delay = self._random.lognormvariate(math.log(self.mean), self.jitter) if self.mean > 0 else 0.0
+        else:
+            delay = self.mean
+        return max(delay, 0.0)
+
+    def plan(self) -> Tuple[str, float]:
+        """(resultado, segundos de espera) de la próxima llamada."""
+        roll = self._random.random()
+        if roll < self.timeout_rate:
+            return TIMEOUT, self.timeout_seconds
+        if roll < self.timeout_rate + self.error_rate:
+            return ERROR, self.sample()
+        return OK, self.sample()
+
+    def describe(self) -> dict:
+        return {
+            "distribution": self.distribution, "mean": self.mean, "jitter": self.jitter,
+            "error_rate": self.error_rate, "timeout_rate": self.timeout_rate,
+            "timeout_seconds": self.timeout_seconds,
+        }
+
+def latency_session_class(base, injector: LatencyInjector):
+    """Subclase de ``base`` (una AsyncSession) que demora ``execute`` y ``commit``.
+
+    Los errores se levantan como los de un Postgres real: ``OperationalError``
+    (conexión caída) o ``sqlalchemy.exc.TimeoutError`` (sin conexión a tiempo).
+    """
+
+    async def _inject(statement: str):
+        outcome, delay = injector.plan()
+        await asyncio.sleep(delay)
+        if outcome == TIMEOUT:
+            raise SQLTimeoutError(f"Latencia inyectada: timeout en {statement}")
+        if outcome == ERROR:
+            raise OperationalError(statement, None, ConnectionError("Latencia inyectada: error de BD"))
+
+    class LatencyInjectingSession(base):
+        async def execute(self, statement, *args, **kwargs):
+            await _inject("execute")
+            return await super().execute(statement, *args, **kwargs)
+
+        async def commit(self):
+            await _inject("commit")
+            await super().commit()
+
+    return LatencyInjectingSession
+
+async def _inject_mongo(injector: LatencyInjector, operation: str):
+    outcome, delay = injector.plan()
+    await asyncio.sleep(delay)
+    if outcome == TIMEOUT:
+        raise NetworkTimeout(f"Latencia inyectada: timeout en {operation}")
+    if outcome == ERROR:
+        # AutoReconnect es un PyMongoError: el escritor del historial lo reintenta
+        raise AutoReconnect(f"Latencia inyectada: error en {operation}")
+
+class _LatencyCursor:
+    """Cursor de Motor que espera una vez antes del primer documento."""
+
+    def __init__(self, cursor, injector: LatencyInjector):
+        self._cursor = cursor
+        self._injector = injector
+
+    def sort(self, *args, **kwargs):
+        self._cursor = self._cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, *args, **kwargs):
+        self._cursor = self._cursor.limit(*args, **kwargs)
+        return self
+
+    def batch_size(self, *args, **kwargs):
+        self._cursor = self._cursor.batch_size(*args, **kwargs)
+        return self
+
+    async def to_list(self, *args, **kwargs):
+        await _inject_mongo(self._injector, "find")
+        return await self._cursor.to_list(*args, **kwargs)
+
+    async def __aiter__(self):
+        await _inject_mongo(self._injector, "find")
+        async for document in self._cursor:
+            yield document
+
+class LatencyInjectingCollection:
+    """Envuelve una colección de Motor e inyecta latencia en sus operaciones de red."""
+
+    ASYNC_METHODS = frozenset({
+        "bulk_write", "insert_one", "insert_many", "update_one", "update_many", "delete_one",
+        "delete_many", "find_one", "count_documents", "create_index", "create_indexes",
+    })
+
+    def __init__(self, collection, injector: LatencyInjector):
+        self._collection = collection
+        self._injector = injector
+
+    def find(self, *args, **kwargs):
+        return _LatencyCursor(self._collection.find(*args, **kwargs), self._injector)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        if name not in self.ASYNC_METHODS:
+            return attribute
+
+        async def delayed(*args, **kwargs):
+            await _inject_mongo(self._injector, name)
+            return await attribute(*args, **kwargs)
+        return delayed
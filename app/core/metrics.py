@@ -0,0 +1,156 @@
+import functools
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Tuple
+from app.core.config import METRICS_LATENCY_BUCKETS, METRICS_EXCLUDED_ROUTES
+
+# Métricas en memoria del proceso con salida en formato de texto de
+# Prometheus. Registrar una observación es un bisect y dos sumas, sin locks
+# ni asignaciones por petición, para poder dejarlas activas en producción.
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Histogram:
+    """Histograma acumulado por combinación de etiquetas."""
+
+    def __init__(self, name: str, description: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = METRICS_LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # etiquetas -> [conteos por bucket (+Inf al final), suma, total]
+        self._series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def snapshot(self) -> dict:
+        return {labels: {"count": series[2], "sum": series[1]} for labels, series in self._series.items()}
+
+    def clear(self):
+        self._series.clear()
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            inf = _format_labels(self.labelnames, labels, 'le="+Inf"')
+            plain = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_bucket{inf} {count}")
+            lines.append(f"{self.name}_sum{plain} {total}")
+            lines.append(f"{self.name}_count{plain} {count}")
+        return lines
+
+class Gauge:
+    """Valor leído en el momento del scrape; no cuesta nada entre scrapes.
+    ``read`` devuelve None cuando aún no hay dato (se publica NaN)."""
+
+    def __init__(self, name: str, description: str, read: Callable[[], float]):
+        self.name = name
+        self.description = description
+        self.read = read
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} gauge"]
+        try:
+            value = self.read()
+            lines.append(f"{self.name} {'NaN' if value is None else float(value)}")
+        except Exception:
+            # Un gauge que falla (p. ej. pool aún sin crear) no rompe el resto del scrape
+            lines.append(f"{self.name} NaN")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def histogram(self, name: str, description: str, labelnames: Tuple[str, ...] = ()) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, description, labelnames))
+
+    def gauge(self, name: str, description: str, read: Callable[[], float]) -> Gauge:
+        gauge = Gauge(name, description, read)
+        self._metrics[name] = gauge
+        return gauge
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+REQUEST_LATENCY = registry.histogram(
+    "http_request_duration_seconds", "Latencia de las peticiones HTTP por ruta", ("method", "route", "status"))
+OPERATION_LATENCY = registry.histogram(
+    "operation_duration_seconds", "Latencia de operaciones internas (JWT, BD, tasas, MongoDB)", ("operation",))
+
+def timed(operation: str):
+    """Decorador que registra la duración de una corrutina en OPERATION_LATENCY."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                OPERATION_LATENCY.observe(time.perf_counter() - started, operation)
+        return wrapper
+    return decorator
+
+class MetricsMiddleware:
+    """Middleware ASGI puro (sin BaseHTTPMiddleware) que mide cada petición HTTP.
+
+    La etiqueta ``route`` es la plantilla de la ruta (``/transfer/convert/``),
+    no la URL, para que la cardinalidad no crezca con los parámetros. Las rutas
+    de ``excluded_routes`` (conexiones largas como SSE) no se registran: su
+    duración es la de la conexión y deformaría el histograma.
+    """
+
+    def __init__(self, app, excluded_routes: Tuple[str, ...] = METRICS_EXCLUDED_ROUTES):
+        self.app = app
+        self.excluded_routes = frozenset(excluded_routes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "sin_ruta"
+            if path not in self.excluded_routes:
+                REQUEST_LATENCY.observe(time.perf_counter() - started, scope["method"], path, status)
@@ -0,0 +1,49 @@
+"""Aritmética de dinero en punto fijo.
+
+Los importes son ``Decimal`` con 2 decimales (centavos/céntimos). Por dentro se
+opera en unidades menores enteras: una conversión fija la tasa a
+``RATE_DECIMALS`` decimales y redondea half-even con enteros exactos, sin
+pasar por float. Las rutas masivas (``batch_transfer``) pasan todos los
+importes a un vector int64 de una vez con ``to_minor_units``.
+"""
+from decimal import Decimal, ROUND_HALF_EVEN
+from typing import Sequence
+import numpy as np
+
+MONEY_PRECISION = 18
+MONEY_SCALE = 2
+RATE_DECIMALS = 8
+
+_QUANTUM = Decimal(1).scaleb(-MONEY_SCALE)
+_RATE_SCALE = 10 ** RATE_DECIMALS
+
+def to_decimal(value) -> Decimal:
+    # str() evita arrastrar el error binario de un float (0.1 -> 0.1, no 0.1000000000000000055...)
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+def quantize(amount) -> Decimal:
+    return to_decimal(amount).quantize(_QUANTUM, rounding=ROUND_HALF_EVEN)
+
+def rate_to_int(rate) -> int:
+    return int((to_decimal(rate) * _RATE_SCALE).to_integral_value(rounding=ROUND_HALF_EVEN))
+
+def to_minor_unit(amount) -> int:
+    return int(to_decimal(amount).scaleb(MONEY_SCALE).to_integral_value(rounding=ROUND_HALF_EVEN))
+
+def from_minor_unit(value: int) -> Decimal:
+    return Decimal(int(value)).scaleb(-MONEY_SCALE)
+
+def to_minor_units(amounts: Sequence) -> np.ndarray:
+    return np.fromiter(map(to_minor_unit, amounts), dtype=np.int64, count=len(amounts))
+
+def _divide_half_even(numerator: int, denominator: int) -> int:
+    quotient, remainder = divmod(numerator, denominator)
+    twice = remainder * 2
+    return quotient + (twice > denominator or (twice == denominator and quotient % 2 == 1))
+
+def convert_amount(amount, rate) -> Decimal:
+    # Enteros de Python: exacto para cualquier importe, sin desbordar ni pasar por NumPy
+    return from_minor_unit(_divide_half_even(to_minor_unit(amount) * rate_to_int(rate), _RATE_SCALE))
+
+def total(amounts: Sequence) -> Decimal:
+    return from_minor_unit(to_minor_units(amounts).sum(dtype=object))
@@ -0,0 +1,199 @@
+import cProfile
+import hmac
+import itertools
+import marshal
+import pstats
+import random
+import time
+from collections import OrderedDict
+from typing import Optional, Union
+from app.core.config import (
+    PROFILING_HEADER, PROFILING_SECRET, PROFILING_SAMPLE_RATE, PROFILING_BUFFER_SIZE,
+    PROFILING_SPEEDSCOPE_MAX_DEPTH,
+)
+
+# Perfilado bajo demanda de una petición (cProfile). Solo actúa con
+# PROFILING_ENABLED; se dispara con la cabecera PROFILING_HEADER (su valor debe
+# ser PROFILING_SECRET) o al azar con PROFILING_SAMPLE_RATE. Los perfiles quedan en un buffer circular en memoria
+# y se descargan como pstats o como JSON de speedscope (ver /debug/profiles/).
+
+class ProfileStore:
+    """Buffer circular con los últimos perfiles capturados."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._profiles: OrderedDict = OrderedDict()
+        self._ids = itertools.count(1)
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def add(self, profile_id: int, method: str, path: str, status: int, duration: float, stats: dict):
+        self._profiles[profile_id] = {
+            "id": profile_id,
+            "method": method,
+            "path": path,
+            "status": status,
+            "duration_ms": round(duration * 1000, 3),
+            "created_at": time.time(),
+            "stats": stats,
+        }
+        while len(self._profiles) > self.maxsize:
+            self._profiles.popitem(last=False)
+
+    def get(self, profile_id: int):
+        return self._profiles.get(profile_id)
+
+    def list(self) -> list:
+        return [{key: value for key, value in profile.items() if key != "stats"}
+                for profile in reversed(self._profiles.values())]
+
+    def clear(self):
+        self._profiles.clear()
+
+profile_store = ProfileStore(PROFILING_BUFFER_SIZE)
+
+def secret_matches(value: Optional[Union[str, bytes]], secret: Optional[str]) -> bool:
+    """Compara en tiempo constante; sin secreto configurado nunca coincide."""
+    if not secret or value is None:
+        return False
+    if isinstance(value, str):
+        value = value.encode()
+    return hmac.compare_digest(value, secret.encode())
+
+# Ramas del árbol de speedscope con menos tiempo que esto se descartan: acota
+# el tamaño cuando muchas rutas de llamada llegan a la misma función
+_MIN_SHARE_SECONDS = 1e-6
+
+def to_pstats(stats: dict) -> bytes:
+    """Mismo formato que ``cProfile.Profile.dump_stats`` (legible con ``pstats.Stats``)."""
+    return marshal.dumps(stats)
+
+def _frame_name(func) -> str:
+    filename, line, name = func
+    return name if filename == "~" else f"{name} ({filename}:{line})"
+
+def to_speedscope(stats: dict, name: str) -> dict:
+    """Convierte estadísticas de cProfile a un perfil "sampled" de speedscope.
+
+    cProfile no guarda pilas completas, solo aristas llamador -> llamado; el
+    árbol se reconstruye repartiendo el tiempo de cada función entre sus
+    llamados en proporción al tiempo de cada arista (aproximación tipo gprof).
+    """
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+    roots = [func for func, entry in stats.items() if not entry[4]]
+
+    frames, frame_index, samples, weights = [], {}, [], []
+
+    def index(func):
+        if func not in frame_index:
+            frame_index[func] = len(frames)
+            filename, line, funcname = func
+            frames.append({"name": funcname, "file": filename, "line": line} if filename != "~"
+                          else {"name": funcname})
+        return frame_index[func]
+
+    def walk(func, share: float, stack: list):
+        total = stats[func][3]
+        if share < _MIN_SHARE_SECONDS or total <= 0:
+            return
+        stack.append(index(func))
+        scale = share / total
+        self_time = stats[func][2] * scale
+        if self_time > 0:
+            samples.append(list(stack))
+            weights.append(self_time)
+        if len(stack) < PROFILING_SPEEDSCOPE_MAX_DEPTH:
+            for callee, edge_time in callees.get(func, ()):
+                # Recursión: la función ya está en la pila, su tiempo ya se contó
+                if frame_index.get(callee) not in stack:
+                    walk(callee, edge_time * scale, stack)
+        stack.pop()
+
+    for root in roots:
+        walk(root, stats[root][3], [])
+
+    total_weight = sum(weights)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "coin-swap",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": total_weight,
+            "samples": samples,
+            "weights": weights,
+        }],
+    }
+
+def top_functions(stats: dict, limit: int = 20) -> list:
+    """Las funciones con más tiempo acumulado, para un vistazo rápido sin descargar."""
+    ordered = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [{"function": _frame_name(func), "calls": entry[1],
+             "self_s": round(entry[2], 6), "cumulative_s": round(entry[3], 6)}
+            for func, entry in ordered]
+
+class ProfilingMiddleware:
+    """Middleware ASGI que perfila con cProfile las peticiones seleccionadas.
+
+    cProfile mide el hilo del event loop, así que el perfil incluye handler,
+    dependencias y todo lo que se espera con ``await`` durante la petición,
+    además de cualquier otra tarea que el loop ejecute en ese intervalo. Solo
+    se perfila una petición a la vez; las demás pasan sin perfilar. La
+    cabecera solo cuenta si trae el secreto: un cliente cualquiera no puede
+    forzar el coste de perfilar.
+    """
+
+    def __init__(self, app, store: ProfileStore = profile_store, header: str = PROFILING_HEADER,
+                 secret: Optional[str] = PROFILING_SECRET, sample_rate: float = PROFILING_SAMPLE_RATE):
+        self.app = app
+        self.store = store
+        self.header = header.lower().encode()
+        self.secret = secret
+        self.sample_rate = sample_rate
+        self._active = False
+
+    def _wanted(self, scope) -> bool:
+        if self._active:
+            return False
+        if any(name == self.header and secret_matches(value, self.secret) for name, value in scope["headers"]):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        self._active = True
+        profile_id = self.store.next_id()
+        profiler = cProfile.Profile()
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                # El cliente sabe qué perfil descargar de /debug/profiles/
+                message = {**message, "headers": [*message.get("headers", []),
+                                                  (b"x-profile-id", str(profile_id).encode())]}
+            await send(message)
+
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.disable()
+            self._active = False
+            duration = time.perf_counter() - started
+            route = scope.get("route")
+            path = getattr(route, "path", None) or scope["path"]
+            self.store.add(profile_id, scope["method"], path, status, duration, pstats.Stats(profiler).stats)
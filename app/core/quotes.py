@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+import uuid
+from jose import JWTError, jwt
+from fastapi import HTTPException
+from app.core.config import SECRET_KEY, ALGORITHM, QUOTE_TTL_SECONDS
+
+QUOTE_TYPE = "rate_quote"
+
+def create_quote(username: str, from_currency: str, to_currency: str, rate: float) -> dict:
+    """Cotización firmada: fija la tasa para ``username`` hasta que expire."""
+    expires_at = datetime.utcnow() + timedelta(seconds=QUOTE_TTL_SECONDS)
+    quote_id = jwt.encode({
+        "typ": QUOTE_TYPE,
+        "jti": uuid.uuid4().hex,
+        "sub": username,
+        "from": from_currency,
+        "to": to_currency,
+        "rate": rate,
+        "exp": expires_at,
+    }, SECRET_KEY, algorithm=ALGORITHM)
+    return {
+        "quote_id": quote_id,
+        "from_currency": from_currency,
+        "to_currency": to_currency,
+        "rate": rate,
+        "expires_at": expires_at,
+    }
+
+def verify_quote(quote_id: str, username: str, from_currency: str, to_currency: str) -> dict:
+    """Devuelve los claims de la cotización (``rate``, ``jti``, ``exp``) si la firma,
+    el usuario, el par y la vigencia coinciden. Que no se haya usado ya lo
+    comprueba spend_quote (app/crud/quote.py) en la transacción de la conversión."""
+    invalid = HTTPException(400, "Cotización inválida o expirada")
+    try:
+        claims = jwt.decode(quote_id, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise invalid
+    if (claims.get("typ") != QUOTE_TYPE or claims.get("sub") != username
+            or claims.get("from") != from_currency or claims.get("to") != to_currency
+            or not claims.get("jti")):
+        raise invalid
+    return claims
@@ -1,35 +1,123 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
+import time
 from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.api.deps import get_db
 from app.crud.user import get_user_by_username
-from app.core.config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.crud.wallet import get_balances
+from app.core.config import (
+    SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES,
+    TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL_SECONDS, IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL_SECONDS,
+)
+from app.core.metrics import OPERATION_LATENCY
+from app.models.user import User
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
+ACCESS_TOKEN_TYPE = "access"
+
+class ExpiringLRUCache:
+    """LRU acotado cuyas entradas caducan en un instante absoluto (epoch)."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is not None and item[1] > time.time():
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+        if item is not None:
+            del self._data[key]
+        self.misses += 1
+        return None
+
+    def set(self, key, value, expires_at: float = None):
+        expires = time.time() + self.ttl
+        if expires_at is not None:
+            expires = min(expires, expires_at)
+        if expires <= time.time():
+            return
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+token_cache = ExpiringLRUCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL_SECONDS)
+identity_cache = ExpiringLRUCache(IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL_SECONDS)
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
+    to_encode.update({"typ": ACCESS_TOKEN_TYPE, "exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No autenticado",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def decode_username(token: str) -> str:
+    """Verifica el JWT (o lo toma de la caché de tokens ya verificados) y devuelve `sub`."""
+    username = token_cache.get(token)
+    if username is not None:
+        return username
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        with OPERATION_LATENCY.time("jwt_decode"):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
+        # Las cotizaciones se firman con la misma clave: solo se aceptan tokens de acceso
+        # (los emitidos antes de añadir "typ" no lo llevan y siguen valiendo hasta expirar)
+        if username is None or payload.get("typ", ACCESS_TOKEN_TYPE) != ACCESS_TOKEN_TYPE:
+            raise _credentials_exception()
     except JWTError:
-        raise credentials_exception
-    user = get_user_by_username(db, username)
+        raise _credentials_exception()
+    token_cache.set(token, username, expires_at=payload.get("exp"))
+    return username
+
+def invalidate_identity(*usernames: str):
+    """Descarta identidades cacheadas tras un cambio de saldo en este proceso."""
+    for username in usernames:
+        identity_cache.pop(username)
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    username = decode_username(token)
+    user = await get_user_by_username(db, username)
     if not user:
-        raise credentials_exception
+        raise _credentials_exception()
     return user
+
+async def get_current_identity(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> User:
+    """Instantánea del usuario para endpoints de solo lectura; puede tener hasta
+    IDENTITY_CACHE_TTL_SECONDS de antigüedad. Las rutas que mueven dinero usan
+    get_current_user, que siempre lee la fila actual."""
+    username = decode_username(token)
+    identity = identity_cache.get(username)
+    if identity is not None:
+        return identity
+    user = await get_user_by_username(db, username)
+    if not user:
+        raise _credentials_exception()
+    identity = User(username=user.username, balances=await get_balances(db, user.id))
+    identity_cache.set(username, identity)
+    return identity
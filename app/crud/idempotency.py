@@ -0,0 +1,140 @@
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import IDEMPOTENCY_TTL_SECONDS
+from app.core.database import dialect_insert
+from app.models.idempotency import IdempotencyKeyDB
+import asyncio
+import datetime
+import hashlib
+import json
+
+# Duplicados concurrentes dentro del mismo proceso esperan aquí a la primera ejecución
+_inflight: dict = {}
+
+def request_hash(scope: str, payload: BaseModel) -> str:
+    return hashlib.sha256(f"{scope}:{payload.model_dump_json()}".encode()).hexdigest()
+
+# db.info guarda la clave reservada de la petición en curso (ver record_response)
+_PENDING = "idempotency_key"
+
+async def claim_key(db: AsyncSession, user_id: int, key: str, hashed: str):
+    """Reserva la clave dentro de la transacción de la petición.
+
+    Devuelve None si se reservó o la fila existente si ya estaba. La reserva no
+    se confirma por separado: se confirma (o desaparece) junto con la operación,
+    así que una caída a mitad de camino no deja la clave "en curso". Un
+    duplicado en otra transacción espera en el índice único hasta que esta termine.
+    """
+    # ON CONFLICT DO NOTHING en lugar de capturar IntegrityError: un error
+    # abortaría la transacción de la petición (y SQLite no tiene SAVEPOINT fiable)
+    claimed = await db.execute(
+        dialect_insert(db, IdempotencyKeyDB).values(user_id=user_id, key=key, request_hash=hashed)
+        .on_conflict_do_nothing(index_elements=[IdempotencyKeyDB.user_id, IdempotencyKeyDB.key])
+    )
+    if claimed.rowcount == 1:
+        return None
+    result = await db.execute(
+        select(IdempotencyKeyDB).where(IdempotencyKeyDB.user_id == user_id, IdempotencyKeyDB.key == key)
+    )
+    existing = result.scalars().first()
+    expired_before = datetime.datetime.utcnow() - datetime.timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+    if existing is not None and existing.created_at < expired_before:
+        await db.delete(existing)
+        await db.flush()
+        return await claim_key(db, user_id, key, hashed)
+    return existing
+
+async def purge_expired_keys(db: AsyncSession, limit: int) -> int:
+    """Borra hasta ``limit`` claves con más de IDEMPOTENCY_TTL_SECONDS (ver ExpiredRowsPurger)."""
+    expired_before = datetime.datetime.utcnow() - datetime.timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+    expired = (select(IdempotencyKeyDB.id)
+               .where(IdempotencyKeyDB.created_at < expired_before)
+               .limit(limit)
+               .with_for_update(skip_locked=True))
+    result = await db.execute(delete(IdempotencyKeyDB).where(IdempotencyKeyDB.id.in_(expired)))
+    return result.rowcount
+
+async def record_response(db: AsyncSession, response, status_code: int = 200):
+    """Guarda la respuesta de la clave reservada en la transacción actual; sin
+    Idempotency-Key no hace nada. Se llama justo antes del commit de la operación."""
+    pending = db.info.get(_PENDING)
+    if pending is None:
+        return
+    user_id, key = pending
+    await db.execute(
+        update(IdempotencyKeyDB)
+        .where(IdempotencyKeyDB.user_id == user_id, IdempotencyKeyDB.key == key)
+        .values(status_code=status_code, response_body=json.dumps(response))
+    )
+
+async def commit_with_response(db: AsyncSession, response):
+    """Confirma la operación y, en la misma transacción, su respuesta idempotente."""
+    await record_response(db, response)
+    await db.commit()
+
+async def _record_rejection(db: AsyncSession, user_id: int, key: str, hashed: str, error: HTTPException):
+    # La operación se deshizo (con la reserva): se guarda solo el rechazo
+    await db.rollback()
+    await db.execute(
+        dialect_insert(db, IdempotencyKeyDB).values(user_id=user_id, key=key, request_hash=hashed,
+                                                    status_code=error.status_code,
+                                                    response_body=json.dumps({"detail": error.detail}))
+        .on_conflict_do_nothing(index_elements=[IdempotencyKeyDB.user_id, IdempotencyKeyDB.key])
+    )
+    await db.commit()
+
+def _replay(stored: IdempotencyKeyDB):
+    body = json.loads(stored.response_body)
+    if stored.status_code >= 400:
+        raise HTTPException(stored.status_code, body["detail"])
+    return JSONResponse(body, status_code=stored.status_code, headers={"Idempotency-Replayed": "true"})
+
+async def run_idempotent(key: str, user_id: int, scope: str, payload: BaseModel, execute, db: AsyncSession):
+    """Ejecuta ``execute`` una sola vez por (usuario, Idempotency-Key).
+
+    ``execute`` trabaja sobre ``db`` y confirma con ``commit_with_response``,
+    de modo que la reserva, los saldos y la respuesta guardada se confirman en
+    una sola transacción. Los reintentos con la misma clave devuelven la
+    respuesta guardada sin tocar saldos; si la primera ejecución sigue en curso
+    se espera su resultado. Reusar la clave con otra solicitud es un error 422.
+    """
+    if key is None:
+        return await execute()
+    hashed = request_hash(scope, payload)
+    local_key = (user_id, key)
+    while local_key in _inflight:
+        await asyncio.shield(_inflight[local_key])
+    done = asyncio.get_running_loop().create_future()
+    _inflight[local_key] = done
+    try:
+        # Una fila visible siempre tiene respuesta: se confirma junto con la reserva
+        stored = await claim_key(db, user_id, key, hashed)
+        if stored is not None:
+            if stored.request_hash != hashed:
+                raise HTTPException(422, "Idempotency-Key reutilizada con una solicitud distinta")
+            return _replay(stored)
+
+        db.info[_PENDING] = (user_id, key)
+        try:
+            return await execute()
+        except HTTPException as e:
+            if e.status_code >= 500:
+                # Fallo transitorio (p. ej. proveedor de tasas caído): la reserva se
+                # deshace y un reintento con la misma clave vuelve a ejecutar
+                await db.rollback()
+                raise
+            # Los rechazos de negocio (saldo insuficiente, etc.) también se repiten tal cual
+            await _record_rejection(db, user_id, key, hashed, e)
+            raise
+        except Exception:
+            # Error inesperado: la reserva se deshace con la transacción y el cliente puede reintentar
+            await db.rollback()
+            raise
+        finally:
+            db.info.pop(_PENDING, None)
+    finally:
+        del _inflight[local_key]
+        done.set_result(None)
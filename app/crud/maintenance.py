@@ -0,0 +1,61 @@
+from app.core.config import PURGE_BATCH_SIZE, PURGE_INTERVAL_SECONDS
+from app.core.database import AsyncSessionLocal
+from app.crud.idempotency import purge_expired_keys
+from app.crud.quote import purge_spent_quotes
+import asyncio
+import contextlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ExpiredRowsPurger:
+    """Borra en segundo plano las filas que ya caducaron (cotizaciones usadas y
+    claves de idempotencia).
+
+    Cada purga va en su propia transacción y por lotes de ``batch_size``, de
+    modo que las peticiones nunca esperan por esta limpieza.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, purges=(purge_spent_quotes, purge_expired_keys),
+                 batch_size: int = PURGE_BATCH_SIZE, interval: float = PURGE_INTERVAL_SECONDS):
+        self.session_factory = session_factory
+        self.purges = purges
+        self.batch_size = batch_size
+        self.interval = interval
+        self._task: asyncio.Task = None
+        self.purged = 0
+
+    async def purge_once(self) -> int:
+        purged = 0
+        for purge in self.purges:
+            while True:
+                async with self.session_factory() as db:
+                    deleted = await purge(db, self.batch_size)
+                    await db.commit()
+                purged += deleted
+                if deleted < self.batch_size:
+                    break
+        self.purged += purged
+        return purged
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.purge_once()
+            except Exception:
+                logger.exception("Purga: fallo al borrar filas caducadas")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+
+expired_rows_purger = ExpiredRowsPurger()
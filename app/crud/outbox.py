@@ -0,0 +1,103 @@
+from sqlalchemy import select, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import OUTBOX_BATCH_SIZE, OUTBOX_POLL_INTERVAL_SECONDS
+from app.core.database import AsyncSessionLocal
+from app.core.metrics import timed
+from app.crud.transaction import transaction_log_writer
+from app.models.outbox import OutboxEventDB
+import asyncio
+import contextlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+def add_transaction_event(db: AsyncSession, description: str, username: str):
+    """Registra el evento de historial en la transacción actual; el llamador hace commit."""
+    db.add(OutboxEventDB(description=description, username=username))
+
+async def fetch_pending_events(db: AsyncSession, limit: int):
+    # SKIP LOCKED: varios workers pueden relevar en paralelo sin pisarse
+    result = await db.execute(
+        select(OutboxEventDB)
+        .order_by(OutboxEventDB.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    return result.scalars().all()
+
+async def count_pending_events(db: AsyncSession) -> int:
+    return (await db.execute(select(func.count()).select_from(OutboxEventDB))).scalar()
+
+async def delete_events(db: AsyncSession, ids: list):
+    await db.execute(delete(OutboxEventDB).where(OutboxEventDB.id.in_(ids)))
+
+def to_document(event: OutboxEventDB) -> dict:
+    return {
+        "event_id": f"outbox-{event.id}",
+        "timestamp": event.created_at,
+        "description": event.description,
+        "username": event.username,
+    }
+
+class OutboxRelay:
+    """Mueve los eventos del outbox de Postgres a MongoDB en lotes ordenados.
+
+    Las filas solo se borran cuando Mongo confirmó el lote; si el proceso cae
+    antes, el lote se reenvía y el upsert por ``event_id`` evita duplicados.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, writer=transaction_log_writer,
+                 batch_size: int = OUTBOX_BATCH_SIZE, poll_interval: float = OUTBOX_POLL_INTERVAL_SECONDS):
+        self.session_factory = session_factory
+        self.writer = writer
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._task: asyncio.Task = None
+        self.relayed = 0
+        # Filas sin relevar vistas en la última pasada (gauge txlog_pending_events)
+        self.pending = 0
+
+    @timed("outbox_relay")
+    async def relay_once(self) -> int:
+        async with self.session_factory() as db:
+            events = await fetch_pending_events(db, self.batch_size)
+            # Solo se cuenta el outbox si hay atasco (lote lleno); si no, el lote es todo lo pendiente
+            self.pending = await count_pending_events(db) if len(events) == self.batch_size else len(events)
+            if not events:
+                return 0
+            if not await self.writer.write_batch([to_document(event) for event in events]):
+                await db.rollback()
+                return 0
+            await delete_events(db, [event.id for event in events])
+            await db.commit()
+        self.relayed += len(events)
+        self.pending = max(self.pending - len(events), 0)
+        return len(events)
+
+    async def _run(self):
+        while True:
+            try:
+                relayed = await self.relay_once()
+            except Exception:
+                logger.exception("Outbox: fallo al relevar eventos")
+                relayed = 0
+            if relayed < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+        # último intento para no dejar pendiente lo confirmado justo antes del apagado
+        with contextlib.suppress(Exception):
+            while await self.relay_once() == self.batch_size:
+                pass
+
+outbox_relay = OutboxRelay()
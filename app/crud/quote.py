@@ -0,0 +1,29 @@
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import dialect_insert
+from app.models.quote import SpentQuoteDB
+import datetime
+
+async def spend_quote(db: AsyncSession, jti: str, expires_at: datetime.datetime) -> bool:
+    """Marca la cotización como usada en la transacción de la conversión.
+
+    Devuelve False si ya se había usado. Si la conversión se deshace, la marca
+    también, y la cotización vuelve a servir mientras siga vigente.
+    """
+    spent = await db.execute(
+        dialect_insert(db, SpentQuoteDB).values(jti=jti, expires_at=expires_at)
+        .on_conflict_do_nothing(index_elements=[SpentQuoteDB.jti])
+    )
+    return spent.rowcount == 1
+
+async def purge_spent_quotes(db: AsyncSession, limit: int) -> int:
+    """Borra hasta ``limit`` cotizaciones expiradas (ya no pasan verify_quote).
+
+    SKIP LOCKED: varios workers purgan a la vez sin esperarse entre sí.
+    """
+    expired = (select(SpentQuoteDB.jti)
+               .where(SpentQuoteDB.expires_at < datetime.datetime.utcnow())
+               .limit(limit)
+               .with_for_update(skip_locked=True))
+    result = await db.execute(delete(SpentQuoteDB).where(SpentQuoteDB.jti.in_(expired)))
+    return result.rowcount
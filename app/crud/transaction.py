@@ -1,22 +1,215 @@
-from app.core.database import transactions_collection
-from app.models.transaction import TransactionOut
-from typing import List
+from app.core.database import get_transactions_collection
+from app.core.config import (
+    TXLOG_MAX_RETRIES, TXLOG_RETRY_BACKOFF_SECONDS,
+    TRANSACTIONS_PAGE_SIZE, EXPORT_BATCH_SIZE,
+)
+from app.core.metrics import timed
+from app.models.transaction import TransactionOut, TransactionPage
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from typing import AsyncIterator, List, Optional
+import asyncio
+import base64
+import csv
 import datetime
+import io
+import json
+import logging
 
-async def insert_transaction(description: str, username: str):
-    await transactions_collection.insert_one({
-        "timestamp": datetime.datetime.utcnow(),
-        "description": description,
-        "username": username,
-    })
+logger = logging.getLogger(__name__)
 
-async def get_transactions_by_user(username: str) -> List[TransactionOut]:
-    cursor = transactions_collection.find({"username": username}).sort("timestamp", -1)
-    results = []
+DUPLICATE_KEY_ERROR = 11000
+
+class TransactionLogWriter:
+    """Escribe en MongoDB los lotes de historial que le entrega el relay del outbox.
+
+    Cada documento lleva un ``event_id`` y se escribe con upsert, así que
+    reintentar un lote nunca duplica el historial. Los índices se crean antes
+    del primer lote que llega a escribirse: si Mongo no estaba al arrancar, se
+    crean en cuanto vuelve.
+    """
+
+    def __init__(self, collection=None, max_retries: int = TXLOG_MAX_RETRIES,
+                 retry_backoff: float = TXLOG_RETRY_BACKOFF_SECONDS):
+        self._collection = collection
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.written = 0
+        self.batches = 0
+        self.retries = 0
+        self.failed = 0
+        self.indexes_ready = False
+
+    @property
+    def collection(self):
+        # Resuelta en el primer lote, no al importar: así no se abre Mongo antes del lifespan
+        if self._collection is None:
+            self._collection = get_transactions_collection()
+        return self._collection
+
+    async def ensure_indexes(self):
+        await ensure_indexes(self.collection)
+        self.indexes_ready = True
+
+    async def upsert(self, batch: List[dict]):
+        """Un upsert ``$setOnInsert`` por ``event_id``, todos en un solo bulk_write."""
+        operations = [
+            UpdateOne({"event_id": doc["event_id"]}, {"$setOnInsert": doc}, upsert=True)
+            for doc in batch
+        ]
+        await self.collection.bulk_write(operations, ordered=False)
+
+    @timed("mongo_write_batch")
+    async def write_batch(self, batch: List[dict]) -> bool:
+        """Escribe el lote con reintentos; devuelve False si no se pudo (el relay lo reenvía)."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                if not self.indexes_ready:
+                    # Sin el índice único de event_id, dos relays podrían duplicar eventos
+                    await self.ensure_indexes()
+                await self.upsert(batch)
+                break
+            except BulkWriteError as e:
+                # Dos upserts simultáneos del mismo event_id: el documento ya está guardado
+                if all(err.get("code") == DUPLICATE_KEY_ERROR for err in e.details.get("writeErrors", [])):
+                    break
+                error = e
+            except PyMongoError as e:
+                error = e
+            if attempt == self.max_retries:
+                self.failed += len(batch)
+                logger.warning("Historial: lote de %s eventos sin escribir tras %s intentos; "
+                               "sigue en el outbox y se reenviará: %s", len(batch), attempt + 1, error)
+                return False
+            self.retries += 1
+            await asyncio.sleep(self.retry_backoff * (2 ** attempt))
+        self.written += len(batch)
+        self.batches += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "written": self.written,
+            "batches": self.batches,
+            "retries": self.retries,
+            "failed": self.failed,
+        }
+
+transaction_log_writer = TransactionLogWriter()
+
+HISTORY_INDEX = [("username", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]
+HISTORY_PROJECTION = {"timestamp": 1, "description": 1, "username": 1}
+
+async def ensure_indexes(collection=None):
+    collection = collection if collection is not None else get_transactions_collection()
+    await collection.create_index("event_id", unique=True, sparse=True)
+    # Cubre el filtro por usuario y el orden (timestamp, _id) de la paginación
+    await collection.create_index(HISTORY_INDEX)
+
+def encode_cursor(doc: dict) -> str:
+    raw = f"{doc['timestamp'].isoformat()}|{doc['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        timestamp, object_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.datetime.fromisoformat(timestamp), ObjectId(object_id)
+    except (ValueError, InvalidId, UnicodeDecodeError):
+        raise ValueError("Cursor inválido")
+
+def _keyset_filter(cursor: str, operator: str) -> dict:
+    timestamp, object_id = decode_cursor(cursor)
+    return {"$or": [
+        {"timestamp": {operator: timestamp}},
+        {"timestamp": timestamp, "_id": {operator: object_id}},
+    ]}
+
+def history_query(username: str, start: Optional[datetime.datetime] = None,
+                  end: Optional[datetime.datetime] = None) -> dict:
+    query = {"username": username}
+    if start is not None or end is not None:
+        query["timestamp"] = {}
+        if start is not None:
+            query["timestamp"]["$gte"] = start
+        if end is not None:
+            query["timestamp"]["$lt"] = end
+    return query
+
+async def get_transactions_by_user(username: str, limit: int = TRANSACTIONS_PAGE_SIZE,
+                                   before: Optional[str] = None, after: Optional[str] = None,
+                                   start: Optional[datetime.datetime] = None,
+                                   end: Optional[datetime.datetime] = None) -> TransactionPage:
+    """Página del historial, de la más reciente a la más antigua (paginación por keyset).
+
+    ``before`` devuelve las transacciones más antiguas que el cursor y
+    ``after`` las más recientes; sin cursor se empieza por la última.
+    """
+    if before and after:
+        raise ValueError("Use solo uno de 'before' o 'after'")
+    query = history_query(username, start, end)
+    newer = after is not None
+    if before or after:
+        query = {"$and": [query, _keyset_filter(after if newer else before, "$gt" if newer else "$lt")]}
+    direction = ASCENDING if newer else DESCENDING
+
+    cursor = (
+        get_transactions_collection().find(query, HISTORY_PROJECTION)
+        .sort([("timestamp", direction), ("_id", direction)])
+        .limit(limit + 1)
+    )
+    docs = [doc async for doc in cursor]
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    if newer:
+        docs.reverse()
+
+    page = TransactionPage(items=[
+        TransactionOut(timestamp=doc["timestamp"], description=doc["description"], username=doc["username"])
+        for doc in docs
+    ])
+    if docs:
+        oldest, newest = encode_cursor(docs[-1]), encode_cursor(docs[0])
+        if newer:
+            page.next_cursor = oldest
+            page.prev_cursor = newest if has_more else None
+        else:
+            page.next_cursor = oldest if has_more else None
+            page.prev_cursor = newest if before else None
+    return page
+
+EXPORT_FIELDS = ["timestamp", "description", "username"]
+
+async def iter_transactions(username: str, start: Optional[datetime.datetime] = None,
+                            end: Optional[datetime.datetime] = None,
+                            batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[dict]:
+    """Recorre el historial completo (más antiguo primero) sin cargarlo en memoria."""
+    cursor = (
+        get_transactions_collection().find(history_query(username, start, end), HISTORY_PROJECTION)
+        .sort([("timestamp", ASCENDING), ("_id", ASCENDING)])
+        .batch_size(batch_size)
+    )
     async for doc in cursor:
-        results.append(TransactionOut(
-            timestamp=doc["timestamp"],
-            description=doc["description"],
-            username=doc["username"]
-        ))
-    return results
+        yield doc
+
+async def export_ndjson(documents: AsyncIterator[dict]) -> AsyncIterator[str]:
+    async for doc in documents:
+        yield json.dumps({
+            "timestamp": doc["timestamp"].isoformat(),
+            "description": doc["description"],
+            "username": doc["username"],
+        }, ensure_ascii=False) + "\n"
+
+async def export_csv(documents: AsyncIterator[dict]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    async for doc in documents:
+        writer.writerow([doc["timestamp"].isoformat(), doc["description"], doc["username"]])
+        # Se emite cada fila y se reutiliza el buffer: memoria constante
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,54 @@
+from collections import defaultdict
+from typing import List, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.money import from_minor_unit, to_minor_unit, to_minor_units
+from app.crud.outbox import add_transaction_event
+from app.crud.user import get_users_by_usernames
+from app.crud.wallet import lock_wallets, apply_balance_deltas
+from app.models.transfer import TransferRequest
+from app.models.user import UserDB
+
+async def batch_transfer(db: AsyncSession, sender: UserDB, items: List[TransferRequest],
+                         atomic: bool = True) -> Tuple[List[dict], bool]:
+    """Valida y aplica varias transferencias del mismo emisor en una transacción.
+
+    Los receptores se resuelven con una sola consulta IN y solo las billeteras
+    implicadas (usuario y moneda) se bloquean, en orden de clave. Devuelve el
+    resultado por ítem y si se aplicaron los cambios; con ``atomic`` un solo ítem inválido anula el lote.
+    No hace commit.
+    """
+    receivers = await get_users_by_usernames(db, {item.receiver for item in items})
+    keys = {(sender.id, item.currency) for item in items}
+    keys |= {(receivers[item.receiver].id, item.currency) for item in items if item.receiver in receivers}
+    locked = await lock_wallets(db, keys)
+    # Saldos y montos en unidades menores enteras: el lote se valida sin aritmética Decimal
+    available = defaultdict(int, {currency: to_minor_unit(balance)
+                                  for (user_id, currency), balance in locked.items() if user_id == sender.id})
+    amounts = to_minor_units([item.amount for item in items]).tolist()
+
+    deltas = defaultdict(int)
+    results = []
+    for index, (item, amount) in enumerate(zip(items, amounts)):
+        receiver = receivers.get(item.receiver)
+        if receiver is None:
+            results.append({"index": index, "receiver": item.receiver, "status": "error",
+                            "detail": "Usuario receptor no encontrado"})
+            continue
+        if available[item.currency] < amount:
+            results.append({"index": index, "receiver": item.receiver, "status": "error",
+                            "detail": f"Saldo insuficiente en {item.currency}"})
+            continue
+        if receiver.id != sender.id:
+            available[item.currency] -= amount
+        deltas[(sender.id, item.currency)] -= amount
+        deltas[(receiver.id, item.currency)] += amount
+
+        desc_sender = f"{sender.username} transfirió {item.amount} {item.currency} a {receiver.username}"
+        desc_receiver = f"{receiver.username} recibió {item.amount} {item.currency} de {sender.username}"
+        add_transaction_event(db, desc_sender, sender.username)
+        add_transaction_event(db, desc_receiver, receiver.username)
+        results.append({"index": index, "receiver": item.receiver, "status": "ok", "detail": desc_sender})
+
+    if atomic and any(result["status"] == "error" for result in results):
+        return results, False
+    return results, await apply_balance_deltas(db, {key: from_minor_unit(delta) for key, delta in deltas.items()})
@@ -1,18 +1,30 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import INITIAL_BALANCES
+from app.core.metrics import timed
+from app.crud.wallet import add_wallets
 from app.models.user import UserDB
 
-def get_user_by_username(db: Session, username: str):
-    return db.query(UserDB).filter(UserDB.username == username).first()
+@timed("user_lookup")
+async def get_user_by_username(db: AsyncSession, username: str):
+    result = await db.execute(select(UserDB).where(UserDB.username == username))
+    return result.scalars().first()
 
-def create_user(db: Session, username: str):
-    db_user = UserDB(username=username, balance_pen=100.0, balance_usd=0.0)
+async def get_users_by_usernames(db: AsyncSession, usernames) -> dict:
+    result = await db.execute(select(UserDB).where(UserDB.username.in_(list(usernames))))
+    return {user.username: user for user in result.scalars()}
+
+async def create_user(db: AsyncSession, username: str):
+    db_user = UserDB(username=username)
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.flush()
+    add_wallets(db, db_user.id, INITIAL_BALANCES)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
-def update_user(db: Session, user: UserDB):
+async def update_user(db: AsyncSession, user: UserDB):
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
@@ -0,0 +1,142 @@
+import random
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict
+from sqlalchemy import Integer, func, literal, select, update, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import dialect_insert
+from app.models.user import UserDB
+from app.models.wallet import WalletDB
+
+# Motor de saldos genérico: cada (user_id, moneda) es una fila de wallets y
+# toda operación toca solo las filas implicadas, de modo que los movimientos
+# en USD y en PEN de un mismo usuario no compiten por el mismo bloqueo.
+# Los saldos se modifican con UPDATE condicionales en la BD, nunca leyendo y
+# escribiendo desde Python: el chequeo de saldo y el descuento son atómicos.
+# Ninguna función hace commit; el llamador confirma o revierte la transacción.
+#
+# Cuentas calientes: con users.balance_shards = N cada crédito cae en una de N
+# filas al azar, así N escritores concurrentes bloquean filas distintas. Los
+# débitos y las lecturas suman todos los shards de la moneda.
+
+# Rango del número aleatorio que se reduce módulo balance_shards en la BD
+_SHARD_PICK_RANGE = 1 << 30
+
+def _wallet(user_id: int, currency: str):
+    return (WalletDB.user_id == user_id) & (WalletDB.currency == currency)
+
+def _shard_count(user_id: int):
+    return select(UserDB.balance_shards).where(UserDB.id == user_id).scalar_subquery()
+
+async def _execute(db: AsyncSession, statement) -> int:
+    result = await db.execute(statement.execution_options(synchronize_session=False))
+    return result.rowcount
+
+def add_wallets(db: AsyncSession, user_id: int, balances: dict):
+    """Agrega las billeteras iniciales de un usuario (sin commit)."""
+    db.add_all([WalletDB(user_id=user_id, currency=currency, balance=Decimal(balance))
+                for currency, balance in balances.items()])
+
+async def get_balances(db: AsyncSession, user_id: int) -> Dict[str, Decimal]:
+    result = await db.execute(
+        select(WalletDB.currency, func.sum(WalletDB.balance))
+        .where(WalletDB.user_id == user_id)
+        .group_by(WalletDB.currency)
+        .order_by(WalletDB.currency)
+    )
+    return {currency: balance for currency, balance in result.all()}
+
+async def debit_balance(db: AsyncSession, user_id: int, currency: str, amount: Decimal) -> bool:
+    # Camino rápido: un único UPDATE condicional sobre el shard 0, que en una
+    # cuenta normal es su única fila.
+    statement = (
+        update(WalletDB)
+        .where(_wallet(user_id, currency), WalletDB.shard == 0, WalletDB.balance >= amount)
+        .values(balance=WalletDB.balance - amount)
+    )
+    if await _execute(db, statement) == 1:
+        return True
+    return await _debit_shards(db, user_id, currency, amount)
+
+async def _debit_shards(db: AsyncSession, user_id: int, currency: str, amount: Decimal) -> bool:
+    # Saldo repartido (o insuficiente): se bloquean todos los shards en orden
+    # y se descuenta de uno en uno hasta cubrir el importe.
+    result = await db.execute(
+        select(WalletDB.shard, WalletDB.balance)
+        .where(_wallet(user_id, currency))
+        .order_by(WalletDB.shard)
+        .with_for_update()
+    )
+    rows = result.all()
+    if sum(balance for _, balance in rows) < amount:
+        return False
+    remaining = amount
+    for shard, balance in rows:
+        take = min(balance, remaining)
+        if take > 0:
+            await _execute(db, update(WalletDB).where(_wallet(user_id, currency), WalletDB.shard == shard)
+                           .values(balance=WalletDB.balance - take))
+            remaining -= take
+        if remaining == 0:
+            break
+    return True
+
+async def credit_balance(db: AsyncSession, user_id: int, currency: str, amount: Decimal):
+    # El shard se elige en la misma sentencia (azar módulo balance_shards),
+    # sin una lectura previa de users.
+    pick = random.randrange(_SHARD_PICK_RANGE)
+    shard = literal(pick, Integer) % _shard_count(user_id)
+    if await _execute(db, update(WalletDB).where(_wallet(user_id, currency), WalletDB.shard == shard)
+                      .values(balance=WalletDB.balance + amount)) == 1:
+        return
+    # Primera vez que el usuario recibe esta moneda (o cae en este shard): se
+    # crea la fila. El upsert cubre la carrera con otro crédito simultáneo.
+    shards = await db.scalar(select(UserDB.balance_shards).where(UserDB.id == user_id))
+    statement = dialect_insert(db, WalletDB).values(user_id=user_id, currency=currency,
+                                                    shard=pick % (shards or 1), balance=amount)
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[WalletDB.user_id, WalletDB.currency, WalletDB.shard],
+        set_={"balance": WalletDB.balance + amount},
+    ))
+
+async def transfer_balance(db: AsyncSession, sender_id: int, receiver_id: int, currency: str, amount: Decimal) -> bool:
+    # Las filas se bloquean siempre en orden de id para que dos transferencias
+    # cruzadas (A->B y B->A) no puedan entrar en deadlock.
+    if sender_id <= receiver_id:
+        if not await debit_balance(db, sender_id, currency, amount):
+            return False
+        await credit_balance(db, receiver_id, currency, amount)
+        return True
+    await credit_balance(db, receiver_id, currency, amount)
+    return await debit_balance(db, sender_id, currency, amount)
+
+async def convert_balance(db: AsyncSession, user_id: int, from_currency: str, to_currency: str,
+                          amount: Decimal, converted: Decimal) -> bool:
+    # Dos filas del mismo usuario; apply_balance_deltas las toca en orden de
+    # moneda, así USD->PEN y PEN->USD simultáneos no se bloquean en cruz.
+    return await apply_balance_deltas(db, {(user_id, from_currency): -amount,
+                                           (user_id, to_currency): converted})
+
+async def lock_wallets(db: AsyncSession, keys) -> dict:
+    """SELECT ... FOR UPDATE de las billeteras {(user_id, moneda)} (todos sus shards),
+    en orden de clave (sin deadlocks). Devuelve el saldo total de cada una."""
+    result = await db.execute(
+        select(WalletDB.user_id, WalletDB.currency, WalletDB.balance)
+        .where(tuple_(WalletDB.user_id, WalletDB.currency).in_(sorted(keys)))
+        .order_by(WalletDB.user_id, WalletDB.currency, WalletDB.shard)
+        .with_for_update()
+    )
+    balances = defaultdict(Decimal)
+    for user_id, currency, balance in result.all():
+        balances[(user_id, currency)] += balance
+    return dict(balances)
+
+async def apply_balance_deltas(db: AsyncSession, deltas: dict) -> bool:
+    """Aplica {(user_id, moneda): delta} en orden de clave; False si algún débito no alcanza."""
+    for (user_id, currency), delta in sorted(deltas.items()):
+        if delta < 0:
+            if not await debit_balance(db, user_id, currency, -delta):
+                return False
+        elif delta > 0:
+            await credit_balance(db, user_id, currency, delta)
+    return True
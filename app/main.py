@@ -1,11 +1,79 @@
+import asyncio
+import contextlib
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.routes import auth, users, transfer, transactions, currency
-from app.core.database import Base, engine, SessionLocal
-from app.models.user import UserDB
-from sqlalchemy.orm import Session
+from app.api.routes import auth, users, transfer, transactions, currency, metrics, profiling
+from app.core.config import (
+    DB_POOL_WARM_CONNECTIONS, METRICS_ENABLED, MONGO_PING_TIMEOUT_SECONDS, PROFILING_ENABLED,
+    RATE_REFRESH_INTERVAL_SECONDS, STARTUP_RATE_WARMUP_TIMEOUT_SECONDS,
+)
+from app.core.currency_client import currency_api_client, get_http_client, close_http_client
+from app.core.database import close_connections, current_pool, ping_mongo, warm_up_database
+from app.core.metrics import MetricsMiddleware, registry
+from app.core.profiling import ProfilingMiddleware
+from app.crud.maintenance import expired_rows_purger
+from app.crud.outbox import outbox_relay
+from app.crud.transaction import transaction_log_writer
+
+logger = logging.getLogger(__name__)
+
+# Importar este módulo no abre conexiones: engines y clientes se crean aquí, al
+# arrancar cada worker. Las tablas y los datos iniciales se crean aparte, una
+# sola vez por despliegue, con `python -m app.cli init-db`.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Sin base de datos no hay servicio: si falla, el worker no arranca
+    await warm_up_database(DB_POOL_WARM_CONNECTIONS)
+    try:
+        await asyncio.wait_for(ping_mongo(), MONGO_PING_TIMEOUT_SECONDS)
+        mongo_ready = True
+    except Exception:
+        # El historial pasa por el outbox: se escribirá cuando Mongo vuelva
+        logger.warning("MongoDB no responde al arrancar", exc_info=True)
+        mongo_ready = False
+    # Cliente HTTP compartido por los adaptadores de tasas
+    get_http_client()
+    # Caché de tasas llena antes de la primera petición; luego refresco periódico
+    with contextlib.suppress(asyncio.TimeoutError):
+        await asyncio.wait_for(currency_api_client.refresh_all(), STARTUP_RATE_WARMUP_TIMEOUT_SECONDS)
+    currency_api_client.start_refresher(initial_delay=RATE_REFRESH_INTERVAL_SECONDS)
+    # Si Mongo no respondía, el writer crea los índices antes de su primer lote
+    if mongo_ready:
+        try:
+            await transaction_log_writer.ensure_indexes()
+        except Exception:
+            # El ping pasó pero los índices no: el writer los reintenta con su primer lote
+            logger.warning("No se pudieron crear los índices de MongoDB al arrancar", exc_info=True)
+    outbox_relay.start()
+    expired_rows_purger.start()
+    yield
+    await expired_rows_purger.stop()
+    await currency_api_client.stop_refresher()
+    await outbox_relay.stop()
+    await close_http_client()
+    await close_connections()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+def _pool_stat(name: str):
+    pool = current_pool()
+    return getattr(pool, name)() if pool is not None else None
+
+if METRICS_ENABLED:
+    # Latencia por ruta; el detalle por operación lo registran los propios módulos
+    app.add_middleware(MetricsMiddleware)
+    # Un scrape nunca crea el engine: sin pool todavía, los gauges publican NaN
+    registry.gauge("db_pool_checked_out", "Conexiones del pool SQL en uso", lambda: _pool_stat("checkedout"))
+    registry.gauge("db_pool_size", "Tamaño configurado del pool SQL", lambda: _pool_stat("size"))
+    registry.gauge("db_pool_overflow", "Conexiones SQL abiertas por encima de pool_size", lambda: _pool_stat("overflow"))
+    registry.gauge("txlog_pending_events", "Eventos del outbox aún sin relevar a MongoDB", lambda: outbox_relay.pending)
+    registry.gauge("rate_stream_subscribers", "Conexiones abiertas a /currency/stream/", currency_api_client.stream_subscribers)
+
+if PROFILING_ENABLED:
+    # Solo depuración: perfiles de peticiones lentas sin redesplegar (ver /debug/profiles/)
+    app.add_middleware(ProfilingMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,39 +83,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Crear tablas en la base de datos
-Base.metadata.create_all(bind=engine)
-
-# Inicializar usuarios con saldo
-def init_users(db: Session):
-    # Verificar si los usuarios ya existen
-    user_x = db.query(UserDB).filter(UserDB.username == "X").first()
-    user_y = db.query(UserDB).filter(UserDB.username == "Y").first()
-
-    if not user_x:
-        user_x = UserDB(username="X", balance_pen=100, balance_usd=200)
-        db.add(user_x)
-
-    if not user_y:
-        user_y = UserDB(username="Y", balance_pen=50, balance_usd=100)
-        db.add(user_y)
-
-    db.commit()
-
-# Inicializar la base de datos con los usuarios X y Y
-def init_db():
-    db = SessionLocal()
-    try:
-        init_users(db)
-    finally:
-        db.close()
-
-init_db()
-
 # Incluir routers de las rutas
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(users.router, prefix="/users", tags=["users"])
 app.include_router(transfer.router, prefix="/transfer", tags=["transfer"])
 app.include_router(transactions.router, prefix="/transactions", tags=["transactions"])
 app.include_router(currency.router, prefix="/currency", tags=["currency"])
+app.include_router(metrics.router, tags=["metrics"])
+if PROFILING_ENABLED:
+    app.include_router(profiling.router, prefix="/debug/profiles", tags=["debug"])
 
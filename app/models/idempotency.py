@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, UniqueConstraint
+from app.core.database import Base
+import datetime
+
+class IdempotencyKeyDB(Base):
+    """Clave de idempotencia de un usuario; ``status_code`` es NULL mientras la petición está en curso."""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (UniqueConstraint("user_id", "key", name="uq_idempotency_user_key"),)
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    key = Column(String(255), nullable=False)
+    request_hash = Column(String(64), nullable=False)
+    status_code = Column(Integer, nullable=True)
+    response_body = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.datetime.utcnow, index=True)
@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from app.core.database import Base
+import datetime
+
+class OutboxEventDB(Base):
+    """Evento de historial escrito en la misma transacción que el cambio de saldo."""
+    __tablename__ = "transaction_outbox"
+    # El id forma el event_id del historial: nunca debe reutilizarse tras borrar
+    # las filas ya relevadas (SERIAL no lo hace; SQLite sin AUTOINCREMENT sí)
+    __table_args__ = {"sqlite_autoincrement": True}
+    id = Column(Integer, primary_key=True)
+    username = Column(String, nullable=False)
+    description = Column(String, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
@@ -0,0 +1,8 @@
+from sqlalchemy import Column, String, DateTime
+from app.core.database import Base
+
+class SpentQuoteDB(Base):
+    """Cotización ya usada en una conversión; la fila sobra en cuanto la cotización expira."""
+    __tablename__ = "spent_quotes"
+    jti = Column(String(32), primary_key=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
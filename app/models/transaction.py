@@ -1,7 +1,13 @@
 from pydantic import BaseModel
 from datetime import datetime
+from typing import List, Optional
 
 class TransactionOut(BaseModel):
     timestamp: datetime
     description: str
     username: str
+
+class TransactionPage(BaseModel):
+    items: List[TransactionOut]
+    next_cursor: Optional[str] = None  # página siguiente (más antigua)
+    prev_cursor: Optional[str] = None  # página anterior (más reciente)
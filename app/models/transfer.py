@@ -1,16 +1,31 @@
+from decimal import Decimal
+from typing import List, Optional
 from pydantic import BaseModel, Field
+from app.core.config import SUPPORTED_CURRENCIES, BATCH_TRANSFER_MAX_ITEMS
+from app.core.money import MONEY_PRECISION, MONEY_SCALE
+
+CURRENCY_PATTERN = f"^({'|'.join(SUPPORTED_CURRENCIES)})$"
+
+def Amount():
+    # Importe positivo exacto con como máximo 2 decimales (se rechaza 10.001)
+    return Field(..., gt=0, max_digits=MONEY_PRECISION, decimal_places=MONEY_SCALE)
 
 class TransferRequest(BaseModel):
     receiver: str
-    amount: float = Field(..., gt=0)
-    currency: str = Field(..., pattern="^(USD|PEN)$")
+    amount: Decimal = Amount()
+    currency: str = Field(..., pattern=CURRENCY_PATTERN)
+
+class BatchTransferRequest(BaseModel):
+    items: List[TransferRequest] = Field(..., min_length=1, max_length=BATCH_TRANSFER_MAX_ITEMS)
+    atomic: bool = True  # False: se aplican los ítems válidos y se reportan los fallidos
 
 class ConversionRequest(BaseModel):
-    from_currency: str = Field(..., pattern="^(USD|PEN)$")
-    to_currency: str = Field(..., pattern="^(USD|PEN)$")
-    amount: float = Field(..., gt=0)
+    from_currency: str = Field(..., pattern=CURRENCY_PATTERN)
+    to_currency: str = Field(..., pattern=CURRENCY_PATTERN)
+    amount: Decimal = Amount()
+    quote_id: Optional[str] = None  # cotización de /currency/quote/; sin ella se usa la tasa actual
 
 class DepositWithdrawRequest(BaseModel):
-    amount: float = Field(..., gt=0)
-    currency: str = Field(..., pattern="^(USD|PEN)$")
+    amount: Decimal = Amount()
+    currency: str = Field(..., pattern=CURRENCY_PATTERN)
     operation: str = Field(..., pattern="^(deposit|withdraw)$")
@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, Float
+from decimal import Decimal
+from typing import Dict
+from sqlalchemy import Column, Integer, String
 from app.core.database import Base
 from pydantic import BaseModel
 
@@ -6,13 +8,12 @@ class UserDB(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True, nullable=False)
-    balance_pen = Column(Float, default=100.0)
-    balance_usd = Column(Float, default=0.0)
+    # Filas de wallets por moneda entre las que se reparten los créditos (1 = sin shards)
+    balance_shards = Column(Integer, nullable=False, default=1)
 
 class User(BaseModel):
     username: str
-    balance_pen: float
-    balance_usd: float
+    balances: Dict[str, Decimal]  # moneda -> saldo, una entrada por billetera
 
 class UserCreate(BaseModel):
     username: str
@@ -0,0 +1,16 @@
+from decimal import Decimal
+from sqlalchemy import Column, Integer, String, Numeric, ForeignKey
+from app.core.database import Base
+from app.core.money import MONEY_PRECISION, MONEY_SCALE
+
+class WalletDB(Base):
+    """Saldo de un usuario en una moneda; la clave (user_id, currency, shard) es el índice compuesto.
+
+    Una cuenta normal tiene una sola fila (shard 0) por moneda; una cuenta
+    caliente reparte su saldo en varias filas y el saldo es su suma.
+    """
+    __tablename__ = "wallets"
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    currency = Column(String(3), primary_key=True)
+    shard = Column(Integer, primary_key=True, default=0)
+    balance = Column(Numeric(MONEY_PRECISION, MONEY_SCALE), nullable=False, default=Decimal("0.00"))
@@ -0,0 +1,54 @@
+"""python -m benchmarks [--base-url URL] [--users N] [--concurrency N] [--rounds N] ..."""
+import argparse
+import asyncio
+import json
+import sys
+from decimal import Decimal
+from pathlib import Path
+from benchmarks.harness import SCENARIOS, bench_client, compare, run_benchmark
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Benchmark de carga y consistencia de coin-swap")
+    parser.add_argument("--base-url", help="Servidor a medir; sin ella se usa la app en proceso (SQLite + mongomock)")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=20, help="Repeticiones de cada escenario por usuario")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Subconjunto de {','.join(SCENARIOS)}")
+    parser.add_argument("--amount", default="1.00")
+    for layer in ("rate", "db", "mongo"):
+        parser.add_argument(f"--{layer}-latency", type=json.loads, metavar="JSON",
+                            help=f'Solo en proceso: perfil de latencia inyectada, p. ej. \'{{"distribution": "fixed", "mean": 0.5}}\'')
+    parser.add_argument("--output", help="Guardar el reporte JSON en este archivo")
+    parser.add_argument("--baseline", help="Reporte JSON previo con el que comparar p95")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Empeoramiento de p95 admitido (0.25 = 25%%)")
+    return parser.parse_args(argv)
+
+async def _run(args) -> dict:
+    scenarios = tuple(name for name in args.scenarios.split(",") if name)
+    latency = {"rate_latency": args.rate_latency, "db_latency": args.db_latency, "mongo_latency": args.mongo_latency}
+    async with bench_client(args.base_url, **latency) as (client, settle_seconds):
+        return await run_benchmark(client, users=args.users, concurrency=args.concurrency, rounds=args.rounds,
+                                   scenarios=scenarios, amount=Decimal(args.amount), settle_seconds=settle_seconds)
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    report = asyncio.run(_run(args))
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False) + "\n")
+
+    status = 0
+    if not report["consistency"]["conserved"]:
+        print("ERROR: los saldos totales no cuadran con las operaciones aceptadas", file=sys.stderr)
+        status = 1
+    if args.baseline:
+        regressions = compare(report, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for line in regressions:
+            print(f"REGRESIÓN: {line}", file=sys.stderr)
+        if regressions:
+            status = status or 2
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
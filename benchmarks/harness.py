@@ -0,0 +1,280 @@
+"""Benchmark de carga y consistencia contra las rutas reales de la app.
+
+Reemplaza al plan de JMeter sobre ``mock_api.py``: los escenarios del README
+(depósito + transferencia, conversiones de ida y vuelta, lectura del historial)
+se ejecutan contra la app FastAPI real, en proceso (SQLite + mongomock) o
+contra un servidor en ``--base-url``. Al final se verifica que los saldos
+totales de los usuarios del benchmark cuadren con el libro esperado.
+"""
+import asyncio
+import contextlib
+import random
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+from pathlib import Path
+from unittest.mock import patch
+
+import httpx
+import numpy as np
+from mongomock_motor import AsyncMongoMockClient
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.api.deps import get_db
+from app.core.config import IDENTITY_CACHE_TTL_SECONDS
+from app.core.currency_client import CurrencyAPIAdapter, LocalStubRateAdapter, currency_api_client
+from app.core.database import Base, TimedAsyncSession
+from app.core.fakes import LatencyInjector, LatencyInjectingCollection, latency_session_class
+from app.core.money import convert_amount
+from app.crud import transaction as crud_transaction
+from app.crud.outbox import OutboxRelay
+from app.crud.transaction import TransactionLogWriter
+from app.main import app
+from app.models import outbox, idempotency, wallet  # noqa: F401  (registra tablas)
+import mock_api
+
+SCENARIOS = ("deposit_transfer", "round_trip", "history")
+# Tasa fija del proveedor en proceso (USD base)
+BENCH_RATES = {"USD": 1.0, "PEN": 3.7512}
+
+class FixedRateAdapter(CurrencyAPIAdapter):
+    """Proveedor sin red con tasas fijas para el modo en proceso."""
+
+    def __init__(self, rates: dict = None):
+        self.rates = rates or BENCH_RATES
+
+    async def get_rates(self) -> dict:
+        return dict(self.rates)
+
+    def name(self) -> str:
+        return "Tasas fijas (benchmark)"
+
+class MongoMockLogWriter(TransactionLogWriter):
+    """Writer para mongomock, que no entiende los ``UpdateOne`` del pymongo
+    instalado: los mismos upserts por ``event_id``, uno por fila del outbox."""
+
+    async def upsert(self, batch):
+        for doc in batch:
+            await self.collection.update_one({"event_id": doc["event_id"]}, {"$setOnInsert": doc}, upsert=True)
+
+class Recorder:
+    """Latencias por endpoint y conteo de respuestas por tipo."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, endpoint: str, seconds: float, status: int):
+        self.latencies[endpoint].append(seconds)
+        self.statuses[endpoint][status] += 1
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        for endpoint, samples in sorted(self.latencies.items()):
+            p50, p95, p99 = np.percentile(np.array(samples) * 1000, [50, 95, 99])
+            statuses = self.statuses[endpoint]
+            endpoints[endpoint] = {
+                "requests": len(samples),
+                "rejected": sum(count for status, count in statuses.items() if 400 <= status < 500),
+                "errors": sum(count for status, count in statuses.items() if status >= 500),
+                "throughput_rps": round(len(samples) / elapsed, 2),
+                "p50_ms": round(float(p50), 3),
+                "p95_ms": round(float(p95), 3),
+                "p99_ms": round(float(p99), 3),
+            }
+        total = sum(len(samples) for samples in self.latencies.values())
+        return {"elapsed_s": round(elapsed, 3), "requests": total,
+                "throughput_rps": round(total / elapsed, 2), "endpoints": endpoints}
+
+class BenchRun:
+    """Estado de una ejecución: cliente, usuarios, libro esperado y latencias."""
+
+    def __init__(self, client: httpx.AsyncClient, amount: Decimal):
+        self.client = client
+        self.amount = amount
+        self.recorder = Recorder()
+        self.tokens = {}
+        # Saldo total esperado por moneda; solo se actualiza con respuestas 200
+        self.ledger = defaultdict(Decimal)
+
+    async def call(self, endpoint: str, method: str, url: str, username: str = None, **kwargs) -> httpx.Response:
+        headers = {"Authorization": f"Bearer {self.tokens[username]}"} if username else {}
+        started = time.perf_counter()
+        response = await self.client.request(method, url, headers=headers, **kwargs)
+        self.recorder.record(endpoint, time.perf_counter() - started, response.status_code)
+        return response
+
+    async def balances(self, username: str) -> dict:
+        response = await self.client.get("/users/me/balance/",
+                                          headers={"Authorization": f"Bearer {self.tokens[username]}"})
+        response.raise_for_status()
+        return {currency: Decimal(str(value)) for currency, value in response.json()["balances"].items()}
+
+    async def totals(self) -> dict:
+        totals = defaultdict(Decimal)
+        for balances in await asyncio.gather(*(self.balances(username) for username in self.tokens)):
+            for currency_code, balance in balances.items():
+                totals[currency_code] += balance
+        return dict(totals)
+
+async def _setup_users(run: BenchRun, count: int):
+    prefix = f"bench_{uuid.uuid4().hex[:8]}"
+    for index in range(count):
+        username = f"{prefix}_{index}"
+        (await run.client.post("/auth/register/", json={"username": username})).raise_for_status()
+        response = await run.client.post("/auth/token/", data={"username": username, "password": "bench"})
+        response.raise_for_status()
+        run.tokens[username] = response.json()["access_token"]
+    for currency_code, total in (await run.totals()).items():
+        run.ledger[currency_code] += total
+
+async def deposit_transfer(run: BenchRun, username: str):
+    """Escenario 1: depósito y transferencia a otro usuario del benchmark."""
+    response = await run.call("deposit", "POST", "/transfer/user/balance/change/", username,
+                              json={"operation": "deposit", "amount": str(run.amount), "currency": "USD"})
+    if response.status_code == 200:
+        run.ledger["USD"] += run.amount
+    receiver = random.choice([other for other in run.tokens if other != username])
+    await run.call("transfer", "POST", "/transfer/transfer/", username,
+                   json={"receiver": receiver, "amount": str(run.amount), "currency": "USD"})
+
+async def round_trip(run: BenchRun, username: str):
+    """Escenario 2: conversión USD->PEN y de vuelta, con cotización previa."""
+    amount = run.amount
+    for source, target in (("USD", "PEN"), ("PEN", "USD")):
+        quote = await run.call("quote", "POST", "/currency/quote/", username,
+                               json={"from_currency": source, "to_currency": target})
+        if quote.status_code != 200:
+            return
+        body = quote.json()
+        response = await run.call("convert", "POST", "/transfer/convert/", username,
+                                  json={"from_currency": source, "to_currency": target,
+                                        "amount": str(amount), "quote_id": body["quote_id"]})
+        if response.status_code != 200:
+            return
+        converted = convert_amount(amount, body["rate"])
+        run.ledger[source] -= amount
+        run.ledger[target] += converted
+        amount = converted
+
+async def history(run: BenchRun, username: str):
+    """Escenario 3: primera página del historial."""
+    await run.call("history", "GET", "/transactions/?limit=50", username)
+
+SCENARIO_FUNCTIONS = {"deposit_transfer": deposit_transfer, "round_trip": round_trip, "history": history}
+
+async def run_benchmark(client: httpx.AsyncClient, users: int = 10, concurrency: int = 16, rounds: int = 20,
+                        scenarios=SCENARIOS, amount: Decimal = Decimal("1.00"), settle_seconds: float = 0.0) -> dict:
+    """Ejecuta ``rounds`` veces cada escenario por usuario con ``concurrency``
+    operaciones en vuelo y devuelve el reporte con la verificación de saldos."""
+    if users < 2:
+        raise ValueError("Se necesitan al menos 2 usuarios para las transferencias")
+    run = BenchRun(client, amount)
+    await _setup_users(run, users)
+
+    jobs = [(SCENARIO_FUNCTIONS[name], username)
+            for _ in range(rounds) for name in scenarios for username in run.tokens]
+    random.shuffle(jobs)
+    limit = asyncio.Semaphore(concurrency)
+
+    async def worker(scenario, username):
+        async with limit:
+            await scenario(run, username)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(scenario, username) for scenario, username in jobs))
+    elapsed = time.perf_counter() - started
+
+    # Otro proceso puede servir /me/balance/ desde su caché de identidad
+    if settle_seconds:
+        await asyncio.sleep(settle_seconds)
+    actual = await run.totals()
+    expected = {code: total for code, total in run.ledger.items()}
+    report = run.recorder.report(elapsed)
+    report["config"] = {"users": users, "concurrency": concurrency, "rounds": rounds,
+                        "scenarios": list(scenarios), "amount": str(amount)}
+    report["consistency"] = {
+        "expected": {code: str(total) for code, total in sorted(expected.items())},
+        "actual": {code: str(total) for code, total in sorted(actual.items())},
+        "conserved": all(actual.get(code, Decimal(0)) == total for code, total in expected.items()),
+    }
+    return report
+
+@contextlib.asynccontextmanager
+async def in_process_app(workdir: str = None, rate_latency: dict = None, db_latency: dict = None,
+                         mongo_latency: dict = None):
+    """``app.main.app`` sobre SQLite (archivo) y mongomock, sin red.
+
+    Los perfiles ``*_latency`` (ver app/core/fakes.py) envuelven cada capa con
+    latencia y errores inyectados; con ``rate_latency`` las tasas vienen del
+    stub HTTP de mock_api.py en lugar del proveedor fijo.
+    """
+    async with contextlib.AsyncExitStack() as stack:
+        directory = workdir or stack.enter_context(tempfile.TemporaryDirectory())
+        engine = create_async_engine(f"sqlite+aiosqlite:///{Path(directory) / 'bench.db'}",
+                                     connect_args={"timeout": 30}, pool_size=32)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_class = TimedAsyncSession
+        if db_latency:
+            session_class = latency_session_class(TimedAsyncSession, LatencyInjector.from_config(db_latency))
+        factory = async_sessionmaker(bind=engine, class_=session_class,
+                                     autoflush=False, expire_on_commit=False)
+
+        collection = AsyncMongoMockClient()["coin_swap_bench"]["transactions"]
+        await crud_transaction.ensure_indexes(collection)
+        if mongo_latency:
+            collection = LatencyInjectingCollection(collection, LatencyInjector.from_config(mongo_latency))
+        writer = MongoMockLogWriter(collection)
+        relay = OutboxRelay(factory, writer, poll_interval=0.05)
+
+        stack.enter_context(patch.object(crud_transaction, "get_transactions_collection", return_value=collection))
+        adapters = {"fixed": FixedRateAdapter()}
+        if rate_latency:
+            stub = mock_api.create_app(LatencyInjector.from_config(rate_latency), BENCH_RATES)
+            stub_client = await stack.enter_async_context(
+                httpx.AsyncClient(transport=httpx.ASGITransport(app=stub), base_url="http://stub"))
+            stack.enter_context(patch("app.core.currency_client.get_http_client", return_value=stub_client))
+            adapters = {"stub": LocalStubRateAdapter("http://stub")}
+        stack.enter_context(patch.object(currency_api_client, "_adapters", adapters))
+        stack.enter_context(patch.object(currency_api_client, "_current_adapter_key", next(iter(adapters))))
+        currency_api_client.clear_cache()
+
+        async def override_get_db():
+            async with factory() as db:
+                yield db
+
+        # La app real (rutas y middlewares); ASGITransport no ejecuta su lifespan
+        stack.enter_context(patch.dict(app.dependency_overrides, {get_db: override_get_db}))
+
+        relay.start()
+        try:
+            yield app
+        finally:
+            await relay.stop()
+            currency_api_client.clear_cache()
+            await engine.dispose()
+
+@contextlib.asynccontextmanager
+async def bench_client(base_url: str = None, **latency):
+    """Cliente contra ``base_url`` o, sin ella, contra la app en proceso."""
+    if base_url:
+        async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+            yield client, IDENTITY_CACHE_TTL_SECONDS
+        return
+    async with in_process_app(**latency) as app:
+        # Las excepciones de la app se ven como 500, igual que detrás de uvicorn
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=30) as client:
+            yield client, 0.0
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """Endpoints cuyo p95 empeoró más que ``tolerance`` respecto al baseline."""
+    regressions = []
+    for endpoint, stats in report["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(endpoint)
+        if previous and stats["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{endpoint}: p95 {previous['p95_ms']} ms -> {stats['p95_ms']} ms")
+    return regressions
@@ -1,19 +1,81 @@
-from fastapi import FastAPI
+"""Stub local del proveedor de tasas con latencia configurable.
+
+Sirve ``/v6/latest/{base}`` con el formato de Open ER API, de modo que la app
+real lo consume con LocalStubRateAdapter (variable COIN_SWAP_RATE_STUB_URLS)
+y la caché, el pool HTTP, el hedging y el circuit breaker quedan en el camino.
+Por defecto responde en 500 ms fijos (el "modo caché" del README).
+
+    python mock_api.py [--port 8001] [--distribution lognormal --mean 0.2 --jitter 0.6]
+                       [--error-rate 0.05] [--timeout-rate 0.01 --timeout-seconds 30]
+
+El perfil se puede cambiar en caliente con PUT /latency/ para reproducir un
+incidente a mitad de una prueba de carga.
+"""
+import argparse
 import asyncio
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
+from app.core.config import RATE_STUB_LATENCY, RATE_STUB_PORT
+from app.core.fakes import ERROR, TIMEOUT, LatencyInjector
+
+# Tasas base USD que devuelve el stub
+STUB_RATES = {"USD": 1.0, "PEN": 3.7512, "EUR": 0.9231}
+
+def create_app(injector: LatencyInjector, rates: dict = None) -> FastAPI:
+    app = FastAPI(title="Stub de tasas de cambio")
+    app.state.injector = injector
+    app.state.rates = dict(rates or STUB_RATES)
+    app.state.requests = 0
+
+    @app.get("/v6/latest/{base}")
+    async def latest(base: str):
+        app.state.requests += 1
+        outcome, delay = app.state.injector.plan()
+        await asyncio.sleep(delay)
+        if outcome == ERROR:
+            return JSONResponse({"result": "error", "error-type": "injected"}, status_code=503)
+        rates = app.state.rates
+        if base not in rates:
+            return {"result": "error", "error-type": "unsupported-code"}
+        # Un timeout ya esperó timeout_seconds: el cliente debió cortar antes
+        if outcome == TIMEOUT:
+            raise HTTPException(504, "Timeout inyectado")
+        return {"result": "success", "base_code": base,
+                "rates": {code: rate / rates[base] for code, rate in rates.items()}}
+
+    @app.get("/latency/")
+    async def get_latency():
+        return {**app.state.injector.describe(), "requests": app.state.requests}
+
+    @app.put("/latency/")
+    async def set_latency(profile: dict):
+        try:
+            app.state.injector = LatencyInjector(**profile)
+        except (TypeError, ValueError) as e:
+            raise HTTPException(400, str(e))
+        return app.state.injector.describe()
+
+    return app
 
-app = FastAPI()
+app = create_app(LatencyInjector.from_config(RATE_STUB_LATENCY))
 
-@app.post("/transfer/user/balance/change/")
-async def deposit():
-    await asyncio.sleep(0.5)
-    return {"status": "ok", "message": "Deposit simulated"}
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Stub local de tasas de cambio con latencia inyectada")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=RATE_STUB_PORT)
+    parser.add_argument("--distribution", default=RATE_STUB_LATENCY.get("distribution", "fixed"),
+                        choices=LatencyInjector.DISTRIBUTIONS)
+    parser.add_argument("--mean", type=float, default=RATE_STUB_LATENCY.get("mean", 0.0))
+    parser.add_argument("--jitter", type=float, default=RATE_STUB_LATENCY.get("jitter", 0.0))
+    parser.add_argument("--error-rate", type=float, default=RATE_STUB_LATENCY.get("error_rate", 0.0))
+    parser.add_argument("--timeout-rate", type=float, default=RATE_STUB_LATENCY.get("timeout_rate", 0.0))
+    parser.add_argument("--timeout-seconds", type=float, default=RATE_STUB_LATENCY.get("timeout_seconds", 30.0))
+    return parser.parse_args(argv)
 
-@app.post("/transfer/transfer/")
-async def transfer():
-    await asyncio.sleep(0.5)
-    return {"status": "ok", "message": "Transfer simulated"}
+if __name__ == "__main__":
+    import uvicorn
 
-@app.post("/transfer/convert/")
-async def convert():
-    await asyncio.sleep(0.5)
-    return {"status": "ok", "message": "Conversion simulated"} 
\ No newline at end of file
+    args = _parse_args()
+    injector = LatencyInjector(args.distribution, args.mean, args.jitter,
+                               args.error_rate, args.timeout_rate, args.timeout_seconds)
+    uvicorn.run(create_app(injector), host=args.host, port=args.port)
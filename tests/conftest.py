@@ -0,0 +1,47 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest_asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from app.core.database import Base
+from app.models.user import UserDB
+from app.models.wallet import WalletDB
+from app.models import outbox, idempotency, quote  # noqa: F401
+
+CONCURRENCY = 32
+
+@pytest_asyncio.fixture
+async def session_factory(tmp_path):
+    """File-backed SQLite database (seeded with users X and Y and their wallets) shared by many concurrent sessions"""
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'coin_swap.db'}",
+        connect_args={"timeout": 30},
+        pool_size=CONCURRENCY,
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    async with factory() as db:
+        db.add_all([UserDB(id=1, username="X"), UserDB(id=2, username="Y")])
+        db.add_all([
+            WalletDB(user_id=1, currency="PEN", balance=100), WalletDB(user_id=1, currency="USD", balance=200),
+            WalletDB(user_id=2, currency="PEN", balance=50), WalletDB(user_id=2, currency="USD", balance=100),
+        ])
+        await db.commit()
+    yield factory
+    await engine.dispose()
+
+async def wallet_balances(factory):
+    """{username: (PEN, USD)} read straight from the wallets table, shards summed"""
+    async with factory() as db:
+        rows = (await db.execute(
+            select(UserDB.username, WalletDB.currency, WalletDB.balance).join(WalletDB, WalletDB.user_id == UserDB.id)
+        )).all()
+    balances = {}
+    for username, currency, balance in rows:
+        wallets = balances.setdefault(username, {})
+        wallets[currency] = wallets.get(currency, 0) + balance
+    return {username: (wallets.get("PEN", 0), wallets.get("USD", 0)) for username, wallets in balances.items()}
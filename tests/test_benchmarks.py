@@ -0,0 +1,46 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import httpx
+import pytest
+from decimal import Decimal
+from benchmarks import harness
+
+@pytest.mark.asyncio
+async def test_in_process_benchmark_conserves_balances():
+    """Test that the README scenarios run against the real routes and balances add up"""
+    async with harness.bench_client() as (client, settle_seconds):
+        report = await harness.run_benchmark(client, users=4, concurrency=8, rounds=3, settle_seconds=settle_seconds)
+
+    assert report["consistency"]["conserved"] is True
+    assert set(report["endpoints"]) == {"deposit", "transfer", "quote", "convert", "history"}
+    for stats in report["endpoints"].values():
+        assert stats["errors"] == 0
+        assert stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"]
+
+@pytest.mark.asyncio
+async def test_in_process_app_serves_history_from_relay():
+    """Test that operations made through the app show up in the paginated history"""
+    async with harness.in_process_app() as app:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            run = harness.BenchRun(client, Decimal("2.00"))
+            await harness._setup_users(run, 2)
+            username = next(iter(run.tokens))
+            await harness.deposit_transfer(run, username)
+
+            for _ in range(50):
+                page = (await run.call("history", "GET", "/transactions/", username)).json()
+                if len(page["items"]) == 2:
+                    break
+                await asyncio.sleep(0.05)
+    assert len(page["items"]) == 2
+
+def test_compare_flags_p95_regressions():
+    """Test that only endpoints slower than the tolerance are reported"""
+    baseline = {"endpoints": {"convert": {"p95_ms": 10.0}, "history": {"p95_ms": 10.0}}}
+    report = {"endpoints": {"convert": {"p95_ms": 14.0}, "history": {"p95_ms": 11.0}, "quote": {"p95_ms": 1.0}}}
+    assert harness.compare(report, baseline, tolerance=0.25) == ["convert: p95 10.0 ms -> 14.0 ms"]
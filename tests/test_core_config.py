@@ -0,0 +1,84 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+from pydantic import ValidationError
+from app.core.config import PROFILES, Settings, load_settings
+
+def test_defaults_to_dev_profile():
+    """Test that an empty environment yields the dev profile with the library-default Mongo write concern"""
+    settings = load_settings({})
+
+    assert settings == Settings()
+    assert "w" not in settings.mongo_client_options()
+
+def test_profile_then_env_overrides():
+    """Test that COIN_SWAP_* variables are typed and applied on top of the selected profile"""
+    # Act
+    settings = load_settings({
+        "COIN_SWAP_PROFILE": "high-throughput",
+        "COIN_SWAP_DB_POOL_SIZE": "3",
+        "COIN_SWAP_HTTP_HTTP2": "true",
+        "OTHER_APP_DB_POOL_SIZE": "99",
+    })
+
+    # Assert: Profile values kept, overrides converted to their field types
+    assert settings.db_pool_recycle_seconds == PROFILES["high-throughput"]["db_pool_recycle_seconds"]
+    assert settings.db_pool_size == 3
+    assert settings.http_http2 is True
+    assert settings.mongo_client_options()["w"] == "majority"
+
+def test_unknown_profile_or_variable_is_rejected():
+    """Test that typos fail loudly instead of silently falling back to defaults"""
+    with pytest.raises(ValueError):
+        load_settings({"COIN_SWAP_PROFILE": "prod"})
+    with pytest.raises(ValidationError):
+        load_settings({"COIN_SWAP_DB_POOLSIZE": "3"})
+    with pytest.raises(ValidationError):
+        load_settings({"COIN_SWAP_DB_POOL_SIZE": "0"})
+
+def test_warm_connections_must_fit_the_pool():
+    """Test that warming more connections than pool_size + max_overflow is rejected at load time"""
+    assert load_settings({"COIN_SWAP_DB_POOL_SIZE": "2", "COIN_SWAP_DB_MAX_OVERFLOW": "3",
+                          "COIN_SWAP_DB_POOL_WARM_CONNECTIONS": "5"}).db_pool_warm_connections == 5
+    with pytest.raises(ValidationError):
+        load_settings({"COIN_SWAP_DB_POOL_SIZE": "2", "COIN_SWAP_DB_MAX_OVERFLOW": "0"})
+
+def test_every_profile_is_valid():
+    """Test that each shipped profile builds a Settings object"""
+    for name in PROFILES:
+        assert isinstance(load_settings({"COIN_SWAP_PROFILE": name}), Settings)
+
+def test_profiling_is_configured_from_the_environment():
+    """Test that profiling is off by default and enabled, sampled and secured via COIN_SWAP_* variables"""
+    assert load_settings({}).profiling_enabled is False
+    settings = load_settings({
+        "COIN_SWAP_PROFILING_ENABLED": "true",
+        "COIN_SWAP_PROFILING_SAMPLE_RATE": "0.01",
+        "COIN_SWAP_PROFILING_SECRET": "s3creto",
+    })
+    assert (settings.profiling_enabled, settings.profiling_sample_rate, settings.profiling_secret) == (True, 0.01, "s3creto")
+    with pytest.raises(ValidationError):
+        load_settings({"COIN_SWAP_PROFILING_SAMPLE_RATE": "2"})
+
+def test_fakes_are_configured_from_the_environment():
+    """Test that rate stubs and injected latencies are off by default and read as JSON from COIN_SWAP_* variables"""
+    # Arrange
+    defaults = load_settings({})
+
+    # Act
+    settings = load_settings({
+        "COIN_SWAP_RATE_STUB_URLS": '{"stub": "http://127.0.0.1:8001"}',
+        "COIN_SWAP_FAKE_DB_LATENCY": '{"distribution": "lognormal", "mean": 0.02, "jitter": 0.8}',
+        "COIN_SWAP_FAKE_MONGO_LATENCY": '{"mean": 0.05, "error_rate": 0.01}',
+    })
+
+    # Assert
+    assert (defaults.rate_stub_urls, defaults.fake_db_latency, defaults.fake_mongo_latency) == ({}, None, None)
+    assert settings.rate_stub_urls == {"stub": "http://127.0.0.1:8001"}
+    assert settings.fake_db_latency == {"distribution": "lognormal", "mean": 0.02, "jitter": 0.8}
+    assert settings.fake_mongo_latency == {"mean": 0.05, "error_rate": 0.01}
+    with pytest.raises(ValidationError):
+        load_settings({"COIN_SWAP_RATE_STUB_URLS": '["http://127.0.0.1:8001"]'})
@@ -3,6 +3,8 @@ import os
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import asyncio
+import contextlib
 import pytest
 from unittest.mock import AsyncMock, patch, MagicMock
 from app.core import currency_client
@@ -12,9 +14,9 @@ from fastapi import HTTPException
 async def test_exchangerate_api_com_adapter_success():
     """Test successful currency rate retrieval from ExchangeRate-API.com"""
     # Arrange: Mock the HTTP client and response
-    with patch('app.core.currency_client.httpx.AsyncClient') as mock_client_class:
+    with patch('app.core.currency_client.get_http_client') as mock_get_client:
         mock_client = AsyncMock()
-        mock_client_class.return_value.__aenter__.return_value = mock_client
+        mock_get_client.return_value = mock_client
         mock_response = MagicMock()
         mock_response.json.return_value = {"rates": {"USD": 1.0, "PEN": 3.7}}
         mock_client.get.return_value = mock_response
@@ -31,9 +33,9 @@ async def test_exchangerate_api_com_adapter_success():
 async def test_exchangerate_api_com_adapter_unsupported_currency():
     """Test handling of unsupported currency in ExchangeRate-API.com adapter"""
     # Arrange: Mock the HTTP client with limited currency support
-    with patch('app.core.currency_client.httpx.AsyncClient') as mock_client_class:
+    with patch('app.core.currency_client.get_http_client') as mock_get_client:
         mock_client = AsyncMock()
-        mock_client_class.return_value.__aenter__.return_value = mock_client
+        mock_get_client.return_value = mock_client
         mock_response = MagicMock()
         mock_response.json.return_value = {"rates": {"USD": 1.0}}  # PEN not available
         mock_client.get.return_value = mock_response
@@ -49,9 +51,9 @@ async def test_exchangerate_api_com_adapter_unsupported_currency():
 async def test_open_er_api_adapter_success():
     """Test successful currency rate retrieval from Open ER API"""
     # Arrange: Mock the HTTP client and response
-    with patch('app.core.currency_client.httpx.AsyncClient') as mock_client_class:
+    with patch('app.core.currency_client.get_http_client') as mock_get_client:
         mock_client = AsyncMock()
-        mock_client_class.return_value.__aenter__.return_value = mock_client
+        mock_get_client.return_value = mock_client
         mock_response = MagicMock()
         mock_response.json.return_value = {"result": "success", "rates": {"USD": 1.0, "PEN": 3.7}}
         mock_client.get.return_value = mock_response
@@ -68,9 +70,9 @@ async def test_open_er_api_adapter_success():
 async def test_open_er_api_adapter_failure():
     """Test handling of API failure response from Open ER API"""
     # Arrange: Mock the HTTP client with failure response
-    with patch('app.core.currency_client.httpx.AsyncClient') as mock_client_class:
+    with patch('app.core.currency_client.get_http_client') as mock_get_client:
         mock_client = AsyncMock()
-        mock_client_class.return_value.__aenter__.return_value = mock_client
+        mock_get_client.return_value = mock_client
         mock_response = MagicMock()
         mock_response.json.return_value = {"result": "error"}  # API failure
         mock_client.get.return_value = mock_response
@@ -85,9 +87,9 @@ async def test_open_er_api_adapter_failure():
 async def test_open_er_api_adapter_unsupported_currency():
     """Test handling of unsupported currency in Open ER API adapter"""
     # Arrange: Mock the HTTP client with limited currency support
-    with patch('app.core.currency_client.httpx.AsyncClient') as mock_client_class:
+    with patch('app.core.currency_client.get_http_client') as mock_get_client:
         mock_client = AsyncMock()
-        mock_client_class.return_value.__aenter__.return_value = mock_client
+        mock_get_client.return_value = mock_client
         mock_response = MagicMock()
         mock_response.json.return_value = {"result": "success", "rates": {"USD": 1.0}}  # PEN not available
         mock_client.get.return_value = mock_response
@@ -132,13 +134,14 @@ def test_currency_api_client_select_invalid_adapter():
 async def test_currency_api_client_get_rate():
     """Test getting exchange rate through the singleton client"""
     # Arrange: Mock the HTTP client and set adapter
-    with patch('app.core.currency_client.httpx.AsyncClient') as mock_client_class:
+    with patch('app.core.currency_client.get_http_client') as mock_get_client:
         mock_client = AsyncMock()
-        mock_client_class.return_value.__aenter__.return_value = mock_client
+        mock_get_client.return_value = mock_client
         mock_response = MagicMock()
         mock_response.json.return_value = {"rates": {"USD": 1.0, "PEN": 3.7}}
         mock_client.get.return_value = mock_response
         client = currency_client.CurrencyAPIClientSingleton()
+        client.clear_cache()
         # Set to use the adapter we're mocking
         client.select_adapter("exchangerateapi")
         
@@ -152,14 +155,15 @@ async def test_currency_api_client_get_rate():
 async def test_currency_api_client_list_all_rates():
     """Test getting rates from all available adapters"""
     # Arrange: Mock the HTTP client for all adapters
-    with patch('app.core.currency_client.httpx.AsyncClient') as mock_client_class:
+    with patch('app.core.currency_client.get_http_client') as mock_get_client:
         mock_client = AsyncMock()
-        mock_client_class.return_value.__aenter__.return_value = mock_client
+        mock_get_client.return_value = mock_client
         mock_response = MagicMock()
         # Mock response that works for both adapters
         mock_response.json.return_value = {"result": "success", "rates": {"USD": 1.0, "PEN": 3.7}}
         mock_client.get.return_value = mock_response
         client = currency_client.CurrencyAPIClientSingleton()
+        client.clear_cache()
         
         # Act: Get rates from all adapters
         result = await client.list_all_rates("USD", "PEN")
@@ -168,4 +172,353 @@ async def test_currency_api_client_list_all_rates():
         assert "ExchangeRate-API.com (public)" in result
         assert "Open ER API (public)" in result
         assert isinstance(result["ExchangeRate-API.com (public)"], float)
-        assert isinstance(result["Open ER API (public)"], float) 
\ No newline at end of file
+        assert isinstance(result["Open ER API (public)"], float) 
+
+@pytest.mark.asyncio
+async def test_rate_cache_hit_avoids_second_fetch():
+    """Test that a fresh cache entry is served without calling the provider again"""
+    # Arrange: Cache with a long TTL and a counting fetcher
+    cache = currency_client.RateCache(ttl=60, max_stale=60)
+    fetch = AsyncMock(return_value=3.7)
+
+    # Act: Request the same key twice
+    first = await cache.get(("a", "USD", "PEN"), fetch)
+    second = await cache.get(("a", "USD", "PEN"), fetch)
+
+    # Assert: Only one upstream call, one miss and one hit
+    assert first == second == 3.7
+    assert fetch.await_count == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["hits"] == 1
+
+@pytest.mark.asyncio
+async def test_rate_cache_collapses_concurrent_misses():
+    """Test that concurrent misses for the same key share a single upstream fetch"""
+    # Arrange: Slow fetcher so all callers overlap
+    cache = currency_client.RateCache(ttl=60, max_stale=60)
+    calls = 0
+
+    async def slow_fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return 3.7
+
+    # Act: Fire many concurrent lookups
+    results = await asyncio.gather(*[cache.get(("a", "USD", "PEN"), slow_fetch) for _ in range(20)])
+
+    # Assert: Every caller got the value from one fetch
+    assert results == [3.7] * 20
+    assert calls == 1
+
+@pytest.mark.asyncio
+async def test_rate_cache_serves_stale_while_refreshing():
+    """Test that an expired entry is served immediately and refreshed in the background"""
+    # Arrange: TTL of zero makes every stored entry stale at once
+    cache = currency_client.RateCache(ttl=0, max_stale=60)
+    await cache.get(("a", "USD", "PEN"), AsyncMock(return_value=3.7))
+    refresh = AsyncMock(return_value=3.8)
+
+    # Act: Read the stale entry and let the background refresh run
+    stale = await cache.get(("a", "USD", "PEN"), refresh)
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+    # Assert: Old value served, refresh stored the new one
+    assert stale == 3.7
+    assert refresh.await_count == 1
+    assert cache.stats()["stale_hits"] == 1
+    assert cache.stats()["refreshes"] == 1
+    assert cache._entries[("a", "USD", "PEN")][0] == 3.8
+
+@pytest.mark.asyncio
+async def test_rate_cache_does_not_store_errors():
+    """Test that a failed fetch propagates and leaves no cache entry behind"""
+    # Arrange: Fetcher that fails
+    cache = currency_client.RateCache(ttl=60, max_stale=60)
+    fetch = AsyncMock(side_effect=HTTPException(400, "Moneda no soportada"))
+
+    # Act & Assert: Error reaches the caller and nothing is cached
+    with pytest.raises(HTTPException):
+        await cache.get(("a", "USD", "XXX"), fetch)
+    assert cache.stats()["size"] == 0
+
+@pytest.mark.asyncio
+async def test_shared_http_client_is_reused_and_closed():
+    """Test that adapters share one pooled client until it is closed"""
+    # Arrange: Start from a clean module state
+    await currency_client.close_http_client()
+
+    # Act: Fetch the client twice, then close it
+    first = currency_client.get_http_client()
+    second = currency_client.get_http_client()
+    await currency_client.close_http_client()
+
+    # Assert: Same instance reused, closed on shutdown and rebuilt afterwards
+    assert first is second
+    assert first.is_closed
+    rebuilt = currency_client.get_http_client()
+    assert rebuilt is not first
+    await currency_client.close_http_client()
+
+def test_build_http_client_falls_back_without_h2():
+    """Test that HTTP/2 is only requested when the optional h2 package is present"""
+    # Arrange: Enable HTTP/2 but pretend h2 is missing
+    with patch('app.core.currency_client.HTTP_HTTP2', True), \
+         patch('app.core.currency_client._http2_available', return_value=False), \
+         patch('app.core.currency_client.httpx.AsyncClient') as mock_client_class:
+        # Act: Build the shared client
+        currency_client.build_http_client()
+
+        # Assert: Client built with HTTP/1.1 only
+        assert mock_client_class.call_args.kwargs["http2"] is False
+
+def _fake_adapter(name, rate=3.7, delay=0.0, error=None):
+    adapter = MagicMock()
+    adapter.name.return_value = name
+
+    async def get_rates():
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return {"USD": 1.0, "PEN": rate}
+
+    adapter.get_rates = AsyncMock(side_effect=get_rates)
+    return adapter
+
+@pytest.mark.asyncio
+async def test_list_all_rates_returns_partial_results_on_deadline():
+    """Test that a hanging provider is reported as timed out without blocking the others"""
+    # Arrange: One fast adapter and one that never answers in time
+    client = currency_client.CurrencyAPIClientSingleton()
+    client.clear_cache()
+    adapters = {"fast": _fake_adapter("Fast", rate=3.7), "slow": _fake_adapter("Slow", delay=5)}
+    with patch.object(client, '_adapters', adapters), \
+         patch('app.core.currency_client.RATE_ADAPTER_TIMEOUT_SECONDS', 0.05):
+        # Act: Query every adapter concurrently
+        result = await client.list_all_rates("USD", "PEN")
+
+    # Assert: Fast result present, slow one flagged as timeout
+    assert result["Fast"] == 3.7
+    assert "tiempo de espera" in result["Slow"]
+    client.clear_cache()
+
+@pytest.mark.asyncio
+async def test_hedged_get_rate_uses_backup_when_primary_is_slow():
+    """Test that a hedged lookup answers from the backup adapter when the primary stalls"""
+    # Arrange: Slow primary, fast backup and a short hedge delay
+    client = currency_client.CurrencyAPIClientSingleton()
+    client.clear_cache()
+    adapters = {"primary": _fake_adapter("P", rate=1.0, delay=5), "backup": _fake_adapter("B", rate=2.0)}
+    with patch.object(client, '_adapters', adapters), \
+         patch.object(client, '_current_adapter_key', "primary"), \
+         patch.object(client, 'hedge_delay', return_value=0.01):
+        # Act: Request a hedged rate
+        result = await client.get_rate("USD", "PEN", hedged=True)
+
+    # Assert: Backup answer wins
+    assert result == 2.0
+    client.clear_cache()
+
+@pytest.mark.asyncio
+async def test_hedged_get_rate_fails_over_on_primary_error():
+    """Test that a failing primary immediately triggers the backup adapter"""
+    # Arrange: Primary raises, backup succeeds; hedge delay is long
+    client = currency_client.CurrencyAPIClientSingleton()
+    client.clear_cache()
+    adapters = {
+        "primary": _fake_adapter("P", error=HTTPException(500, "caído")),
+        "backup": _fake_adapter("B", rate=2.0),
+    }
+    with patch.object(client, '_adapters', adapters), \
+         patch.object(client, '_current_adapter_key', "primary"), \
+         patch.object(client, 'hedge_delay', return_value=10):
+        # Act: Request a hedged rate
+        result = await client.get_rate("USD", "PEN", hedged=True)
+
+    # Assert: Backup answer is returned without waiting for the delay
+    assert result == 2.0
+    client.clear_cache()
+
+def test_hedge_delay_uses_latency_percentile():
+    """Test that the hedge delay follows the recorded latency percentile"""
+    # Arrange: 100 latency samples from 0.01 to 1.00 seconds
+    client = currency_client.CurrencyAPIClientSingleton()
+    health = currency_client.AdapterHealth()
+    health.latencies.extend(i / 100 for i in range(1, 101))
+    with patch.dict(client._health, {"exchangerateapi": health}):
+        # Act & Assert: p95 of the samples is used
+        assert client.hedge_delay("exchangerateapi") == pytest.approx(0.96)
+    # Without enough samples the default delay applies
+    assert client.hedge_delay("unknown") == currency_client.RATE_HEDGE_DEFAULT_DELAY_SECONDS
+
+def test_cross_rate_derives_any_pair_from_base_table():
+    """Test that any pair is derived locally from a base-USD table"""
+    # Arrange: USD-based table
+    rates = {"USD": 1.0, "PEN": 3.75, "EUR": 0.9}
+
+    # Act & Assert: Direct, inverse and cross pairs
+    assert currency_client.cross_rate(rates, "USD", "PEN") == pytest.approx(3.75)
+    assert currency_client.cross_rate(rates, "PEN", "USD") == pytest.approx(1 / 3.75)
+    assert currency_client.cross_rate(rates, "EUR", "PEN") == pytest.approx(3.75 / 0.9)
+    with pytest.raises(HTTPException) as exc_info:
+        currency_client.cross_rate(rates, "USD", "XXX")
+    assert exc_info.value.status_code == 400
+
+@pytest.mark.asyncio
+async def test_many_pairs_cost_one_upstream_fetch():
+    """Test that several currency pairs are served from a single stored table"""
+    # Arrange: One adapter with a multi-currency table
+    client = currency_client.CurrencyAPIClientSingleton()
+    client.clear_cache()
+    adapter = MagicMock()
+    adapter.get_rates = AsyncMock(return_value={"USD": 1.0, "PEN": 3.75, "EUR": 0.9})
+    with patch.dict(client._adapters, {"exchangerateapi": adapter}), \
+         patch.object(client, '_current_adapter_key', "exchangerateapi"):
+        # Act: Ask for several pairs and the whole PEN-based table
+        usd_pen = await client.get_rate("USD", "PEN", hedged=False)
+        pen_usd = await client.get_rate("PEN", "USD", hedged=False)
+        table = await client.get_rates_table("PEN")
+
+    # Assert: All answers derived from one upstream request
+    assert usd_pen == pytest.approx(3.75)
+    assert pen_usd == pytest.approx(1 / 3.75)
+    assert table["PEN"] == pytest.approx(1.0)
+    assert table["EUR"] == pytest.approx(0.9 / 3.75)
+    assert adapter.get_rates.await_count == 1
+    client.clear_cache()
+
+def test_circuit_breaker_opens_and_half_opens():
+    """Test breaker transitions: closed, open after repeated failures, half-open after cooldown"""
+    # Arrange: Breaker that opens after two failures
+    breaker = currency_client.CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    # Act & Assert: Failures open it, cooldown half-opens it, success closes it
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.available
+    with patch('app.core.currency_client.time.monotonic', return_value=breaker._opened_at + 61):
+        assert breaker.state == "half_open"
+        breaker.record_success()
+    assert breaker.state == "closed"
+
+@pytest.mark.asyncio
+async def test_get_rate_fails_over_when_selected_adapter_breaker_is_open():
+    """Test that requests read from the healthiest adapter once the selected one trips"""
+    # Arrange: Selected adapter keeps failing, backup is healthy
+    client = currency_client.CurrencyAPIClientSingleton()
+    client.clear_cache()
+    adapters = {
+        "primary": _fake_adapter("P", error=HTTPException(500, "caído")),
+        "backup": _fake_adapter("B", rate=2.0),
+    }
+    health = {"primary": currency_client.AdapterHealth(), "backup": currency_client.AdapterHealth()}
+    with patch.object(client, '_adapters', adapters), \
+         patch.object(client, '_health', health), \
+         patch.object(client, '_current_adapter_key', "primary"):
+        # Act: Background refresh trips the primary breaker
+        for _ in range(currency_client.RATE_BREAKER_FAILURE_THRESHOLD):
+            await client.refresh_all()
+        result = await client.get_rate("USD", "PEN", hedged=False)
+
+        # Assert: Backup is now active and answered
+        assert health["primary"].breaker.state == "open"
+        assert client.get_active_adapter_key() == "backup"
+        assert result == 2.0
+    client.clear_cache()
+
+@pytest.mark.asyncio
+async def test_refresher_keeps_hot_path_off_the_network():
+    """Test that after a background refresh, get_rate is served without upstream calls"""
+    # Arrange: Healthy adapter
+    client = currency_client.CurrencyAPIClientSingleton()
+    client.clear_cache()
+    adapter = _fake_adapter("A", rate=3.7)
+    with patch.object(client, '_adapters', {"a": adapter}), \
+         patch.object(client, '_health', {"a": currency_client.AdapterHealth()}), \
+         patch.object(client, '_current_adapter_key', "a"):
+        # Act: Start the refresher, let it run once, then read rates
+        client.start_refresher(interval=60)
+        await asyncio.sleep(0.01)
+        rate = await client.get_rate("USD", "PEN", hedged=False)
+        await client.stop_refresher()
+
+    # Assert: Only the refresher hit the provider
+    assert rate == 3.7
+    assert adapter.get_rates.await_count == 1
+    client.clear_cache()
+
+@pytest.mark.asyncio
+async def test_broadcast_hub_publishes_only_changes_and_keeps_latest():
+    """Test that the hub skips identical snapshots and a slow subscriber only holds the newest one"""
+    hub = currency_client.RateBroadcastHub()
+    with hub.subscribe() as queue:
+        # Act: Same snapshot twice, then two changes the subscriber never read
+        assert hub.publish({"A": {"USD": 1.0, "PEN": 3.7}}) is True
+        assert hub.publish({"A": {"USD": 1.0, "PEN": 3.7}}) is False
+        hub.publish({"A": {"USD": 1.0, "PEN": 3.8}})
+        hub.publish({"A": {"USD": 1.0, "PEN": 3.9}})
+
+        # Assert
+        assert queue.qsize() == 1
+        assert (await queue.get())["A"]["PEN"] == 3.9
+        assert hub.subscribers == 1
+    assert hub.subscribers == 0
+
+    with hub.subscribe() as late:
+        assert late.get_nowait() == hub.latest
+
+@pytest.mark.asyncio
+async def test_refresh_fans_out_without_extra_upstream_calls():
+    """Test that one refresh reaches every subscriber with a single provider call"""
+    # Arrange: Fifty open streams on one adapter
+    client = currency_client.CurrencyAPIClientSingleton()
+    client.clear_cache()
+    adapter = _fake_adapter("A", rate=3.7)
+    with patch.object(client, '_adapters', {"a": adapter}), \
+         patch.object(client, '_health', {"a": currency_client.AdapterHealth()}), \
+         patch.object(client, '_hub', currency_client.RateBroadcastHub()):
+        with contextlib.ExitStack() as stack:
+            queues = [stack.enter_context(client.subscribe()) for _ in range(50)]
+
+            # Act: Two refreshes returning the same table
+            await client.refresh_all()
+            await client.refresh_all()
+
+            # Assert: Everyone got the table once, the provider was asked once per refresh
+            assert all(q.get_nowait() == {"A": {"USD": 1.0, "PEN": 3.7}} for q in queues)
+            assert all(q.empty() for q in queues)
+            assert adapter.get_rates.await_count == 2
+    client.clear_cache()
+
+@pytest.mark.asyncio
+async def test_stream_sends_pair_only_when_it_changes():
+    """Test that the SSE stream emits the current pair, skips unrelated changes and ends at its deadline"""
+    # Arrange
+    client = currency_client.CurrencyAPIClientSingleton()
+    hub = currency_client.RateBroadcastHub()
+    hub.publish({"A": {"USD": 1.0, "PEN": 3.7, "EUR": 0.9}})
+    events = []
+
+    async def consume():
+        async for event in currency_client.stream_rate_events("USD", "PEN", keepalive=0.05, max_seconds=0.5):
+            events.append(event)
+
+    with patch.object(client, '_hub', hub):
+        task = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.01)
+
+        # Act: EUR moves (USD/PEN does not), then PEN moves
+        hub.publish({"A": {"USD": 1.0, "PEN": 3.7, "EUR": 0.95}})
+        await asyncio.sleep(0.01)
+        hub.publish({"A": {"USD": 1.0, "PEN": 3.8, "EUR": 0.95}})
+        await asyncio.wait_for(task, 2)
+
+    # Assert
+    data = [event for event in events if event.startswith("event: rates")]
+    assert events[0].startswith("retry:")
+    assert data == ['event: rates\ndata: {"A": 3.7}\n\n', 'event: rates\ndata: {"A": 3.8}\n\n']
+    assert ": keep-alive\n\n" in events
+    assert hub.subscribers == 0
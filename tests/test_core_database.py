@@ -0,0 +1,101 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import subprocess
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from pymongo.errors import OperationFailure
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from app import cli
+from app.core import database
+from app.models.user import UserDB
+from conftest import wallet_balances
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+def test_importing_app_opens_no_connections():
+    """Test that importing app.main builds no engine, Mongo client or tables"""
+    # Act: Import the app in a fresh interpreter (no Postgres or Mongo available)
+    code = ("import app.main\n"
+            "from app.core import database\n"
+            "print(database._async_engine is None, database._mongo_client is None)")
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, timeout=60)
+
+    # Assert
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["True", "True"]
+
+def test_metrics_scrape_does_not_build_the_engine():
+    """Test that the pool gauges report NaN instead of creating the engine"""
+    code = ("import app.main\n"
+            "from app.core import database\n"
+            "from app.core.metrics import registry\n"
+            "text = registry.render()\n"
+            "print(database._async_engine is None, 'db_pool_size NaN' in text)")
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, timeout=60)
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["True", "True"]
+
+@pytest.mark.asyncio
+async def test_startup_survives_failed_index_creation(monkeypatch):
+    """Test that the app still starts when Mongo answers the ping but index creation fails"""
+    # Arrange: Every dependency stubbed; only ensure_indexes misbehaves
+    from app import main
+    for name in ("warm_up_database", "ping_mongo", "close_http_client", "close_connections"):
+        monkeypatch.setattr(main, name, AsyncMock())
+    monkeypatch.setattr(main, "get_http_client", MagicMock())
+    for name in ("refresh_all", "stop_refresher"):
+        monkeypatch.setattr(main.currency_api_client, name, AsyncMock())
+    monkeypatch.setattr(main.currency_api_client, "start_refresher", MagicMock())
+    for task in (main.outbox_relay, main.expired_rows_purger):
+        monkeypatch.setattr(task, "start", MagicMock())
+        monkeypatch.setattr(task, "stop", AsyncMock())
+    monkeypatch.setattr(main.transaction_log_writer, "ensure_indexes",
+                        AsyncMock(side_effect=OperationFailure("not authorized")))
+
+    # Act
+    async with main.lifespan(main.app):
+        started = main.outbox_relay.start.called
+
+    # Assert: The relay runs, and the writer will retry the indexes with its first batch
+    assert started
+    assert main.transaction_log_writer.indexes_ready is False
+
+@pytest.mark.asyncio
+async def test_warm_up_fills_the_pool(tmp_path):
+    """Test that warm_up_database leaves the requested connections open in the pool"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'warm.db'}",
+                                 poolclass=AsyncAdaptedQueuePool, pool_size=5)
+    try:
+        await database.warm_up_database(3, engine)
+
+        assert engine.pool.checkedin() == 3
+        assert engine.pool.checkedout() == 0
+    finally:
+        await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_cli_init_db_is_idempotent(tmp_path, monkeypatch):
+    """Test that init-db creates the schema, seeds X and Y once and applies hot accounts"""
+    # Arrange
+    monkeypatch.setattr(cli, "HOT_ACCOUNTS", ("Y",))
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'cli.db'}")
+    factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+    try:
+        # Act: Run it twice, as two deployments would
+        await cli.init_db(engine)
+        await cli.init_db(engine)
+
+        # Assert
+        async with factory() as db:
+            users = {u.username: u.balance_shards for u in (await db.execute(select(UserDB))).scalars()}
+        assert users == {"X": 1, "Y": cli.HOT_ACCOUNT_SHARDS}
+        assert await wallet_balances(factory) == {"X": (100, 200), "Y": (50, 100)}
+    finally:
+        await engine.dispose()
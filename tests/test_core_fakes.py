@@ -0,0 +1,94 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import time
+import httpx
+import pytest
+from unittest.mock import patch
+from mongomock_motor import AsyncMongoMockClient
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from app.core import fakes
+from app.core.currency_client import LocalStubRateAdapter, RateCache
+from app.crud.transaction import TransactionLogWriter
+import mock_api
+
+def test_injector_distributions_and_outcomes():
+    """Test that delays follow the configured distribution and outcomes the configured rates"""
+    assert fakes.LatencyInjector("fixed", mean=0.5).sample() == 0.5
+    uniform = fakes.LatencyInjector("uniform", mean=0.2, jitter=0.1, seed=1)
+    assert all(0.1 <= uniform.sample() <= 0.3 for _ in range(200))
+
+    injector = fakes.LatencyInjector("exponential", mean=0.01, error_rate=0.2, timeout_rate=0.1, seed=7)
+    outcomes = [injector.plan()[0] for _ in range(5000)]
+    assert abs(outcomes.count(fakes.ERROR) / 5000 - 0.2) < 0.03
+    assert abs(outcomes.count(fakes.TIMEOUT) / 5000 - 0.1) < 0.03
+
+    with pytest.raises(ValueError):
+        fakes.LatencyInjector("gaussian")
+
+def _stub_client(injector):
+    stub = mock_api.create_app(injector)
+    return stub, httpx.AsyncClient(transport=httpx.ASGITransport(app=stub))
+
+@pytest.mark.asyncio
+async def test_stub_adapter_goes_through_real_cache():
+    """Test that the local stub is consumed by the real adapter and cached by RateCache"""
+    stub, client = _stub_client(fakes.LatencyInjector("fixed", mean=0.05))
+    adapter = LocalStubRateAdapter("http://stub")
+    cache = RateCache(ttl=60, max_stale=60)
+    with patch('app.core.currency_client.get_http_client', return_value=client):
+        started = time.perf_counter()
+        rates = await cache.get(("stub", "USD"), adapter.get_rates)
+        first = time.perf_counter() - started
+        await cache.get(("stub", "USD"), adapter.get_rates)
+    await client.aclose()
+
+    assert rates["PEN"] == mock_api.STUB_RATES["PEN"]
+    assert first >= 0.05
+    assert stub.state.requests == 1
+
+@pytest.mark.asyncio
+async def test_stub_injected_errors_reach_the_adapter():
+    """Test that injected provider errors surface as HTTP errors in the adapter"""
+    _, client = _stub_client(fakes.LatencyInjector(error_rate=1.0))
+    with patch('app.core.currency_client.get_http_client', return_value=client):
+        with pytest.raises(httpx.HTTPStatusError):
+            await LocalStubRateAdapter("http://stub").get_rates()
+    await client.aclose()
+
+@pytest.mark.asyncio
+async def test_latency_session_delays_and_fails_like_postgres(tmp_path):
+    """Test that the DB wrapper delays statements and raises driver-like errors"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'fake.db'}")
+    slow = async_sessionmaker(bind=engine, class_=fakes.latency_session_class(
+        AsyncSession, fakes.LatencyInjector("fixed", mean=0.05)))
+    broken = async_sessionmaker(bind=engine, class_=fakes.latency_session_class(
+        AsyncSession, fakes.LatencyInjector(error_rate=1.0)))
+
+    async with slow() as db:
+        started = time.perf_counter()
+        assert (await db.execute(text("SELECT 1"))).scalar() == 1
+        assert time.perf_counter() - started >= 0.05
+    async with broken() as db:
+        with pytest.raises(OperationalError):
+            await db.execute(text("SELECT 1"))
+    await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_latency_collection_feeds_writer_retries_and_cursors():
+    """Test that injected Mongo errors go through the writer's retry path and cursors still read"""
+    raw = AsyncMongoMockClient()["coin_swap"]["transactions"]
+    await raw.insert_one({"username": "X", "description": "hola"})
+
+    failing = fakes.LatencyInjectingCollection(raw, fakes.LatencyInjector(error_rate=1.0))
+    writer = TransactionLogWriter(failing, max_retries=2, retry_backoff=0)
+    assert await writer.write_batch([{"event_id": "e1", "username": "X"}]) is False
+    assert (writer.retries, writer.failed) == (2, 1)
+
+    slow = fakes.LatencyInjectingCollection(raw, fakes.LatencyInjector("fixed", mean=0.02))
+    docs = [doc async for doc in slow.find({"username": "X"}).sort("_id").limit(5)]
+    assert [doc["description"] for doc in docs] == ["hola"]
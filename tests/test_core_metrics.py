@@ -0,0 +1,90 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.core import metrics
+
+def test_histogram_renders_cumulative_buckets():
+    """Test that observations land in cumulative Prometheus buckets"""
+    histogram = metrics.Histogram("demo_seconds", "demo", ("operation",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "a")
+    histogram.observe(0.5, "a")
+    histogram.observe(5, "a")
+    text = "\n".join(histogram.render())
+    assert 'demo_seconds_bucket{operation="a",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{operation="a",le="1.0"} 2' in text
+    assert 'demo_seconds_bucket{operation="a",le="+Inf"} 3' in text
+    assert 'demo_seconds_count{operation="a"} 3' in text
+
+def test_gauge_failure_does_not_break_scrape():
+    """Test that a failing gauge reports NaN instead of raising"""
+    registry = metrics.MetricsRegistry()
+    registry.gauge("ok_value", "ok", lambda: 3)
+    registry.gauge("broken_value", "broken", lambda: 1 / 0)
+    text = registry.render()
+    assert "ok_value 3.0" in text
+    assert "broken_value NaN" in text
+
+def test_gauge_without_value_reports_nan():
+    """Test that a gauge returning None is published as NaN"""
+    registry = metrics.MetricsRegistry()
+    registry.gauge("missing_value", "missing", lambda: None)
+    assert "missing_value NaN" in registry.render()
+
+@pytest.mark.asyncio
+async def test_timed_records_even_on_error():
+    """Test that the decorator records the duration of failing coroutines too"""
+    metrics.OPERATION_LATENCY.clear()
+
+    @metrics.timed("demo_op")
+    async def failing():
+        await asyncio.sleep(0)
+        raise ValueError("x")
+
+    with pytest.raises(ValueError):
+        await failing()
+    assert metrics.OPERATION_LATENCY.snapshot()[("demo_op",)]["count"] == 1
+
+def test_middleware_labels_by_route_template():
+    """Test that request latency is keyed by method, route template and status"""
+    metrics.REQUEST_LATENCY.clear()
+    app = FastAPI()
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    def read_item(item_id: int):
+        return {"id": item_id}
+
+    client = TestClient(app)
+    client.get("/items/1")
+    client.get("/items/2")
+    client.get("/missing")
+
+    snapshot = metrics.REQUEST_LATENCY.snapshot()
+    assert snapshot[("GET", "/items/{item_id}", 200)]["count"] == 2
+    assert snapshot[("GET", "sin_ruta", 404)]["count"] == 1
+
+def test_middleware_skips_excluded_routes():
+    """Test that long-lived routes such as the SSE stream stay out of the histogram"""
+    metrics.REQUEST_LATENCY.clear()
+    app = FastAPI()
+    app.add_middleware(metrics.MetricsMiddleware, excluded_routes=("/stream/",))
+
+    @app.get("/stream/")
+    def stream():
+        return {}
+
+    @app.get("/ping")
+    def ping():
+        return {}
+
+    client = TestClient(app)
+    client.get("/stream/")
+    client.get("/ping")
+
+    assert set(metrics.REQUEST_LATENCY.snapshot()) == {("GET", "/ping", 200)}
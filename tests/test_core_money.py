@@ -0,0 +1,43 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from decimal import Decimal
+from app.core import money
+
+def test_quantize_uses_bankers_rounding():
+    """Test that amounts are rounded half-even to two decimals"""
+    assert money.quantize("0.125") == Decimal("0.12")
+    assert money.quantize("0.135") == Decimal("0.14")
+    assert money.quantize(0.1) == Decimal("0.10")
+
+def test_convert_amount_is_exact():
+    """Test that a conversion does not carry binary float error"""
+    # 0.1 USD * 3 would be 0.30000000000000004 in float arithmetic
+    assert money.convert_amount(Decimal("0.10"), 3) == Decimal("0.30")
+    assert money.convert_amount(Decimal("50.00"), 3.7512) == Decimal("187.56")
+
+def test_convert_amount_rounds_half_even():
+    """Test that conversions round exactly like Decimal arithmetic with bankers rounding"""
+    amounts = [Decimal(i).scaleb(-2) for i in range(1, 2001)]
+    converted = [money.convert_amount(amount, 0.26737) for amount in amounts]
+    expected = [(amount * Decimal("0.26737")).quantize(Decimal("0.01"), rounding="ROUND_HALF_EVEN") for amount in amounts]
+    assert converted == expected
+
+def test_convert_amount_is_exact_for_large_amounts():
+    """Test that amounts beyond int64 once scaled by the rate stay exact"""
+    assert money.convert_amount(Decimal(10 ** 15), 3.75) == Decimal(375 * 10 ** 13)
+
+def test_minor_units_round_trip():
+    """Test that amounts become an int64 vector of cents and back without loss"""
+    minor = money.to_minor_units([Decimal("0.10"), Decimal("12.34"), 5])
+    assert minor.dtype == np.int64
+    assert minor.tolist() == [10, 1234, 500]
+    assert [money.from_minor_unit(value) for value in minor] == [Decimal("0.10"), Decimal("12.34"), Decimal("5.00")]
+
+def test_total_has_no_drift():
+    """Test that summing many cents gives an exact total"""
+    assert money.total([Decimal("0.10")] * 10000) == Decimal("1000.00")
+    assert sum([0.1] * 10000) != 1000.0
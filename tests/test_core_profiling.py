@@ -0,0 +1,100 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import pstats
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api.routes import profiling as profiling_routes
+from app.core import profiling
+
+def _busy(n):
+    return sum(i * i for i in range(n))
+
+SECRET = "secreto-de-prueba"
+PROFILE = {"X-Profile": SECRET}
+
+def _client(store, sample_rate=0.0):
+    app = FastAPI()
+    app.add_middleware(profiling.ProfilingMiddleware, store=store, secret=SECRET, sample_rate=sample_rate)
+
+    @app.get("/slow/{n}")
+    async def slow(n: int):
+        await asyncio.sleep(0)
+        return {"total": _busy(n)}
+
+    return TestClient(app)
+
+def test_only_requests_with_header_are_profiled():
+    """Test that profiling is opt-in per request via the header carrying the secret"""
+    store = profiling.ProfileStore(5)
+    client = _client(store)
+
+    plain = client.get("/slow/1000")
+    wrong = client.get("/slow/1000", headers={"X-Profile": "1"})
+    profiled = client.get("/slow/1000", headers=PROFILE)
+
+    assert "x-profile-id" not in plain.headers
+    assert "x-profile-id" not in wrong.headers
+    profile = store.get(int(profiled.headers["x-profile-id"]))
+    assert profile["path"] == "/slow/{n}"
+    assert profile["status"] == 200
+    assert any(func[2] == "_busy" for func in profile["stats"])
+
+def test_sample_rate_profiles_without_header():
+    """Test that a sampling ratio of 1 profiles every request"""
+    store = profiling.ProfileStore(5)
+    client = _client(store, sample_rate=1.0)
+    client.get("/slow/10")
+    assert len(store.list()) == 1
+
+def test_ring_buffer_keeps_most_recent_profiles():
+    """Test that only the last N profiles are kept"""
+    store = profiling.ProfileStore(2)
+    client = _client(store)
+    ids = [int(client.get("/slow/10", headers=PROFILE).headers["x-profile-id"]) for _ in range(3)]
+    assert [p["id"] for p in store.list()] == [ids[2], ids[1]]
+    assert store.get(ids[0]) is None
+
+def test_downloads_as_pstats_and_speedscope(tmp_path, monkeypatch):
+    """Test that a stored profile is readable by pstats and is a valid speedscope document"""
+    store = profiling.ProfileStore(5)
+    profile_id = int(_client(store).get("/slow/20000", headers=PROFILE).headers["x-profile-id"])
+
+    monkeypatch.setattr(profiling_routes, "profile_store", store)
+    monkeypatch.setattr(profiling_routes, "PROFILING_SECRET", SECRET)
+    api = FastAPI()
+    api.include_router(profiling_routes.router, prefix="/debug/profiles")
+    client = TestClient(api, headers={"X-Profile-Secret": SECRET})
+
+    raw = client.get(f"/debug/profiles/{profile_id}/download/?format=pstats")
+    path = tmp_path / "perfil.pstats"
+    path.write_bytes(raw.content)
+    assert any(func[2] == "_busy" for func in pstats.Stats(str(path)).stats)
+
+    document = client.get(f"/debug/profiles/{profile_id}/download/?format=speedscope").json()
+    frames = document["shared"]["frames"]
+    sampled = document["profiles"][0]
+    assert len(sampled["samples"]) == len(sampled["weights"]) > 0
+    assert all(0 <= index < len(frames) for sample in sampled["samples"] for index in sample)
+    assert "_busy" in {frame["name"] for frame in frames}
+
+    summary = client.get(f"/debug/profiles/{profile_id}/?limit=5").json()
+    assert len(summary["top"]) == 5
+    assert client.get("/debug/profiles/999/").status_code == 404
+
+def test_profiles_require_the_secret(monkeypatch):
+    """Test that /debug/profiles/ refuses requests without the configured secret"""
+    api = FastAPI()
+    api.include_router(profiling_routes.router, prefix="/debug/profiles")
+    client = TestClient(api)
+
+    monkeypatch.setattr(profiling_routes, "PROFILING_SECRET", None)
+    assert client.get("/debug/profiles/", headers={"X-Profile-Secret": ""}).status_code == 403
+
+    monkeypatch.setattr(profiling_routes, "PROFILING_SECRET", SECRET)
+    assert client.get("/debug/profiles/").status_code == 403
+    assert client.get("/debug/profiles/", headers={"X-Profile-Secret": "otro"}).status_code == 403
+    assert client.get("/debug/profiles/", headers={"X-Profile-Secret": SECRET}).status_code == 200
@@ -0,0 +1,74 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+from datetime import datetime
+from unittest.mock import patch
+from fastapi import HTTPException
+from app.core import quotes
+from app.crud.quote import spend_quote
+
+def test_quote_round_trip_returns_locked_rate():
+    """Test that a freshly issued quote verifies and yields its rate"""
+    quote = quotes.create_quote("X", "USD", "PEN", 3.75)
+    assert quote["rate"] == 3.75
+    assert quote["expires_at"] > datetime.utcnow()
+    assert quotes.verify_quote(quote["quote_id"], "X", "USD", "PEN")["rate"] == 3.75
+
+@pytest.mark.parametrize("username, from_currency, to_currency", [
+    ("Y", "USD", "PEN"),   # another user
+    ("X", "PEN", "USD"),   # another pair
+])
+def test_quote_is_bound_to_user_and_pair(username, from_currency, to_currency):
+    """Test that a quote cannot be used by another user or for another pair"""
+    quote = quotes.create_quote("X", "USD", "PEN", 3.75)
+    with pytest.raises(HTTPException) as exc_info:
+        quotes.verify_quote(quote["quote_id"], username, from_currency, to_currency)
+    assert exc_info.value.status_code == 400
+
+def test_expired_quote_is_rejected():
+    """Test that a quote past its expiry no longer verifies"""
+    with patch('app.core.quotes.QUOTE_TTL_SECONDS', -1):
+        quote = quotes.create_quote("X", "USD", "PEN", 3.75)
+    with pytest.raises(HTTPException):
+        quotes.verify_quote(quote["quote_id"], "X", "USD", "PEN")
+
+def test_tampered_or_foreign_token_is_rejected():
+    """Test that access tokens or edited quotes are not accepted as quotes"""
+    from app.core.security import create_access_token
+    with pytest.raises(HTTPException):
+        quotes.verify_quote(create_access_token({"sub": "X"}), "X", "USD", "PEN")
+    quote_id = quotes.create_quote("X", "USD", "PEN", 3.75)["quote_id"]
+    with pytest.raises(HTTPException):
+        quotes.verify_quote(quote_id[:-2] + "xx", "X", "USD", "PEN")
+
+@pytest.mark.asyncio
+async def test_quote_can_only_be_spent_once(session_factory):
+    """Test that a quote already used in a committed conversion is refused"""
+    # Arrange
+    claims = quotes.verify_quote(quotes.create_quote("X", "USD", "PEN", 3.75)["quote_id"], "X", "USD", "PEN")
+    expires_at = datetime.utcfromtimestamp(claims["exp"])
+
+    # Act
+    async with session_factory() as db:
+        first = await spend_quote(db, claims["jti"], expires_at)
+        await db.commit()
+    async with session_factory() as db:
+        second = await spend_quote(db, claims["jti"], expires_at)
+
+    # Assert
+    assert first is True
+    assert second is False
+
+@pytest.mark.asyncio
+async def test_rolled_back_conversion_does_not_spend_quote(session_factory):
+    """Test that a quote stays usable if its conversion is rolled back"""
+    claims = quotes.verify_quote(quotes.create_quote("X", "USD", "PEN", 3.75)["quote_id"], "X", "USD", "PEN")
+    expires_at = datetime.utcfromtimestamp(claims["exp"])
+    async with session_factory() as db:
+        assert await spend_quote(db, claims["jti"], expires_at) is True
+        await db.rollback()
+    async with session_factory() as db:
+        assert await spend_quote(db, claims["jti"], expires_at) is True
@@ -3,6 +3,7 @@ import os
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import time
 import pytest
 from unittest.mock import patch, MagicMock, AsyncMock
 from datetime import datetime, timedelta
@@ -10,6 +11,15 @@ from jose import JWTError
 from fastapi import HTTPException
 from app.core import security
 
+@pytest.fixture(autouse=True)
+def clear_security_caches():
+    """Verified tokens and identities are process-global: start every test empty"""
+    security.token_cache.clear()
+    security.identity_cache.clear()
+    yield
+    security.token_cache.clear()
+    security.identity_cache.clear()
+
 # Test JWT token creation functionality
 def test_create_access_token_with_default_expiry():
     """Test creating JWT token with default expiration time"""
@@ -45,7 +55,7 @@ async def test_get_current_user_valid_token():
     """Test successful user retrieval with valid JWT token"""
     with patch('app.core.security.oauth2_scheme') as mock_oauth2, \
          patch('app.core.security.get_db') as mock_get_db, \
-         patch('app.core.security.get_user_by_username') as mock_get_user:
+         patch('app.core.security.get_user_by_username', new_callable=AsyncMock) as mock_get_user:
         mock_oauth2.return_value = "valid.jwt.token"
         mock_db = MagicMock()
         mock_get_db.return_value = mock_db
@@ -58,7 +68,7 @@ async def test_get_current_user_valid_token():
             result = await security.get_current_user(token="valid.jwt.token", db=mock_db)
             assert result == mock_user
             mock_jwt_decode.assert_called_once_with("valid.jwt.token", security.SECRET_KEY, algorithms=[security.ALGORITHM])
-            mock_get_user.assert_called_once_with(mock_db, "testuser")
+            mock_get_user.assert_awaited_once_with(mock_db, "testuser")
 
 @pytest.mark.asyncio
 async def test_get_current_user_invalid_token_jwt_error():
@@ -110,7 +120,7 @@ async def test_get_current_user_user_not_found():
     """Test handling when user is not found in database"""
     with patch('app.core.security.oauth2_scheme') as mock_oauth2, \
          patch('app.core.security.get_db') as mock_get_db, \
-         patch('app.core.security.get_user_by_username') as mock_get_user:
+         patch('app.core.security.get_user_by_username', new_callable=AsyncMock) as mock_get_user:
         mock_oauth2.return_value = "valid.jwt.token"
         mock_db = MagicMock()
         mock_get_db.return_value = mock_db
@@ -121,4 +131,67 @@ async def test_get_current_user_user_not_found():
                 await security.get_current_user(token="valid.jwt.token", db=mock_db)
             assert exc_info.value.status_code == 401
             assert exc_info.value.detail == "No autenticado"
-            mock_get_user.assert_called_once_with(mock_db, "nonexistentuser") 
\ No newline at end of file
+            mock_get_user.assert_awaited_once_with(mock_db, "nonexistentuser")
+
+# Test verified-token and identity caches
+@pytest.mark.asyncio
+async def test_get_current_user_reuses_verified_token():
+    """Test that a token seen before is not decoded again while valid"""
+    with patch('app.core.security.get_user_by_username', new_callable=AsyncMock) as mock_get_user, \
+         patch('app.core.security.jwt.decode') as mock_jwt_decode:
+        mock_get_user.return_value = MagicMock(username="testuser")
+        mock_jwt_decode.return_value = {"sub": "testuser", "exp": time.time() + 300}
+        await security.get_current_user(token="cached.jwt.token", db=MagicMock())
+        await security.get_current_user(token="cached.jwt.token", db=MagicMock())
+        mock_jwt_decode.assert_called_once()
+        assert mock_get_user.await_count == 2
+
+def test_quote_is_not_accepted_as_access_token():
+    """Test that a signed quote (same key, another typ) cannot authenticate"""
+    from app.core.quotes import create_quote
+    quote_id = create_quote("testuser", "USD", "PEN", 3.75)["quote_id"]
+    with pytest.raises(HTTPException) as exc_info:
+        security.decode_username(quote_id)
+    assert exc_info.value.status_code == 401
+    assert security.decode_username(security.create_access_token({"sub": "testuser"})) == "testuser"
+
+def test_token_cache_never_outlives_exp():
+    """Test that a cached token expires at its exp claim even if the TTL is longer"""
+    cache = security.ExpiringLRUCache(maxsize=10, ttl=3600)
+    with patch('app.core.security.time.time', return_value=1000):
+        cache.set("token", "testuser", expires_at=1010)
+        assert cache.get("token") == "testuser"
+    with patch('app.core.security.time.time', return_value=1011):
+        assert cache.get("token") is None
+    # Already-expired tokens are never stored
+    with patch('app.core.security.time.time', return_value=1000):
+        cache.set("old", "testuser", expires_at=999)
+        assert cache.get("old") is None
+
+def test_expiring_lru_cache_evicts_least_recently_used():
+    """Test that the cache stays bounded and evicts the least recently used entry"""
+    cache = security.ExpiringLRUCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+@pytest.mark.asyncio
+async def test_get_current_identity_serves_cached_snapshot_until_invalidated():
+    """Test that read-only identity lookups skip the DB until a mutation invalidates them"""
+    with patch('app.core.security.decode_username', return_value="testuser"), \
+         patch('app.core.security.get_user_by_username', new_callable=AsyncMock) as mock_get_user, \
+         patch('app.core.security.get_balances', new_callable=AsyncMock, return_value={"PEN": 10.0, "USD": 5.0}):
+        mock_get_user.return_value = MagicMock(id=1, username="testuser")
+        first = await security.get_current_identity(token="t", db=MagicMock())
+        second = await security.get_current_identity(token="t", db=MagicMock())
+        assert mock_get_user.await_count == 1
+        assert second == first
+        assert first.balances["PEN"] == 10.0
+
+        security.invalidate_identity("testuser")
+        await security.get_current_identity(token="t", db=MagicMock())
+        assert mock_get_user.await_count == 2
@@ -0,0 +1,153 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import pytest
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy import select
+from app.crud import idempotency
+from app.crud.outbox import add_transaction_event
+from app.models.idempotency import IdempotencyKeyDB
+from app.models.outbox import OutboxEventDB
+from app.models.transfer import TransferRequest
+
+REQUEST = TransferRequest(receiver="Y", amount=10, currency="USD")
+
+class Operation:
+    """Stand-in for a route body: commits its response like the real ones do"""
+
+    def __init__(self, db, *results):
+        self.db = db
+        self.results = list(results)
+        self.await_count = 0
+
+    async def __call__(self):
+        self.await_count += 1
+        result = self.results.pop(0) if len(self.results) > 1 else self.results[0]
+        if isinstance(result, BaseException):
+            raise result
+        await idempotency.commit_with_response(self.db, result)
+        return result
+
+async def _run(factory, key, user_id=1, payload=REQUEST, *results):
+    """One request: its own session, as get_db gives each request"""
+    async with factory() as db:
+        operation = Operation(db, *results)
+        return await idempotency.run_idempotent(key, user_id, "transfer", payload, operation, db), operation
+
+@pytest.mark.asyncio
+async def test_without_key_always_executes(session_factory):
+    """Test that requests without Idempotency-Key are not deduplicated"""
+    for _ in range(2):
+        _, operation = await _run(session_factory, None, 1, REQUEST, {"message": "ok"})
+        assert operation.await_count == 1
+    async with session_factory() as db:
+        assert (await db.execute(select(IdempotencyKeyDB))).scalars().all() == []
+
+@pytest.mark.asyncio
+async def test_retry_with_same_key_replays_stored_response(session_factory):
+    """Test that a retry returns the stored response without executing again"""
+    # Act: First call, then a retry with the same key
+    first, _ = await _run(session_factory, "k1", 1, REQUEST, {"message": "X transfirió 10 USD a Y"})
+    retry, operation = await _run(session_factory, "k1", 1, REQUEST, {"message": "otra vez"})
+
+    # Assert: Retry did not execute and replays the same body
+    assert operation.await_count == 0
+    assert first == {"message": "X transfirió 10 USD a Y"}
+    assert isinstance(retry, JSONResponse)
+    assert retry.headers["Idempotency-Replayed"] == "true"
+    assert retry.body == JSONResponse(first).body
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicates_wait_for_first_execution(session_factory):
+    """Test that simultaneous duplicates share one execution"""
+    # Arrange: Slow operation
+    calls = 0
+
+    async def request():
+        async with session_factory() as db:
+            async def execute():
+                nonlocal calls
+                calls += 1
+                await asyncio.sleep(0.05)
+                await idempotency.commit_with_response(db, {"message": "ok"})
+                return {"message": "ok"}
+            return await idempotency.run_idempotent("k2", 1, "transfer", REQUEST, execute, db)
+
+    # Act: Ten concurrent requests with the same key
+    results = await asyncio.gather(*[request() for _ in range(10)])
+
+    # Assert: Only one execution; the rest are replays
+    assert calls == 1
+    assert sum(isinstance(result, JSONResponse) for result in results) == 9
+
+@pytest.mark.asyncio
+async def test_key_reused_with_different_payload_is_rejected(session_factory):
+    """Test that the same key with a different request body is a 422"""
+    await _run(session_factory, "k3", 1, REQUEST, {})
+    other = TransferRequest(receiver="Y", amount=99, currency="USD")
+    with pytest.raises(HTTPException) as exc_info:
+        await _run(session_factory, "k3", 1, other, {})
+    assert exc_info.value.status_code == 422
+
+@pytest.mark.asyncio
+async def test_business_errors_are_replayed(session_factory):
+    """Test that an HTTPException from the first execution is returned again on retry"""
+    for _ in range(2):
+        with pytest.raises(HTTPException) as exc_info:
+            await _run(session_factory, "k4", 1, REQUEST, HTTPException(400, "Saldo insuficiente en USD"), {"message": "ok"})
+        assert exc_info.value.detail == "Saldo insuficiente en USD"
+
+@pytest.mark.asyncio
+async def test_unexpected_errors_release_the_key(session_factory):
+    """Test that an unexpected failure frees the key so the client can retry"""
+    with pytest.raises(RuntimeError):
+        await _run(session_factory, "k5", 1, REQUEST, RuntimeError("caída"))
+    result, operation = await _run(session_factory, "k5", 1, REQUEST, {"message": "ok"})
+    assert result == {"message": "ok"}
+    assert operation.await_count == 1
+
+@pytest.mark.asyncio
+async def test_server_errors_release_the_key(session_factory):
+    """Test that a 5xx (e.g. rate provider down) is not stored, so a retry runs again"""
+    with pytest.raises(HTTPException) as exc_info:
+        await _run(session_factory, "k8", 1, REQUEST, HTTPException(500, "No se pudo obtener tasa de cambio"))
+    assert exc_info.value.status_code == 500
+
+    result, operation = await _run(session_factory, "k8", 1, REQUEST, {"message": "ok"})
+
+    assert result == {"message": "ok"}
+    assert operation.await_count == 1
+
+@pytest.mark.asyncio
+async def test_keys_are_scoped_per_user(session_factory):
+    """Test that two users may use the same key independently"""
+    _, first = await _run(session_factory, "k6", 1, REQUEST, {"message": "ok"})
+    _, second = await _run(session_factory, "k6", 2, REQUEST, {"message": "ok"})
+    assert first.await_count == second.await_count == 1
+
+@pytest.mark.asyncio
+async def test_response_commits_with_the_operation(session_factory):
+    """Test that the key, the business writes and the stored response share one transaction"""
+    # Arrange: An operation that dies after its writes but before committing
+    async with session_factory() as db:
+        async def crash():
+            add_transaction_event(db, "X depositó 10 USD", "X")
+            raise asyncio.CancelledError()
+
+        # Act: Crash mid-request (the session is then closed without commit)
+        with pytest.raises(asyncio.CancelledError):
+            await idempotency.run_idempotent("k7", 1, "transfer", REQUEST, crash, db)
+
+    # Assert: Nothing persisted, not even an in-progress key, so a retry runs normally
+    async with session_factory() as db:
+        assert (await db.execute(select(IdempotencyKeyDB))).scalars().all() == []
+        assert (await db.execute(select(OutboxEventDB))).scalars().all() == []
+    result, operation = await _run(session_factory, "k7", 1, REQUEST, {"message": "ok"})
+    assert operation.await_count == 1
+    async with session_factory() as db:
+        stored = (await db.execute(select(IdempotencyKeyDB))).scalars().one()
+    assert (stored.status_code, stored.response_body) == (200, '{"message": "ok"}')
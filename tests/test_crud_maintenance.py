@@ -0,0 +1,51 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from app.core.config import IDEMPOTENCY_TTL_SECONDS
+from app.crud.maintenance import ExpiredRowsPurger
+from app.models.idempotency import IdempotencyKeyDB
+from app.models.quote import SpentQuoteDB
+
+@pytest.mark.asyncio
+async def test_purge_removes_only_expired_spent_quotes(session_factory):
+    """Test that the purger deletes expired spent quotes in batches and keeps live ones"""
+    # Arrange
+    now = datetime.utcnow()
+    async with session_factory() as db:
+        db.add_all([SpentQuoteDB(jti=f"old{i}", expires_at=now - timedelta(minutes=1)) for i in range(5)])
+        db.add(SpentQuoteDB(jti="live", expires_at=now + timedelta(minutes=1)))
+        await db.commit()
+    purger = ExpiredRowsPurger(session_factory=session_factory, batch_size=2)
+
+    # Act
+    purged = await purger.purge_once()
+
+    # Assert
+    async with session_factory() as db:
+        remaining = (await db.execute(select(SpentQuoteDB.jti))).scalars().all()
+    assert purged == 5
+    assert remaining == ["live"]
+
+@pytest.mark.asyncio
+async def test_purge_removes_idempotency_keys_past_their_ttl(session_factory):
+    """Test that the purger deletes idempotency keys older than the TTL and keeps recent ones"""
+    # Arrange
+    stale = datetime.utcnow() - timedelta(seconds=IDEMPOTENCY_TTL_SECONDS + 60)
+    async with session_factory() as db:
+        db.add(IdempotencyKeyDB(user_id=1, key="old", request_hash="h", status_code=200, response_body="{}", created_at=stale))
+        db.add(IdempotencyKeyDB(user_id=1, key="new", request_hash="h", status_code=200, response_body="{}"))
+        await db.commit()
+
+    # Act
+    purged = await ExpiredRowsPurger(session_factory=session_factory).purge_once()
+
+    # Assert
+    async with session_factory() as db:
+        remaining = (await db.execute(select(IdempotencyKeyDB.key))).scalars().all()
+    assert purged == 1
+    assert remaining == ["new"]
@@ -0,0 +1,99 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from sqlalchemy import select, func
+from app.crud import outbox
+from app.models.outbox import OutboxEventDB
+
+async def _pending(factory):
+    async with factory() as db:
+        return (await db.execute(select(func.count()).select_from(OutboxEventDB))).scalar()
+
+def _writer(ok=True):
+    writer = MagicMock()
+    writer.write_batch = AsyncMock(return_value=ok)
+    return writer
+
+async def _add_events(factory, count):
+    async with factory() as db:
+        for i in range(count):
+            outbox.add_transaction_event(db, f"evento {i}", "X")
+        await db.commit()
+
+@pytest.mark.asyncio
+async def test_events_are_only_visible_after_commit(session_factory):
+    """Test that outbox rows share the fate of the surrounding transaction"""
+    async with session_factory() as db:
+        outbox.add_transaction_event(db, "X depositó 10 USD", "X")
+        await db.rollback()
+    assert await _pending(session_factory) == 0
+
+@pytest.mark.asyncio
+async def test_relay_moves_events_in_order_and_deletes_them(session_factory):
+    """Test that the relay ships ordered batches to Mongo and clears the outbox"""
+    # Arrange: Five committed events, batch size of three
+    await _add_events(session_factory, 5)
+    writer = _writer()
+    relay = outbox.OutboxRelay(session_factory, writer, batch_size=3)
+
+    # Act: Relay until the outbox is empty
+    assert await relay.relay_once() == 3
+    assert await relay.relay_once() == 2
+    assert await relay.relay_once() == 0
+
+    # Assert: Documents sent in id order with stable event ids, outbox empty
+    batches = [call.args[0] for call in writer.write_batch.await_args_list]
+    assert [doc["description"] for doc in batches[0]] == ["evento 0", "evento 1", "evento 2"]
+    assert all(doc["event_id"].startswith("outbox-") for batch in batches for doc in batch)
+    assert await _pending(session_factory) == 0
+    assert relay.relayed == 5
+
+@pytest.mark.asyncio
+async def test_relay_reports_unrelayed_events(session_factory):
+    """Test that the pending count tracks outbox rows not yet in Mongo"""
+    await _add_events(session_factory, 5)
+    relay = outbox.OutboxRelay(session_factory, _writer(ok=False), batch_size=3)
+    await relay.relay_once()
+    assert relay.pending == 5
+
+    relay.writer = _writer()
+    await relay.relay_once()
+    assert relay.pending == 2
+    await relay.relay_once()
+    await relay.relay_once()
+    assert relay.pending == 0
+
+@pytest.mark.asyncio
+async def test_event_ids_are_not_reused_after_relay(session_factory):
+    """Test that events added after the outbox was emptied get fresh event ids"""
+    # Arrange
+    writer = _writer()
+    relay = outbox.OutboxRelay(session_factory, writer)
+
+    # Act: Relay one event, empty the outbox, then add another
+    await _add_events(session_factory, 1)
+    await relay.relay_once()
+    await _add_events(session_factory, 1)
+    await relay.relay_once()
+
+    # Assert: The upsert by event_id would otherwise drop the second one
+    first, second = [call.args[0][0]["event_id"] for call in writer.write_batch.await_args_list]
+    assert first != second
+
+@pytest.mark.asyncio
+async def test_relay_keeps_events_when_mongo_write_fails(session_factory):
+    """Test that rows stay in the outbox until Mongo acknowledges them"""
+    # Arrange: Writer that gives up on the batch
+    await _add_events(session_factory, 2)
+    relay = outbox.OutboxRelay(session_factory, _writer(ok=False))
+
+    # Act: Try to relay
+    relayed = await relay.relay_once()
+
+    # Assert: Nothing deleted, the next attempt resends the same rows
+    assert relayed == 0
+    assert await _pending(session_factory) == 2
@@ -0,0 +1,217 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import csv
+import io
+import json
+import datetime
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+from unittest.mock import AsyncMock, MagicMock, patch
+from pymongo.errors import AutoReconnect, BulkWriteError
+from app.api.routes import transactions as transactions_routes
+from app.core.security import get_current_user
+from app.crud import transaction
+
+def _collection():
+    collection = MagicMock()
+    collection.bulk_write = AsyncMock()
+    collection.create_index = AsyncMock()
+    return collection
+
+@pytest.mark.asyncio
+async def test_writer_retries_transient_errors():
+    """Test that a failed bulk_write is retried before giving up"""
+    # Arrange: First attempt fails with a transient error
+    collection = _collection()
+    collection.bulk_write.side_effect = [AutoReconnect("caído"), None]
+    writer = transaction.TransactionLogWriter(collection, retry_backoff=0)
+
+    # Act: Write one event
+    written = await writer.write_batch([{"event_id": "x", "description": "x"}])
+
+    # Assert: Retried once and written
+    assert written is True
+    assert collection.bulk_write.await_count == 2
+    assert writer.stats()["retries"] == 1
+    assert writer.stats()["written"] == 1
+
+@pytest.mark.asyncio
+async def test_writer_treats_duplicate_keys_as_written():
+    """Test that racing upserts of the same event are not counted as a failure"""
+    # Arrange: bulk_write reports only duplicate-key errors
+    collection = _collection()
+    collection.bulk_write.side_effect = BulkWriteError({"writeErrors": [{"code": 11000}]})
+    writer = transaction.TransactionLogWriter(collection, retry_backoff=0)
+
+    # Act: Write one event
+    written = await writer.write_batch([{"event_id": "x", "description": "x"}])
+
+    # Assert: Single attempt and nothing failed
+    assert written is True
+    assert collection.bulk_write.await_count == 1
+    assert writer.stats()["failed"] == 0
+
+@pytest.mark.asyncio
+async def test_writer_reports_failed_batch_after_max_retries():
+    """Test that a persistently failing batch is reported as failed and counted"""
+    # Arrange: Every attempt fails
+    collection = _collection()
+    collection.bulk_write.side_effect = AutoReconnect("caído")
+    writer = transaction.TransactionLogWriter(collection, max_retries=2, retry_backoff=0)
+
+    # Act: Write one event
+    written = await writer.write_batch([{"event_id": "x", "description": "x"}])
+
+    # Assert: Initial attempt plus two retries, then reported as failed
+    assert written is False
+    assert collection.bulk_write.await_count == 3
+    assert writer.stats()["failed"] == 1
+
+@pytest.mark.asyncio
+async def test_write_batch_upserts_by_event_id():
+    """Test that batches are idempotent upserts keyed on event_id"""
+    # Arrange: Writer over a mock collection
+    collection = _collection()
+    writer = transaction.TransactionLogWriter(collection)
+
+    # Act: Write the same event twice
+    doc = {"event_id": "e1", "description": "x", "username": "X"}
+    assert await writer.write_batch([doc]) is True
+    assert await writer.write_batch([doc]) is True
+
+    # Assert: Both writes are upserts filtered by event_id
+    for call in collection.bulk_write.await_args_list:
+        operation = call.args[0][0]
+        assert operation._filter == {"event_id": "e1"}
+        assert operation._upsert is True
+
+@pytest.mark.asyncio
+async def test_writer_creates_indexes_once_mongo_is_back():
+    """Test that indexes skipped at boot are created before the first batch that gets written"""
+    # Arrange: Mongo down for the first batch
+    collection = _collection()
+    collection.create_index.side_effect = [AutoReconnect("caído"), None, None]
+    writer = transaction.TransactionLogWriter(collection, max_retries=0)
+
+    # Act
+    first = await writer.write_batch([{"event_id": "e1"}])
+    second = await writer.write_batch([{"event_id": "e1"}])
+    third = await writer.write_batch([{"event_id": "e2"}])
+
+    # Assert: Nothing written without indexes, then created exactly once
+    assert (first, second, third) == (False, True, True)
+    assert writer.indexes_ready is True
+    assert collection.create_index.await_count == 3  # fallo + event_id + historial
+    assert collection.bulk_write.await_count == 2
+
+@pytest_asyncio.fixture
+async def history_collection():
+    """In-memory Mongo collection with 12 history entries for X and a few for Y"""
+    collection = AsyncMongoMockClient()["coin_swap"]["transactions"]
+    await transaction.ensure_indexes(collection)
+    base = datetime.datetime(2024, 1, 1)
+    await collection.insert_many(
+        [{"timestamp": base + datetime.timedelta(minutes=i), "description": f"tx {i}", "username": "X"}
+         for i in range(12)]
+        + [{"timestamp": base, "description": "otro", "username": "Y"}]
+    )
+    with patch.object(transaction, 'get_transactions_collection', return_value=collection):
+        yield collection
+
+@pytest.mark.asyncio
+async def test_history_pages_walk_backwards_with_cursor(history_collection):
+    """Test that keyset pages are newest-first and chain through next_cursor"""
+    # Act: Walk the whole history in pages of five
+    pages = [await transaction.get_transactions_by_user("X", limit=5)]
+    while pages[-1].next_cursor:
+        pages.append(await transaction.get_transactions_by_user("X", limit=5, before=pages[-1].next_cursor))
+
+    # Assert: 5 + 5 + 2 items, newest first, no gaps or repeats, other users excluded
+    descriptions = [tx.description for page in pages for tx in page.items]
+    assert [len(page.items) for page in pages] == [5, 5, 2]
+    assert descriptions == [f"tx {i}" for i in range(11, -1, -1)]
+
+@pytest.mark.asyncio
+async def test_history_after_cursor_returns_newer_page(history_collection):
+    """Test that 'after' pages forward to newer entries and keep newest-first order"""
+    # Arrange: Second page of the history
+    first = await transaction.get_transactions_by_user("X", limit=5)
+    second = await transaction.get_transactions_by_user("X", limit=5, before=first.next_cursor)
+
+    # Act: Go back to the newer page
+    back = await transaction.get_transactions_by_user("X", limit=5, after=second.prev_cursor)
+
+    # Assert: Same entries as the first page
+    assert [tx.description for tx in back.items] == [tx.description for tx in first.items]
+    assert back.prev_cursor is None
+
+@pytest.mark.asyncio
+async def test_history_date_range_filter(history_collection):
+    """Test that start/end restrict the page to a time window"""
+    base = datetime.datetime(2024, 1, 1)
+    page = await transaction.get_transactions_by_user(
+        "X", start=base + datetime.timedelta(minutes=3), end=base + datetime.timedelta(minutes=6)
+    )
+    assert [tx.description for tx in page.items] == ["tx 5", "tx 4", "tx 3"]
+
+@pytest.mark.asyncio
+async def test_history_rejects_invalid_cursor(history_collection):
+    """Test that a malformed cursor is reported as a ValueError"""
+    with pytest.raises(ValueError):
+        await transaction.get_transactions_by_user("X", before="no-es-un-cursor")
+
+@pytest.mark.asyncio
+async def test_ensure_indexes_creates_history_index(history_collection):
+    """Test that the compound (username, timestamp desc) index exists"""
+    info = await history_collection.index_information()
+    keys = [index["key"] for index in info.values()]
+    assert transaction.HISTORY_INDEX in keys
+
+@pytest.mark.asyncio
+async def test_export_ndjson_streams_history_oldest_first(history_collection):
+    """Test that NDJSON export yields one JSON line per entry, oldest first"""
+    # Act: Collect the streamed chunks
+    chunks = [chunk async for chunk in transaction.export_ndjson(transaction.iter_transactions("X"))]
+
+    # Assert: One line per transaction, in chronological order
+    assert len(chunks) == 12
+    first = json.loads(chunks[0])
+    assert first["description"] == "tx 0"
+    assert first["timestamp"] == "2024-01-01T00:00:00"
+
+@pytest.mark.asyncio
+async def test_export_csv_streams_header_and_rows(history_collection):
+    """Test that CSV export yields a header and one row per entry within the date range"""
+    # Arrange: Restrict to two minutes of history
+    base = datetime.datetime(2024, 1, 1)
+    documents = transaction.iter_transactions("X", start=base, end=base + datetime.timedelta(minutes=2))
+
+    # Act: Collect the streamed CSV
+    body = "".join([chunk async for chunk in transaction.export_csv(documents)])
+
+    # Assert: Header plus the two rows in range
+    rows = list(csv.reader(io.StringIO(body)))
+    assert rows[0] == transaction.EXPORT_FIELDS
+    assert [row[1] for row in rows[1:]] == ["tx 0", "tx 1"]
+
+@pytest.mark.parametrize("username, encoded", [
+    ("Łukasz", "historial_%C5%81ukasz.csv"),
+    ('o"brien', "historial_o%22brien.csv"),
+])
+def test_export_filename_survives_any_username(history_collection, username, encoded):
+    """Test that the export header stays valid for usernames outside latin-1 or with quotes"""
+    app = FastAPI()
+    app.include_router(transactions_routes.router, prefix="/transactions")
+    app.dependency_overrides[get_current_user] = lambda: MagicMock(username=username)
+
+    response = TestClient(app).get("/transactions/export/?format=csv")
+
+    assert response.status_code == 200
+    assert response.headers["content-disposition"] == (
+        f"attachment; filename=\"historial.csv\"; filename*=UTF-8''{encoded}")
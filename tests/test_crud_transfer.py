@@ -0,0 +1,93 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+from sqlalchemy import select, func
+from app.crud import transfer as crud_transfer
+from app.crud.user import get_user_by_username, create_user
+from app.models.outbox import OutboxEventDB
+from app.models.transfer import TransferRequest
+from conftest import wallet_balances
+
+async def _outbox_count(factory):
+    async with factory() as db:
+        return (await db.execute(select(func.count()).select_from(OutboxEventDB))).scalar()
+
+async def _run_batch(factory, items, atomic):
+    async with factory() as db:
+        sender = await get_user_by_username(db, "X")
+        results, applied = await crud_transfer.batch_transfer(db, sender, items, atomic)
+        if applied:
+            await db.commit()
+        else:
+            await db.rollback()
+    return results, applied
+
+@pytest.mark.asyncio
+async def test_batch_transfer_applies_all_items_in_one_transaction(session_factory):
+    """Test that a valid batch moves every amount and records two history events per item"""
+    # Arrange: A third receiver and three payouts from X
+    async with session_factory() as db:
+        await create_user(db, "Z")
+    items = [
+        TransferRequest(receiver="Y", amount=10, currency="USD"),
+        TransferRequest(receiver="Z", amount=20, currency="USD"),
+        TransferRequest(receiver="Y", amount=5, currency="PEN"),
+    ]
+
+    # Act: Run the batch atomically
+    results, applied = await _run_batch(session_factory, items, atomic=True)
+
+    # Assert: All applied, balances moved and history queued in the outbox
+    assert applied is True
+    assert [r["status"] for r in results] == ["ok", "ok", "ok"]
+    balances = await wallet_balances(session_factory)
+    assert balances["X"] == (95, 170)
+    assert balances["Y"] == (55, 110)
+    assert balances["Z"] == (100, 20)
+    assert await _outbox_count(session_factory) == 6
+
+@pytest.mark.asyncio
+async def test_atomic_batch_rejects_everything_on_one_failure(session_factory):
+    """Test that all-or-nothing mode leaves balances untouched if any item fails"""
+    # Arrange: Second item exceeds X's remaining USD, third receiver does not exist
+    items = [
+        TransferRequest(receiver="Y", amount=150, currency="USD"),
+        TransferRequest(receiver="Y", amount=100, currency="USD"),
+        TransferRequest(receiver="nadie", amount=1, currency="USD"),
+    ]
+    before = await wallet_balances(session_factory)
+
+    # Act: Run the batch atomically
+    results, applied = await _run_batch(session_factory, items, atomic=True)
+
+    # Assert: Nothing applied, failures reported per item
+    assert applied is False
+    assert [r["status"] for r in results] == ["ok", "error", "error"]
+    assert "Saldo insuficiente" in results[1]["detail"]
+    assert await wallet_balances(session_factory) == before
+    assert await _outbox_count(session_factory) == 0
+
+@pytest.mark.asyncio
+async def test_per_item_batch_applies_valid_items_only(session_factory):
+    """Test that per-item mode applies the affordable items in order and skips the rest"""
+    # Arrange: Same items as the atomic failure case
+    items = [
+        TransferRequest(receiver="Y", amount=150, currency="USD"),
+        TransferRequest(receiver="Y", amount=100, currency="USD"),
+        TransferRequest(receiver="nadie", amount=1, currency="USD"),
+        TransferRequest(receiver="Y", amount=50, currency="USD"),
+    ]
+
+    # Act: Run the batch with per-item semantics
+    results, applied = await _run_batch(session_factory, items, atomic=False)
+
+    # Assert: First and last applied, total conserved
+    assert applied is True
+    assert [r["status"] for r in results] == ["ok", "error", "error", "ok"]
+    balances = await wallet_balances(session_factory)
+    assert balances["X"][1] == 0
+    assert balances["Y"][1] == 300
+    assert await _outbox_count(session_factory) == 4
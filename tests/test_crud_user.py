@@ -0,0 +1,27 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+from decimal import Decimal
+from app.crud import user as crud_user
+from app.crud.wallet import get_balances
+
+@pytest.mark.asyncio
+async def test_get_and_create_user(session_factory):
+    """Test async lookup and creation of a user with its initial wallets"""
+    async with session_factory() as db:
+        assert await crud_user.get_user_by_username(db, "nobody") is None
+        created = await crud_user.create_user(db, "nuevo")
+        found = await crud_user.get_user_by_username(db, "nuevo")
+        balances = await get_balances(db, found.id)
+    assert found.id == created.id
+    assert balances == {"PEN": Decimal("100.00"), "USD": Decimal("0.00")}
+
+@pytest.mark.asyncio
+async def test_get_users_by_usernames_uses_one_lookup(session_factory):
+    """Test that several users are resolved at once and unknown names are skipped"""
+    async with session_factory() as db:
+        users = await crud_user.get_users_by_usernames(db, {"X", "Y", "nadie"})
+    assert set(users) == {"X", "Y"}
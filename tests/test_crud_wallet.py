@@ -0,0 +1,190 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import pytest
+from decimal import Decimal
+from sqlalchemy import select, update
+from app.crud import wallet as crud_wallet
+from app.models.user import UserDB
+from app.models.wallet import WalletDB
+from conftest import CONCURRENCY, wallet_balances
+
+async def _user_ids(factory):
+    async with factory() as db:
+        users = (await db.execute(select(UserDB))).scalars().all()
+        return {u.username: u.id for u in users}
+
+@pytest.mark.asyncio
+async def test_debit_balance_rejects_overdraft(session_factory):
+    """Test that a conditional debit never takes a balance below zero"""
+    ids = await _user_ids(session_factory)
+    async with session_factory() as db:
+        assert await crud_wallet.debit_balance(db, ids["Y"], "PEN", 50) is True
+        assert await crud_wallet.debit_balance(db, ids["Y"], "PEN", Decimal("0.01")) is False
+        await db.commit()
+    assert (await wallet_balances(session_factory))["Y"][0] == 0
+
+@pytest.mark.asyncio
+async def test_convert_balance_moves_between_wallets(session_factory):
+    """Test that conversion debits one wallet, credits the other and respects the balance"""
+    ids = await _user_ids(session_factory)
+    async with session_factory() as db:
+        assert await crud_wallet.convert_balance(db, ids["X"], "USD", "PEN", Decimal("10"), Decimal("37.51")) is True
+        await db.commit()
+        assert await crud_wallet.convert_balance(db, ids["X"], "USD", "PEN", 1000, 3700) is False
+        await db.rollback()
+    assert (await wallet_balances(session_factory))["X"] == (Decimal("137.51"), Decimal("190.00"))
+
+@pytest.mark.asyncio
+async def test_concurrent_withdrawals_never_overdraw(session_factory):
+    """Test that many parallel withdrawals succeed exactly as often as the balance allows"""
+    # Arrange: X has 100 PEN, 300 concurrent withdrawals of 1 PEN
+    user_id = (await _user_ids(session_factory))["X"]
+    limit = asyncio.Semaphore(CONCURRENCY)
+
+    async def withdraw():
+        async with limit, session_factory() as db:
+            ok = await crud_wallet.debit_balance(db, user_id, "PEN", 1)
+            await db.commit()
+            return ok
+
+    # Act: Run them concurrently
+    results = await asyncio.gather(*[withdraw() for _ in range(300)])
+
+    # Assert: Exactly 100 succeeded and the balance is zero, never negative
+    assert results.count(True) == 100
+    assert (await wallet_balances(session_factory))["X"][0] == 0
+
+@pytest.mark.asyncio
+async def test_concurrent_cross_transfers_conserve_total(session_factory):
+    """Test that parallel transfers in both directions keep the total balance constant"""
+    # Arrange: Transfers X->Y and Y->X interleaved
+    ids = await _user_ids(session_factory)
+    before = await wallet_balances(session_factory)
+    limit = asyncio.Semaphore(CONCURRENCY)
+
+    async def move(i):
+        sender, receiver = ("X", "Y") if i % 2 else ("Y", "X")
+        async with limit, session_factory() as db:
+            if await crud_wallet.transfer_balance(db, ids[sender], ids[receiver], "USD", 7):
+                await db.commit()
+                return True
+            await db.rollback()
+            return False
+
+    # Act: Run them concurrently
+    await asyncio.gather(*[move(i) for i in range(400)])
+
+    # Assert: Total USD is conserved and no balance went negative
+    after = await wallet_balances(session_factory)
+    assert after["X"][1] + after["Y"][1] == before["X"][1] + before["Y"][1]
+    assert min(after["X"][1], after["Y"][1]) >= 0
+
+@pytest.mark.asyncio
+async def test_credit_creates_wallet_for_new_currency(session_factory):
+    """Test that the first credit in a currency opens the wallet without a schema change"""
+    ids = await _user_ids(session_factory)
+    async with session_factory() as db:
+        await crud_wallet.credit_balance(db, ids["Y"], "EUR", Decimal("12.50"))
+        await crud_wallet.credit_balance(db, ids["Y"], "EUR", Decimal("0.50"))
+        assert await crud_wallet.debit_balance(db, ids["X"], "EUR", 1) is False
+        await db.commit()
+        balances = await crud_wallet.get_balances(db, ids["Y"])
+    assert balances == {"EUR": Decimal("13.00"), "PEN": Decimal("50.00"), "USD": Decimal("100.00")}
+
+@pytest.mark.asyncio
+async def test_concurrent_opposite_conversions_conserve_wallets(session_factory):
+    """Test that USD->PEN and PEN->USD conversions of one user never overdraw either wallet"""
+    # Arrange: 1:1 conversions in both directions for user X
+    user_id = (await _user_ids(session_factory))["X"]
+    limit = asyncio.Semaphore(CONCURRENCY)
+
+    async def convert(i):
+        source, target = ("USD", "PEN") if i % 2 else ("PEN", "USD")
+        async with limit, session_factory() as db:
+            if await crud_wallet.convert_balance(db, user_id, source, target, Decimal("3"), Decimal("3")):
+                await db.commit()
+            else:
+                await db.rollback()
+
+    # Act: Run them concurrently
+    await asyncio.gather(*[convert(i) for i in range(200)])
+
+    # Assert: The sum of both wallets is unchanged and neither is negative
+    pen, usd = (await wallet_balances(session_factory))["X"]
+    assert pen + usd == 300
+    assert min(pen, usd) >= 0
+
+async def _make_hot(factory, username, shards):
+    async with factory() as db:
+        await db.execute(update(UserDB).where(UserDB.username == username).values(balance_shards=shards))
+        await db.commit()
+
+@pytest.mark.asyncio
+async def test_hot_account_credits_spread_across_shards(session_factory):
+    """Test that concurrent credits to a sharded account land on several rows and sum correctly"""
+    # Arrange: Y is a hot account with 8 shards
+    await _make_hot(session_factory, "Y", 8)
+    user_id = (await _user_ids(session_factory))["Y"]
+    limit = asyncio.Semaphore(CONCURRENCY)
+
+    async def deposit():
+        async with limit, session_factory() as db:
+            await crud_wallet.credit_balance(db, user_id, "USD", Decimal("1.25"))
+            await db.commit()
+
+    # Act: 200 concurrent credits
+    await asyncio.gather(*[deposit() for _ in range(200)])
+
+    # Assert: Several shard rows exist and the aggregated balance is exact
+    async with session_factory() as db:
+        shards = (await db.execute(
+            select(WalletDB.shard).where(WalletDB.user_id == user_id, WalletDB.currency == "USD")
+        )).scalars().all()
+        balances = await crud_wallet.get_balances(db, user_id)
+    assert len(shards) > 1
+    assert set(shards) <= set(range(8))
+    assert balances["USD"] == Decimal("350.00")
+
+@pytest.mark.asyncio
+async def test_debit_aggregates_shards_and_rejects_overdraft(session_factory):
+    """Test that a debit larger than any single shard drains several and never overdraws"""
+    # Arrange: 100 USD in shard 0 plus 30 USD in shard 3
+    user_id = (await _user_ids(session_factory))["Y"]
+    async with session_factory() as db:
+        db.add(WalletDB(user_id=user_id, currency="USD", shard=3, balance=30))
+        await db.commit()
+
+    # Act: Debit more than shard 0 holds, then more than what remains
+    async with session_factory() as db:
+        assert await crud_wallet.debit_balance(db, user_id, "USD", Decimal("120")) is True
+        assert await crud_wallet.debit_balance(db, user_id, "USD", Decimal("10.01")) is False
+        await db.commit()
+        balances = await crud_wallet.get_balances(db, user_id)
+
+    # Assert: Exactly 10 USD left across the shards
+    assert balances["USD"] == Decimal("10.00")
+
+@pytest.mark.asyncio
+async def test_concurrent_transfers_to_hot_account_conserve_total(session_factory):
+    """Test that transfers into and out of a sharded account keep the total balance constant"""
+    await _make_hot(session_factory, "X", 4)
+    ids = await _user_ids(session_factory)
+    limit = asyncio.Semaphore(CONCURRENCY)
+
+    async def move(i):
+        sender, receiver = ("X", "Y") if i % 3 == 0 else ("Y", "X")
+        async with limit, session_factory() as db:
+            if await crud_wallet.transfer_balance(db, ids[sender], ids[receiver], "USD", 9):
+                await db.commit()
+            else:
+                await db.rollback()
+
+    await asyncio.gather(*[move(i) for i in range(300)])
+
+    after = await wallet_balances(session_factory)
+    assert after["X"][1] + after["Y"][1] == 300
+    assert min(after["X"][1], after["Y"][1]) >= 0